@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import shutil
+import pytest
+import sqlalchemy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    A client directory, as the working directory of the test: the client reads
+    config_files/ and the news database in experiments/ from it.
+    """
+    shutil.copytree(os.path.join(ROOT, "config_files"), tmp_path / "config_files")
+    os.makedirs(tmp_path / "experiments")
+    shutil.copyfile(
+        os.path.join(ROOT, "config_files", "config.json"),
+        tmp_path / "experiments" / "current_config.json",
+    )
+    with open(os.path.join(ROOT, "config_files", "config.json")) as f:
+        name = json.load(f)["simulation"]["name"]
+    (tmp_path / "experiments" / f"{name}.db").touch()
+    monkeypatch.chdir(tmp_path)
+
+    # the client opens the news database of the working directory of its first import
+    from y_client.news_feeds.client_modals import base
+
+    # the news database of this directory, read by the worker processes
+    engine = sqlalchemy.create_engine(f"sqlite:///experiments/{name}.db")
+    base.metadata.create_all(engine)
+    engine.dispose()
+    yield str(tmp_path)
+
+
+@pytest.fixture
+def llm(workdir):
+    from y_client.bench import FakeLLMServer
+
+    server = FakeLLMServer(latency="fixed:0.0", seed=1)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def api(workdir):
+    from y_client.bench import MockYServer
+
+    server = MockYServer(seed=1)
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,137 @@
+import os
+import json
+import collections
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def yservers(workdir):
+    """
+    Start fresh MockYServer objects, stopped at the end of the test.
+    """
+    from y_client.bench import MockYServer
+
+    servers = []
+
+    def start():
+        server = MockYServer(seed=1)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def configure(llm, api, checkpoint):
+    """
+    Write the configuration of a small checkpointed simulation.
+
+    :param llm: the FakeLLMServer object
+    :param api: the MockYServer object
+    :param checkpoint: the checkpoint file
+    :return: the configuration file
+    """
+    config = json.load(open(os.path.join(ROOT, "config_files", "config.json")))
+    config["servers"].update(llm=llm.url, llm_v=llm.url, api=api.url)
+    config["simulation"].update(
+        starting_agents=12,
+        days=2,
+        slots=6,
+        percentage_removed_agents_iteration=0,
+        percentage_new_agents_iteration=0,
+        checkpoint=checkpoint,
+        checkpoint_slots=3,
+        seed=7,
+        # a fourth of the agents wake up in each slot
+        hourly_activity={str(hour): 0.25 for hour in range(24)},
+    )
+    filename = f"config-{checkpoint}.json"
+    json.dump(config, open(filename, "w"))
+    return filename
+
+
+def client(config_filename, wakeups, interrupt=None):
+    """
+    Create a simulation client logging the agents' wake-ups.
+
+    :param config_filename: the configuration file
+    :param wakeups: the list of (agent name, tid) wake-ups to append to
+    :param interrupt: the number of wake-ups after which the client is interrupted, None for none
+    :return: the client
+    """
+    import y_client.clients
+    import y_client.recsys
+
+    class Client(y_client.clients.YClientBase):
+        def agent_turn(self, agent, tid, rounds, reply=True):
+            # the wake-ups draw three candidate actions per round, the follow evaluation one
+            if len(rounds) > 0 and len(rounds[0]) == 3:
+                if interrupt is not None and len(wakeups) == interrupt:
+                    raise Interrupted()
+                wakeups.append((agent.name, tid))
+            return super(Client, self).agent_turn(agent, tid, rounds, reply)
+
+    c = Client(
+        config_filename,
+        os.path.join(ROOT, "config_files", "prompts.json"),
+        agents_output="agents.json",
+    )
+    c.set_recsys(y_client.recsys.ReverseChrono(), y_client.recsys.PreferentialAttachment())
+    return c
+
+
+def per_slot(wakeups):
+    """
+    Count the wake-ups of each slot, from the first one.
+
+    :param wakeups: the list of (agent name, tid) wake-ups
+    :return: the list of the counts
+    """
+    counts = collections.Counter(tid for _, tid in wakeups)
+    first = min(counts)
+    return [counts.get(tid, 0) for tid in range(first, max(counts) + 1)]
+
+
+def test_resume_mid_slot(llm, yservers):
+    # the uninterrupted simulation
+    reference = []
+    c = client(configure(llm, yservers(), "reference.bin"), reference)
+    c.create_initial_population()
+    c.run_simulation()
+
+    # the same simulation, interrupted in the middle of a slot after a checkpoint
+    counts = per_slot(reference)
+    slot = next(
+        s for s in range(4, len(counts)) if counts[s] >= 2 and sum(counts[:s]) > 0
+    )
+    interrupt = sum(counts[:slot]) + counts[slot] // 2
+
+    wakeups = []
+    checkpoint = "interrupted.bin"
+    config_filename = configure(llm, yservers(), checkpoint)
+    c = client(config_filename, wakeups, interrupt=interrupt)
+    c.create_initial_population()
+    with pytest.raises(Interrupted):
+        c.run_simulation()
+    c.scheduler.checkpoint.wait()
+    interrupted = list(wakeups)
+    tid = interrupted[-1][1]
+
+    c = client(config_filename, wakeups)
+    c.resume(checkpoint)
+    c.run_simulation()
+    resumed = wakeups[len(interrupted) :]
+
+    # no wake-up is run twice, none of the slots before the interruption is run again
+    assert len(set(wakeups)) == len(wakeups)
+    assert min(t for _, t in resumed) == tid
+    # the interrupted slot is completed: the same wake-ups as without the interruption
+    assert per_slot(wakeups) == counts
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import socket
+import multiprocessing
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def worker(port, log):
+    """
+    Run a QueueWorker, logging the (tid, agent names, start, end) of the units it runs
+    and, once stopped, the number of turns it ran.
+
+    :param port: the port of the queue
+    :param log: the multiprocessing queue of the logs
+    """
+    from y_client.classes.agent_shards import AgentRunner
+    from y_client.classes.work_queue import QueueWorker
+
+    run = AgentRunner.run
+
+    def logged(self, tid, turns):
+        start = time.time()
+        n = run(self, tid, turns)
+        log.put(("unit", tid, [t[0] for t in turns], start, time.time()))
+        return n
+
+    AgentRunner.run = logged
+    w = QueueWorker("127.0.0.1", port, "secret", threads=2, retry=60)
+    w.run()
+    log.put(("completed", w.completed))
+
+
+@pytest.fixture
+def workers(workdir):
+    port = free_port()
+    ctx = multiprocessing.get_context("spawn")
+    log = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(port, log)) for _ in range(3)]
+    for p in processes:
+        p.start()
+    yield port, log, processes
+    for p in processes:
+        if p.is_alive():
+            p.terminate()
+        p.join()
+
+
+def configure(llm, api, port):
+    """
+    Write the configuration of a small simulation run by the queue workers.
+
+    :param llm: the FakeLLMServer object
+    :param api: the MockYServer object
+    :param port: the port of the queue
+    :return: the configuration file
+    """
+    config = json.load(open(os.path.join(ROOT, "config_files", "config.json")))
+    config["servers"].update(llm=llm.url, llm_v=llm.url, api=api.url)
+    config["simulation"].update(
+        starting_agents=12,
+        days=1,
+        slots=4,
+        percentage_removed_agents_iteration=0,
+        percentage_new_agents_iteration=0,
+        coordinator={"authkey": "secret", "address": f"127.0.0.1:{port}"},
+        hourly_activity={str(hour): 0.5 for hour in range(24)},
+    )
+    json.dump(config, open("config.json", "w"))
+    return "config.json"
+
+
+def test_slot_barrier(llm, api, workers):
+    import y_client.clients
+    import y_client.recsys
+
+    port, log, processes = workers
+    # the (tid, agent names, publication, completion) of each set of published turns
+    batches = []
+    completed = []
+
+    class Client(y_client.clients.YClientBase):
+        def run_turns(self, turns, tid, reply=True, done=None):
+            start = time.time()
+            indexes = []
+
+            def counted(i):
+                indexes.append(i)
+                if done is not None:
+                    done(i)
+
+            super(Client, self).run_turns(turns, tid, reply=reply, done=counted)
+            batches.append((tid, [a.name for a, _ in turns], start, time.time()))
+            completed.append(sorted(indexes))
+
+    c = Client(
+        configure(llm, api, port),
+        os.path.join(ROOT, "config_files", "prompts.json"),
+        agents_output="agents.json",
+    )
+    c.set_recsys(y_client.recsys.ReverseChrono(), y_client.recsys.PreferentialAttachment())
+    c.create_initial_population()
+    scheduler = c.start_simulation()
+    scheduler.run_day()
+
+    start = time.time()
+    c.stop_simulation()
+    # the stop acknowledgements of the workers end the wait, not the timeout
+    assert time.time() - start < 10
+
+    units, runs = [], []
+    # the number of turns run is the last log of a worker
+    while len(runs) < len(processes):
+        entry = log.get(timeout=10)
+        if entry[0] == "unit":
+            units.append(entry[1:])
+        else:
+            runs.append(entry[1])
+    for p in processes:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+
+    # every turn of every slot was run once
+    assert len(batches) > 1
+    assert all(
+        indexes == list(range(len(names)))
+        for indexes, (_, names, _, _) in zip(completed, batches)
+    )
+    assert sum(runs) == sum(len(names) for _, names, _, _ in batches)
+
+    # each unit ran while its turns were published: after the previous ones completed
+    for tid, names, start, end in units:
+        assert any(
+            t == tid and set(names) <= set(published) and s <= start and end <= e
+            for t, published, s, e in batches
+        )
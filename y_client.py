@@ -85,6 +85,14 @@ if __name__ == "__main__":
         help="Maximum number of URLs to process from the URLs file (randomly sampled). Applies only to --news_source=urls. Default: 1000."
     )
 
+    parser.add_argument(
+        "--resume",
+        default=None,
+        help="Checkpoint file (simulation.checkpoint) of an interrupted simulation to resume. "
+        "The agents are restored from the checkpoint, not created or loaded, "
+        "and the experiment and news database are neither reset nor reloaded.",
+    )
+
     args = parser.parse_args()
 
     agents_owner = args.owner
@@ -125,7 +133,9 @@ if __name__ == "__main__":
         graph_file=graph_file,
     )
 
-    if args.reset:
+    if args.reset and args.resume is not None:
+        print("Resuming simulation: the experiment is not reset")
+    elif args.reset:
         print("Resetting experiment...")
         experiment.reset_experiment()
 
@@ -134,7 +144,12 @@ if __name__ == "__main__":
 
     # Handle news feeds if requested
     proceed_with_simulation = True
-    if args.news_source == "urls":
+    if args.resume is not None:
+        # the news database of the interrupted simulation is kept
+        if args.news or args.news_source == "urls":
+            print("Resuming simulation: the news are not reloaded")
+
+    elif args.news_source == "urls":
         if not args.urls_file:
             print("Error: --urls_file must be specified when --news_source is 'urls'.")
             sys.exit(1)
@@ -151,13 +166,17 @@ if __name__ == "__main__":
         proceed_with_simulation = experiment.load_rrs_endpoints(rss_feeds)
 
     if proceed_with_simulation:
-        print("\nInitializing agent population...")
-        if args.agents is None:
-            experiment.create_initial_population()
+        if args.resume is not None:
+            print(f"\nResuming simulation from {args.resume}...")
+            experiment.resume(args.resume)
         else:
-            experiment.load_existing_agents(args.agents)
+            print("\nInitializing agent population...")
+            if args.agents is None:
+                experiment.create_initial_population()
+            else:
+                experiment.load_existing_agents(args.agents)
 
-        experiment.save_agents()
+            experiment.save_agents()
         print("\nStarting simulation...")
         experiment.run_simulation()
     else:
@@ -0,0 +1,3 @@
+from .fake_llm import *
+from .mock_yserver import *
+from .simulation import *
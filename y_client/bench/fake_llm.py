@@ -0,0 +1,433 @@
+import re
+import json
+import math
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+__all__ = ["LatencyModel", "FakeResponder", "FakeLLMServer"]
+
+
+GO_EMOTIONS = [
+    "admiration", "amusement", "anger", "annoyance", "approval", "caring",
+    "confusion", "curiosity", "desire", "disappointment", "disapproval",
+    "disgust", "embarrassment", "excitement", "fear", "gratitude", "grief",
+    "joy", "love", "nervousness", "optimism", "pride", "realization", "relief",
+    "remorse", "sadness", "surprise", "trust",
+]
+
+WORDS = [
+    "really", "think", "people", "today", "news", "world", "new", "great",
+    "never", "always", "everyone", "should", "know", "time", "government",
+    "policy", "climate", "economy", "music", "sports", "tech", "future",
+    "honestly", "love", "hate", "crazy", "interesting", "read", "article",
+    "city", "change", "vote", "science", "health", "family", "weekend",
+]
+
+TOPICS = [
+    "climate change", "public health", "local politics", "tech industry",
+    "football league", "music festival", "housing market", "foreign policy",
+    "space exploration", "energy prices", "higher education", "film awards",
+]
+
+
+class LatencyModel(object):
+    def __init__(self, spec="fixed:0"):
+        """
+        Latency distribution of the fake LLM server.
+
+        :param spec: "fixed:s", "uniform:a,b", "normal:mu,sigma", "lognormal:mu,sigma" (of the log of the seconds) or "exp:mean"
+        """
+        kind, _, args = str(spec).partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a != ""]
+
+        arity = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if kind not in arity:
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        if len(self.args) != arity[kind]:
+            raise ValueError(f"Latency distribution {kind} takes {arity[kind]} parameters")
+
+    def sample(self, rng):
+        """
+        Sample a latency.
+
+        :param rng: the random.Random generator
+        :return: the latency in seconds
+        """
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.args[0], self.args[1])
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(self.args[0], self.args[1]))
+        if self.kind == "lognormal":
+            return math.exp(rng.gauss(self.args[0], self.args[1]))
+        return rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0.0
+
+
+class FakeResponder(object):
+    def __init__(self, seed=0):
+        """
+        Prompt-aware canned answers to the requests of the client prompts
+        (config_files/prompts.json): action keywords, YES/NO decisions, votes,
+        decision batches, emotion and topic annotations, JSON outputs, image
+        descriptions and short posts.
+
+        :param seed: the random seed
+        """
+        self.rng = random.Random(seed)
+        self.__lock = threading.Lock()
+
+    # the responder is shared by the server threads
+    def __choice(self, seq):
+        with self.__lock:
+            return self.rng.choice(seq)
+
+    def __sample(self, seq, k):
+        with self.__lock:
+            return self.rng.sample(seq, k)
+
+    def __randint(self, a, b):
+        with self.__lock:
+            return self.rng.randint(a, b)
+
+    def __text(self):
+        """
+        Write a short post.
+
+        :return: the text
+        """
+        words = [self.__choice(WORDS) for _ in range(self.__randint(8, 25))]
+        text = " ".join(words).capitalize() + "."
+        if self.__randint(0, 2) == 0:
+            text += f" #{self.__choice(WORDS)}"
+        return text
+
+    def __emotions(self, labels=None):
+        """
+        Pick a few emotions.
+
+        :param labels: the admissible emotions, None for the GoEmotions ones
+        :return: the list of emotions
+        """
+        labels = labels if labels else GO_EMOTIONS
+        return self.__sample(labels, min(len(labels), self.__randint(1, 3)))
+
+    def __answer(self, prompt):
+        """
+        Answer a single decision request.
+
+        :param prompt: the request
+        :return: the answer, None if the request is not a decision
+        """
+        m = re.search(r"##INPUT START##\s*(.*?)\s*##INPUT END##", prompt, re.S)
+        if m is not None and "comma-separated" in prompt:
+            return self.__choice([a.strip() for a in m.group(1).split(",") if a.strip()])
+        m = re.search(r"Answer with one among:\s*([A-Z, ]+)", prompt)
+        if m is not None:
+            return self.__choice([a.strip() for a in m.group(1).split(",") if a.strip()])
+        if "LEFT" in prompt and "RIGHT" in prompt:
+            return self.__choice(["LEFT", "RIGHT", "NONE"])
+        if "YES" in prompt and "NEUTRAL" in prompt:
+            return self.__choice(["YES", "NO", "NEUTRAL"])
+        if "YES" in prompt and "NO" in prompt:
+            return self.__choice(["YES", "NO"])
+        return None
+
+    def reply(self, messages):
+        """
+        Answer a chat completion request.
+
+        :param messages: the list of {"role", "content"} messages
+        :return: the answer text
+        """
+        system = " ".join(
+            m["content"] for m in messages
+            if m.get("role") == "system" and isinstance(m.get("content"), str)
+        )
+        last = messages[-1].get("content", "") if len(messages) > 0 else ""
+
+        # vision request
+        if isinstance(last, list):
+            return (
+                "The image shows a group of people standing in a city square, "
+                "with buildings in the background and a banner in the foreground."
+            )
+
+        # Handler annotation of an agent text (two-turn exchange)
+        if "GoEmotions" in system:
+            return ", ".join(self.__emotions())
+        if "#T:" in system:
+            return "; ".join(f"#T: {t}" for t in self.__sample(TOPICS, 3))
+
+        # decision batches
+        requests = re.findall(r"##REQUEST (\d+)##\s*(.*?)(?=##REQUEST \d+##|\Z)", last, re.S)
+        if len(requests) > 0:
+            return json.dumps({n: self.__answer(r) or "NO" for n, r in requests})
+
+        # one-shot generation with JSON output
+        if "JSON object" in last or "JSON object" in system:
+            m = re.search(r"chosen among: ([a-z, ]+)", last + " " + system)
+            labels = [l.strip() for l in m.group(1).split(",") if l.strip()] if m else None
+            return json.dumps({"text": self.__text(), "emotions": self.__emotions(labels)})
+
+        answer = self.__answer(last)
+        if answer is not None:
+            return answer
+
+        return self.__text()
+
+
+class FakeLLMServer(object):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency="fixed:0",
+        token_latency=0.0,
+        max_concurrency=None,
+        seed=0,
+    ):
+        """
+        Local fake LLM server speaking the OpenAI-compatible chat completion API
+        (POST /v1/chat/completions, streaming included, and GET /v1/models), for
+        benchmarking the client without a model.
+
+        Each request waits for a slot (at most max_concurrency requests are
+        served at once, like the parallel slots of a model server), then sleeps
+        for a latency sampled from the latency distribution, plus token_latency
+        per generated word (between the chunks when streaming).
+
+        :param host: the listening host
+        :param port: the listening port, 0 for a free one
+        :param latency: the latency distribution of the requests, see LatencyModel
+        :param token_latency: the additional latency in seconds per generated word
+        :param max_concurrency: the maximum number of requests served at once, None for no limit
+        :param seed: the random seed of the latencies and answers
+        """
+        self.latency = LatencyModel(latency)
+        self.token_latency = float(token_latency)
+        self.responder = FakeResponder(seed=seed)
+        self.rng = random.Random(seed)
+        self.slots = (
+            threading.Semaphore(int(max_concurrency))
+            if max_concurrency is not None
+            else None
+        )
+
+        self.__lock = threading.Lock()
+        self.__stats = {"requests": 0, "streamed": 0, "inflight": 0, "max_inflight": 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately: no delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    server._send_json(self, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+                elif self.path.rstrip("/").endswith("/stats"):
+                    server._send_json(self, server.stats())
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                size = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(size))
+                server._complete(self, body)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        """
+        The base url of the server, as in config["servers"]["llm"].
+        """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """
+        Serve in a background thread.
+
+        :return: the base url of the server
+        """
+        self.__thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.__thread.start()
+        return self.url
+
+    def serve_forever(self):
+        """
+        Serve in the current thread.
+        """
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        """
+        Get the request counters.
+
+        :return: {"requests", "streamed", "inflight", "max_inflight"}
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __sample_latency(self):
+        with self.__lock:
+            return self.latency.sample(self.rng)
+
+    def __count(self, delta, streamed=False):
+        with self.__lock:
+            if delta > 0:
+                self.__stats["requests"] += 1
+                self.__stats["streamed"] += int(streamed)
+            self.__stats["inflight"] += delta
+            self.__stats["max_inflight"] = max(
+                self.__stats["max_inflight"], self.__stats["inflight"]
+            )
+
+    @staticmethod
+    def _send_json(handler, data):
+        out = json.dumps(data).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(out)))
+        handler.end_headers()
+        handler.wfile.write(out)
+
+    @staticmethod
+    def _send_chunk(handler, data):
+        line = f"data: {data}\n\n".encode("utf-8")
+        handler.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        handler.wfile.flush()
+
+    def _complete(self, handler, body):
+        """
+        Serve a chat completion request.
+
+        :param handler: the request handler
+        :param body: the decoded request body
+        """
+        stream = bool(body.get("stream", False))
+        model = body.get("model", "fake")
+        text = self.responder.reply(body.get("messages", []))
+        words = re.findall(r"\S+\s*", text)
+
+        max_tokens = body.get("max_tokens")
+        if max_tokens is not None and not text.startswith("{"):
+            words = words[: max(1, int(max_tokens))]
+
+        if self.slots is not None:
+            self.slots.acquire()
+        self.__count(1, streamed=stream)
+        try:
+            time.sleep(self.__sample_latency())
+            if not stream:
+                time.sleep(self.token_latency * len(words))
+                self._send_json(
+                    handler,
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": "".join(words)},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": 0,
+                            "completion_tokens": len(words),
+                            "total_tokens": len(words),
+                        },
+                    },
+                )
+                return
+
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.send_header("Transfer-Encoding", "chunked")
+            handler.end_headers()
+            try:
+                for i, w in enumerate(words + [None]):
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": {"content": w} if w is not None else {},
+                                "finish_reason": None if w is not None else "stop",
+                            }
+                        ],
+                    }
+                    self._send_chunk(handler, json.dumps(chunk))
+                    if w is not None:
+                        time.sleep(self.token_latency)
+                self._send_chunk(handler, "[DONE]")
+                handler.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # the client closed the stream: stop generating
+                handler.close_connection = True
+        finally:
+            self.__count(-1)
+            if self.slots is not None:
+                self.slots.release()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1", help="Listening host")
+    parser.add_argument("--port", type=int, default=11434, help="Listening port")
+    parser.add_argument(
+        "--latency",
+        default="fixed:0",
+        help="Request latency distribution: fixed:s, uniform:a,b, normal:mu,sigma, lognormal:mu,sigma or exp:mean",
+    )
+    parser.add_argument(
+        "--token-latency", type=float, default=0.0, help="Latency in seconds per generated word"
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, default=None, help="Maximum number of requests served at once"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    srv = FakeLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        token_latency=args.token_latency,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    )
+    print(f"Fake LLM server listening on {srv.url}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        srv.stop()
@@ -0,0 +1,739 @@
+import json
+import math
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from requests.adapters import BaseAdapter
+from y_client.bench.fake_llm import LatencyModel
+
+__all__ = ["MockYServer"]
+
+
+USER_FIELDS = [
+    "name", "email", "password", "leaning", "age", "user_type", "oe", "co",
+    "ex", "ag", "ne", "language", "owner", "education_level", "round_actions",
+    "gender", "nationality", "toxicity", "joined_on", "is_page",
+]
+
+ARTICLE_FIELDS = [
+    "title", "summary", "link", "publisher", "rss", "leaning", "country",
+    "language", "category", "fetched_on",
+]
+
+
+class _MockAdapter(BaseAdapter):
+    def __init__(self, server):
+        """
+        requests transport answering from the mock server, without sockets.
+
+        :param server: the MockYServer object
+        """
+        super(_MockAdapter, self).__init__()
+        self.server = server
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        endpoint = urlsplit(request.url).path.rstrip("/").rsplit("/", 1)[-1]
+        status, data = self.server.call(endpoint, request.body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else "Error"
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(data).encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class MockYServer(object):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency="fixed:0",
+        endpoint_latency=None,
+        seed=0,
+    ):
+        """
+        In-memory stand-in for the YServer API, for profiling and load testing the
+        client alone.
+
+        The server implements the endpoints used by the simulation clients, the
+        agents, the simulation clock and the recommender systems (users, interests,
+        posts, news, comments, shares, reactions, follows, churn, the content and
+        follow recommendations) on in-memory state, with a behaviour close to the
+        YServer one. Every request sleeps for a latency sampled from the latency
+        distribution (or from the endpoint one, if given), outside of the state lock.
+
+        The server is reached either over HTTP (start, then use url as
+        config["servers"]["api"]), or in process with mount, which answers the
+        requests of an APIClient without sockets.
+
+        :param host: the listening host
+        :param port: the listening port, 0 for a free one
+        :param latency: the latency distribution of the requests, see LatencyModel
+        :param endpoint_latency: the latency distributions of some endpoints, {endpoint: spec}
+        :param seed: the random seed of the latencies, the churn and the random recommendations
+        """
+        self.latency = LatencyModel(latency)
+        self.endpoint_latency = {
+            e: LatencyModel(s) for e, s in (endpoint_latency or {}).items()
+        }
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.__lock = threading.RLock()
+        self.__counts = {}
+        self.__calls = 0
+        self.reset()
+
+        self.endpoints = {
+            "reset": self.__reset,
+            "current_time": self.__current_time,
+            "update_time": self.__update_time,
+            "register": self.__register,
+            "user_exists": self.__user_exists,
+            "get_user": self.__get_user,
+            "get_user_id": self.__get_user_id,
+            "update_user": self.__update_user,
+            "set_interests": self.__set_interests,
+            "set_user_interests": self.__set_user_interests,
+            "get_user_interests": self.__get_user_interests,
+            "get_sentiment": self.__get_sentiment,
+            "post": self.__post,
+            "news": self.__news,
+            "comment": self.__comment,
+            "share": self.__share,
+            "comment_image": self.__comment_image,
+            "reaction": self.__reaction,
+            "cast_preference": self.__cast_preference,
+            "follow": self.__follow,
+            "followers": self.__followers,
+            "timeline": self.__timeline,
+            "churn": self.__churn,
+            "read": self.__read,
+            "read_mentions": self.__read_mentions,
+            "search": self.__search,
+            "follow_suggestions": self.__follow_suggestions,
+            "post_thread": self.__post_thread,
+            "get_user_from_post": self.__get_user_from_post,
+            "get_article": self.__get_article,
+            "get_post": self.__get_post,
+            "get_post_topics": self.__get_post_topics,
+            "get_post_topics_name": self.__get_post_topics_name,
+            "get_thread_root": self.__get_thread_root,
+        }
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately: no delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def __serve(self):
+                size = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(size) if size > 0 else None
+                endpoint = urlsplit(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+                if endpoint == "_stats":
+                    # not a YServer endpoint: not counted, no latency
+                    status, data = 200, server.stats()
+                else:
+                    status, data = server.call(endpoint, body)
+
+                out = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            # the client sends the request parameters in the body of the GET requests too
+            def do_GET(self):
+                self.__serve()
+
+            def do_POST(self):
+                self.__serve()
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        """
+        The base url of the server, as in config["servers"]["api"].
+        """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """
+        Serve in a background thread.
+
+        :return: the base url of the server
+        """
+        self.__thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.__thread.start()
+        return self.url
+
+    def serve_forever(self):
+        """
+        Serve in the current thread.
+        """
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def mount(self, api):
+        """
+        Answer the requests of an APIClient in process, without sockets.
+
+        :param api: the APIClient object
+        """
+        api.session.mount(api.base_url, _MockAdapter(self))
+
+    def stats(self):
+        """
+        Get the request counters and the size of the state.
+
+        :return: {"http_requests", "requests", "endpoints", "users", "posts", "follows"}
+        """
+        with self.__lock:
+            return {
+                "http_requests": self.__calls,
+                "requests": sum(self.__counts.values()),
+                "endpoints": dict(self.__counts),
+                "users": len(self.users),
+                "posts": len(self.posts),
+                "follows": sum(len(f) for f in self.following.values()),
+            }
+
+    def reset(self):
+        """
+        Clear the state: the clock restarts from day 0, round 0.
+        """
+        with self.__lock:
+            self.rounds = [{"id": 1, "day": 0, "round": 0}]
+            self.users = {}
+            self.user_ids = {}
+            self.topics = {}
+            self.topic_names = {}
+            self.user_interests = []
+            self.posts = {}
+            self.articles = {}
+            self.reactions = {}
+            self.votes = []
+            self.following = {}
+            self.followers = {}
+            self.mentions = {}
+            # the churn draws are not interleaved with the concurrent requests
+            self.churn_rng = random.Random(self.seed)
+
+    def call(self, endpoint, body=None):
+        """
+        Serve a request: sleep for the injected latency, then run the endpoint.
+
+        :param endpoint: the endpoint name
+        :param body: the (JSON encoded) request body, str or bytes
+        :return: the (status code, response data) pair
+        """
+        model = self.endpoint_latency.get(endpoint, self.latency)
+        with self.__lock:
+            self.__calls += 1
+            latency = model.sample(self.rng)
+        time.sleep(latency)
+
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"status": 400}
+        return self.handle(endpoint, data)
+
+    def handle(self, endpoint, data):
+        """
+        Run an endpoint on the state.
+
+        :param endpoint: the endpoint name
+        :param data: the decoded request parameters
+        :return: the (status code, response data) pair
+        """
+        if endpoint not in self.endpoints:
+            return 404, {"status": 404}
+
+        with self.__lock:
+            self.__counts[endpoint] = self.__counts.get(endpoint, 0) + 1
+            try:
+                return self.endpoints[endpoint](data)
+            except (KeyError, TypeError, ValueError) as e:
+                return 400, {"status": 400, "error": str(e)}
+
+    # state helpers: the callers hold the lock
+
+    def __now(self):
+        return self.rounds[-1]["id"]
+
+    def __topic(self, topic):
+        """
+        Resolve a topic given by id or by name, registering the new names.
+
+        :param topic: the topic id or name
+        :return: the topic id, None for an unknown id
+        """
+        if isinstance(topic, int):
+            return topic if topic in self.topic_names else None
+        name = str(topic).strip()
+        if name not in self.topics:
+            tid = len(self.topics) + 1
+            self.topics[name] = tid
+            self.topic_names[tid] = name
+        return self.topics[name]
+
+    def __add_post(self, data, text, comment_to=None, shared_from=None, article_id=None, topics=None):
+        """
+        Add a post (post, news, comment or share).
+
+        :return: the new post
+        """
+        uid = int(data["user_id"])
+        pid = len(self.posts) + 1
+        parent = self.posts.get(comment_to) if comment_to is not None else None
+        post = {
+            "id": pid,
+            "user_id": uid,
+            "text": text,
+            "round": int(data.get("tid", self.__now())),
+            "comment_to": comment_to,
+            "thread_id": parent["thread_id"] if parent is not None else pid,
+            "shared_from": shared_from,
+            "article_id": article_id,
+            "topics": [t for t in (self.__topic(t) for t in (topics or [])) if t is not None],
+            "emotions": data.get("emotions", []),
+            "hashtags": data.get("hashtags", []),
+            "image_url": data.get("image_url"),
+            "likes": 0,
+            "dislikes": 0,
+            "comments": 0,
+        }
+        self.posts[pid] = post
+
+        if parent is not None:
+            self.posts[parent["thread_id"]]["comments"] += 1
+
+        for name in data.get("mentions", []) or []:
+            target = self.user_ids.get(str(name).lstrip("@"))
+            if target is not None and target != uid:
+                self.mentions.setdefault(target, []).append(pid)
+        return post
+
+    def __visible(self, params):
+        """
+        Get the posts within the visibility window of a read request.
+
+        :param params: the request parameters
+        :return: the list of posts
+        """
+        since = self.__now() - int(params.get("visibility_rounds", 36))
+        uid = params.get("uid")
+        articles = bool(params.get("articles", False))
+        return [
+            p
+            for p in self.posts.values()
+            if p["round"] >= since
+            and p["user_id"] != uid
+            and (not articles or p["article_id"] is not None)
+        ]
+
+    def __neighbours(self, uid):
+        return self.following.get(uid, set()) | self.followers.get(uid, set())
+
+    # endpoints
+
+    def __reset(self, data):
+        self.reset()
+        return 200, {"status": 200}
+
+    def __current_time(self, data):
+        return 200, dict(self.rounds[-1])
+
+    def __update_time(self, data):
+        day, slot = int(data["day"]), int(data["round"])
+        last = self.rounds[-1]
+        if (day, slot) > (last["day"], last["round"]):
+            self.rounds.append({"id": last["id"] + 1, "day": day, "round": slot})
+        return 200, dict(self.rounds[-1])
+
+    def __register(self, data):
+        if data["name"] in self.user_ids:
+            return 200, {"status": 200}
+        uid = len(self.users) + 1
+        user = {k: data.get(k) for k in USER_FIELDS}
+        user.update({"id": uid, "rec_sys": "default", "frec_sys": "default", "left_on": None})
+        self.users[uid] = user
+        self.user_ids[data["name"]] = uid
+        return 200, {"status": 200}
+
+    def __user_exists(self, data):
+        uid = self.user_ids.get(data["name"])
+        if uid is None or self.users[uid]["email"] != data.get("email"):
+            return 200, {"status": 404}
+        return 200, {"status": 200, "id": uid}
+
+    def __get_user(self, data):
+        uid = self.user_ids.get(data["username"])
+        if uid is None:
+            return 404, {"status": 404}
+        return 200, dict(self.users[uid])
+
+    def __get_user_id(self, data):
+        uid = self.user_ids.get(data["username"])
+        if uid is None:
+            return 404, {"status": 404}
+        return 200, {"id": uid}
+
+    def __update_user(self, data):
+        uid = self.user_ids.get(data["username"])
+        if uid is None:
+            return 404, {"status": 404}
+        if "recsys_type" in data:
+            self.users[uid]["rec_sys"] = data["recsys_type"]
+        if "frecsys_type" in data:
+            self.users[uid]["frec_sys"] = data["frecsys_type"]
+        return 200, {"status": 200}
+
+    def __set_interests(self, data):
+        for name in data:
+            self.__topic(name)
+        return 200, {"status": 200}
+
+    def __set_user_interests(self, data):
+        uid, rid = int(data["user_id"]), int(data.get("round", self.__now()))
+        for topic in data.get("interests", []) or []:
+            tid = self.__topic(topic)
+            if tid is not None:
+                self.user_interests.append((uid, tid, rid))
+        return 200, {"status": 200}
+
+    def __get_user_interests(self, data):
+        uid = int(data["user_id"])
+        since = int(data["round_id"]) - int(data.get("time_window", 5))
+        counts = {}
+        for u, tid, rid in self.user_interests:
+            if u == uid and rid >= since:
+                counts[tid] = counts.get(tid, 0) + 1
+        if len(counts) == 0:
+            # no recent activity: fall back on all the interests of the user
+            for u, tid, _ in self.user_interests:
+                if u == uid:
+                    counts[tid] = counts.get(tid, 0) + 1
+
+        top = sorted(counts, key=lambda t: -counts[t])[: int(data.get("n_interests", 3))]
+        return 200, [{"id": t, "topic": self.topic_names[t]} for t in top]
+
+    def __get_sentiment(self, data):
+        # the opinion on a topic follows the reactions to the posts about it
+        uid = int(data["user_id"])
+        topics = {self.__topic(t) for t in data.get("interests", []) or []}
+        score = {}
+        for (u, pid), kind in self.reactions.items():
+            if u != uid:
+                continue
+            for t in self.posts[pid]["topics"]:
+                if t in topics:
+                    score[t] = score.get(t, 0) + (1 if kind == "like" else -1)
+
+        sentiment = []
+        for t, s in score.items():
+            label = "positive" if s > 0 else "negative" if s < 0 else "neutral"
+            sentiment.append({"topic": self.topic_names[t], "sentiment": label})
+        return 200, sentiment
+
+    def __post(self, data):
+        self.__add_post(data, data["tweet"], topics=data.get("topics"))
+        return 200, {"status": 200}
+
+    def __news(self, data):
+        aid = len(self.articles) + 1
+        self.articles[aid] = dict({k: data.get(k) for k in ARTICLE_FIELDS}, id=aid)
+        self.__add_post(data, data["tweet"], article_id=aid, topics=data.get("topics"))
+        return 200, {"article_id": aid}
+
+    def __comment(self, data):
+        parent = self.posts.get(int(data["post_id"]))
+        if parent is None:
+            return 404, {"status": 404}
+        # the comments share the topics of their thread
+        topics = self.posts[parent["thread_id"]]["topics"]
+        self.__add_post(data, data["text"], comment_to=parent["id"], topics=topics)
+
+        # the mention is answered
+        pending = self.mentions.get(int(data["user_id"]), [])
+        if parent["id"] in pending:
+            pending.remove(parent["id"])
+        return 200, {"status": 200}
+
+    def __share(self, data):
+        original = self.posts.get(int(data["post_id"]))
+        if original is None:
+            return 404, {"status": 404}
+        self.__add_post(
+            data,
+            data["text"],
+            shared_from=original["id"],
+            article_id=original["article_id"],
+            topics=original["topics"],
+        )
+        return 200, {"status": 200}
+
+    def __comment_image(self, data):
+        article = self.articles.get(data.get("article_id"))
+        topics = []
+        if article is not None:
+            topics = next(
+                (p["topics"] for p in self.posts.values() if p["article_id"] == article["id"]),
+                [],
+            )
+        self.__add_post(data, data["text"], topics=topics)
+        return 200, {"status": 200}
+
+    def __reaction(self, data):
+        uid, pid = int(data["user_id"]), int(data["post_id"])
+        post = self.posts.get(pid)
+        if post is None:
+            return 404, {"status": 404}
+
+        previous = self.reactions.get((uid, pid))
+        if previous is not None:
+            post[f"{previous}s"] -= 1
+        kind = "like" if data["type"] == "like" else "dislike"
+        self.reactions[(uid, pid)] = kind
+        post[f"{kind}s"] += 1
+        return 200, {"status": 200}
+
+    def __cast_preference(self, data):
+        self.votes.append(dict(data))
+        return 200, {"status": 200}
+
+    def __follow(self, data):
+        uid, target = int(data["user_id"]), int(data["target"])
+        if data.get("action", "follow") == "follow":
+            if uid != target:
+                self.following.setdefault(uid, set()).add(target)
+                self.followers.setdefault(target, set()).add(uid)
+        else:
+            self.following.get(uid, set()).discard(target)
+            self.followers.get(target, set()).discard(uid)
+        return 200, {"status": 200}
+
+    def __followers(self, data):
+        return 200, sorted(self.followers.get(int(data["user_id"]), set()))
+
+    def __timeline(self, data):
+        uid = int(data["user_id"])
+        posts = [p for p in self.posts.values() if p["user_id"] == uid]
+        return 200, [
+            {"id": p["id"], "text": p["text"], "round": p["round"]}
+            for p in sorted(posts, key=lambda p: -p["id"])
+        ]
+
+    def __churn(self, data):
+        if "user_id" in data:
+            # an agent leaving the platform
+            user = self.users.get(int(data["user_id"]))
+            if user is not None:
+                user["left_on"] = data["left_on"]
+            return 200, {"status": 200}
+
+        active = sorted(
+            uid
+            for uid, u in self.users.items()
+            if u["left_on"] is None and not u["is_page"]
+        )
+        removed = self.churn_rng.sample(
+            active, min(int(data["n_users"]), len(active))
+        )
+        for uid in removed:
+            self.users[uid]["left_on"] = data["left_on"]
+        return 200, {"removed": removed}
+
+    def __read(self, data):
+        posts = self.__visible(data)
+        limit = int(data.get("limit", 10))
+        mode = data.get("mode", "default")
+
+        if mode == "default":
+            ids = [p["id"] for p in posts]
+            return 200, self.rng.sample(ids, min(limit, len(ids)))
+
+        followed = self.following.get(data.get("uid"), set())
+
+        def key(p):
+            k = (-p["round"], -p["id"])
+            if "popularity" in mode:
+                k = (-(p["likes"] + p["comments"] - p["dislikes"]),) + k
+            if "followers" in mode:
+                k = (p["user_id"] not in followed,) + k
+            return k
+
+        return 200, [p["id"] for p in sorted(posts, key=key)[:limit]]
+
+    def __read_mentions(self, data):
+        since = self.__now() - int(data.get("visibility_rounds", 36))
+        pending = [
+            pid
+            for pid in self.mentions.get(data.get("uid"), [])
+            if self.posts[pid]["round"] >= since
+        ]
+        if len(pending) == 0:
+            return 200, {"status": 404}
+        return 200, pending[::-1][: int(data.get("limit", 10))]
+
+    def __search(self, data):
+        uid = data.get("uid")
+        interests = {t for u, t, _ in self.user_interests if u == uid}
+        posts = [p for p in self.__visible(data) if interests & set(p["topics"])]
+        if len(posts) == 0:
+            return 200, {"status": 404}
+        posts = sorted(posts, key=lambda p: -p["id"])[: int(data.get("limit", 10))]
+        return 200, [p["id"] for p in posts]
+
+    def __follow_suggestions(self, data):
+        uid = int(data["user_id"])
+        n = int(data.get("n_neighbors", 10))
+        mode = data.get("mode", "random")
+        bias = float(data.get("leaning_biased", 1) or 1)
+
+        followed = self.following.get(uid, set())
+        candidates = [
+            v
+            for v, u in self.users.items()
+            if v != uid and v not in followed and u["left_on"] is None
+        ]
+        mine = self.__neighbours(uid)
+
+        scores = {}
+        for v in candidates:
+            if mode == "preferential_attachment":
+                s = len(self.followers.get(v, set())) + 1
+            elif mode in ("common_neighbors", "jaccard", "adamic_adar"):
+                theirs = self.__neighbours(v)
+                common = mine & theirs
+                if mode == "common_neighbors":
+                    s = len(common)
+                elif mode == "jaccard":
+                    union = mine | theirs
+                    s = len(common) / len(union) if len(union) > 0 else 0
+                else:
+                    s = sum(
+                        1 / math.log(len(self.__neighbours(w)))
+                        for w in common
+                        if len(self.__neighbours(w)) > 1
+                    )
+            else:
+                s = 1
+            if s > 0:
+                if self.users[v]["leaning"] == self.users.get(uid, {}).get("leaning"):
+                    s *= bias
+                scores[v] = s
+
+        if len(scores) == 0:
+            # no structural candidate yet: suggest random users
+            scores = {v: 1 for v in self.rng.sample(candidates, min(n, len(candidates)))}
+
+        top = sorted(scores, key=lambda v: -scores[v])[:n]
+        return 200, {str(v): scores[v] for v in top}
+
+    def __post_thread(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        if post is None:
+            return 404, {"status": 404}
+        thread = []
+        while post is not None:
+            thread.append(f"@{self.users[post['user_id']]['name']} - {post['text']}\n")
+            post = self.posts.get(post["comment_to"]) if post["comment_to"] else None
+        return 200, thread[::-1]
+
+    def __get_user_from_post(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        if post is None:
+            return 404, {"status": 404}
+        return 200, post["user_id"]
+
+    def __get_article(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        if post is None or post["article_id"] is None:
+            return 200, {"status": 404}
+        return 200, dict(self.articles[post["article_id"]])
+
+    def __get_post(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        if post is None:
+            return 404, {"status": 404}
+        return 200, post["text"]
+
+    def __get_post_topics(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        return 200, list(post["topics"]) if post is not None else []
+
+    def __get_post_topics_name(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        topics = post["topics"] if post is not None else []
+        return 200, [self.topic_names[t] for t in topics]
+
+    def __get_thread_root(self, data):
+        post = self.posts.get(int(data["post_id"]))
+        if post is None:
+            return 404, {"status": 404}
+        return 200, post["thread_id"]
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="In-memory mock YServer")
+    parser.add_argument("--host", default="127.0.0.1", help="Listening host")
+    parser.add_argument("--port", type=int, default=5010, help="Listening port")
+    parser.add_argument(
+        "--latency",
+        default="fixed:0",
+        help="Request latency distribution: fixed:s, uniform:a,b, normal:mu,sigma, lognormal:mu,sigma or exp:mean",
+    )
+    parser.add_argument(
+        "--endpoint-latency",
+        action="append",
+        default=[],
+        metavar="ENDPOINT=SPEC",
+        help="Latency distribution of an endpoint, e.g. read=uniform:0.01,0.05 (repeatable)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    srv = MockYServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        endpoint_latency=dict(e.split("=", 1) for e in args.endpoint_latency),
+        seed=args.seed,
+    )
+    print(f"Mock YServer listening on {srv.url}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        srv.stop()
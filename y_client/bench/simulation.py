@@ -0,0 +1,456 @@
+import os
+import sys
+import copy
+import json
+import time
+import random
+import hashlib
+import shutil
+import tempfile
+import itertools
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import faker
+import numpy as np
+import requests
+from y_client.bench.fake_llm import FakeLLMServer
+from y_client.bench.mock_yserver import MockYServer
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+__all__ = ["SimulationBenchmark"]
+
+
+def _timed(method, latencies):
+    """
+    Wrap an agent method, recording the duration of each call.
+
+    :param method: the bound method
+    :param latencies: the list receiving the durations in seconds
+    :return: the wrapped method
+    """
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    timed.benchmarked = True
+    return timed
+
+
+def _stats(url):
+    """
+    Get the request counters of a benchmark server.
+
+    :param url: the url of the counters
+    :return: the counters
+    """
+    return requests.get(url, timeout=10).json()
+
+
+def _run_simulation(config, prompts_file, crecsys, frecsys):
+    """
+    Run a simulation and measure its actions (in a dedicated process).
+
+    :param config: the configuration dictionary
+    :param prompts_file: the LLM prompts file
+    :param crecsys: the name of the content recsys
+    :param frecsys: the name of the follow recsys
+    :return: the measures of the run
+    """
+    workdir = tempfile.mkdtemp(prefix="ybench-")
+    config_file = os.path.join(workdir, "config.json")
+    json.dump(config, open(config_file, "w"))
+
+    import y_client.recsys
+    import y_client.clients
+
+    client_cls = getattr(y_client.clients, config["simulation"]["client"])
+    seed = config["simulation"]["seed"]
+    latencies = []
+    # the (slot, agent, candidate actions) of the agents' turns
+    workload = []
+    barriers = itertools.count()
+
+    class Benchmark(client_cls):
+        def agent_turn(self, agent, tid, rounds, reply=True):
+            if not getattr(agent.select_action, "benchmarked", False):
+                agent.select_action = _timed(agent.select_action, latencies)
+            workload.append((tid, agent.name, [len(r) for r in rounds]))
+            return super(Benchmark, self).agent_turn(agent, tid, rounds, reply=reply)
+
+        def run_turns(self, turns, tid, reply=True, done=None):
+            super(Benchmark, self).run_turns(turns, tid, reply=reply, done=done)
+            # the concurrent turns interleave their random draws: the generators
+            # are reseeded at the barrier, so that the rest of the run does not
+            # depend on the concurrency
+            n = next(barriers)
+            random.seed(f"{seed}-{tid}-{n}")
+            np.random.seed([seed, tid, n])
+
+    # the population and the plans are drawn from the seed of the simulation
+    random.seed(seed)
+    np.random.seed(seed)
+    faker.Faker.seed(seed)
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+            devnull
+        ), contextlib.redirect_stderr(devnull):
+            experiment = Benchmark(
+                config_file,
+                prompts_file,
+                agents_output=os.path.join(workdir, "agents.json"),
+            )
+            experiment.set_recsys(
+                getattr(y_client.recsys, crecsys)(),
+                getattr(y_client.recsys, frecsys)(leaning_bias=1.5),
+            )
+
+            start = time.perf_counter()
+            experiment.create_initial_population()
+            setup = time.perf_counter() - start
+
+            # the requests of the population setup are not counted
+            http = _stats(config["servers"]["api"] + "_stats")["http_requests"]
+            llm = _stats(config["servers"]["llm"] + "/stats")["requests"]
+
+            start = time.perf_counter()
+            experiment.run_simulation()
+            seconds = time.perf_counter() - start
+
+            http = _stats(config["servers"]["api"] + "_stats")["http_requests"] - http
+            llm = _stats(config["servers"]["llm"] + "/stats")["requests"] - llm
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    actions = len(latencies)
+    digest = hashlib.sha1(json.dumps(sorted(workload)).encode("utf-8")).hexdigest()
+    lat = np.array(latencies) if actions > 0 else np.zeros(1)
+    return {
+        "agents": len(experiment.agents.agents),
+        "actions": actions,
+        "turns": len(workload),
+        "workload": digest,
+        "setup_seconds": setup,
+        "seconds": seconds,
+        "actions_per_second": actions / seconds if seconds > 0 else None,
+        "http_requests": http,
+        "http_per_action": http / max(1, actions),
+        "llm_requests": llm,
+        "llm_per_action": llm / max(1, actions),
+        "latency": {
+            "mean": float(lat.mean()),
+            "p50": float(np.percentile(lat, 50)),
+            "p95": float(np.percentile(lat, 95)),
+            "p99": float(np.percentile(lat, 99)),
+        },
+        # Linux reports the peak resident set size in KB
+        "peak_rss_mb": (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            if resource is not None
+            else None
+        ),
+    }
+
+
+class SimulationBenchmark(object):
+    def __init__(
+        self,
+        config_file,
+        prompts_file,
+        llm_latency="fixed:0",
+        token_latency=0.0,
+        llm_max_concurrency=None,
+        api_latency="fixed:0",
+        seed=0,
+    ):
+        """
+        End-to-end throughput benchmark of the simulation loop.
+
+        Each point of the parameter grid runs a short simulation (the client of the
+        configuration, run_simulation included) in a fresh process, against a local
+        FakeLLMServer and MockYServer started by the benchmark, and measures the
+        agents' actions (Agent.select_action calls): actions per second, latency
+        percentiles, YServer HTTP requests and LLM requests per action (those of
+        run_simulation, not of the population setup), and the peak RSS of the
+        client process.
+
+        Every run is seeded with the benchmark seed (simulation.seed, and the random
+        generators of the client process, reseeded at each slot barrier), so that
+        the points of the grid differing only by their concurrency run the same
+        workload: the same turns of the same agents. Run raises a RuntimeError
+        otherwise.
+
+        :param config_file: the simulation configuration used as template
+        :param prompts_file: the LLM prompts file
+        :param llm_latency: the latency distribution of the LLM requests, see LatencyModel
+        :param token_latency: the additional LLM latency in seconds per generated word
+        :param llm_max_concurrency: the maximum number of LLM requests served at once, None for no limit
+        :param api_latency: the latency distribution of the YServer requests, see LatencyModel
+        :param seed: the random seed of the servers and of the simulations
+        """
+        self.config = json.load(open(config_file, "r"))
+        self.prompts_file = os.path.abspath(prompts_file)
+        self.settings = {
+            "config": config_file,
+            "llm_latency": llm_latency,
+            "token_latency": token_latency,
+            "llm_max_concurrency": llm_max_concurrency,
+            "api_latency": api_latency,
+            "seed": seed,
+        }
+
+        self.llm = FakeLLMServer(
+            latency=llm_latency,
+            token_latency=token_latency,
+            max_concurrency=llm_max_concurrency,
+            seed=seed,
+        )
+        self.api = MockYServer(latency=api_latency, seed=seed)
+
+    @staticmethod
+    def grid(
+        agents=(10,),
+        slots=(2,),
+        days=(1,),
+        concurrency=(1,),
+        crecsys=("ReverseChronoFollowersPopularity",),
+        frecsys=("PreferentialAttachment",),
+        actions=(None,),
+        activity=(None,),
+    ):
+        """
+        Build the points of a parameter grid.
+
+        :param agents: the numbers of starting agents
+        :param slots: the numbers of slots per day
+        :param days: the numbers of days
+        :param concurrency: the numbers of agent turns run concurrently
+        :param crecsys: the names of the content recsys
+        :param frecsys: the names of the follow recsys
+        :param actions: the action mixes ({action: likelihood}), None for the one of the configuration
+        :param activity: the fractions of agents active in each slot, None for the hourly activity of the configuration
+        :return: the list of points
+        """
+        keys = ["agents", "slots", "days", "concurrency", "crecsys", "frecsys", "actions", "activity"]
+        values = [agents, slots, days, concurrency, crecsys, frecsys, actions, activity]
+        return [dict(zip(keys, p)) for p in itertools.product(*values)]
+
+    def configure(self, point):
+        """
+        Build the simulation configuration of a point.
+
+        :param point: the grid point
+        :return: the configuration dictionary
+        """
+        config = copy.deepcopy(self.config)
+        servers = config["servers"]
+        servers["llm"] = self.llm.url
+        servers["llm_v"] = self.llm.url
+        servers["api"] = self.api.url
+        # responses are always asked to the (fake) LLM
+        servers.pop("llm_cache", None)
+
+        simulation = config["simulation"]
+        simulation["starting_agents"] = int(point["agents"])
+        simulation["slots"] = int(point["slots"])
+        simulation["days"] = int(point["days"])
+        simulation["concurrency"] = int(point["concurrency"])
+        # the actions are timed in the client process
+        simulation.pop("processes", None)
+        simulation["seed"] = int(self.settings["seed"])
+        if point.get("actions") is not None:
+            simulation["actions_likelihood"] = dict(point["actions"])
+        if point.get("activity") is not None:
+            simulation["hourly_activity"] = {
+                str(h): float(point["activity"]) for h in range(24)
+            }
+        return config
+
+    def run_point(self, point):
+        """
+        Run the simulation of a grid point in a fresh process.
+
+        :param point: the grid point
+        :return: the measures of the run
+        """
+        self.api.reset()
+
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            res = executor.submit(
+                _run_simulation,
+                self.configure(point),
+                self.prompts_file,
+                point["crecsys"],
+                point["frecsys"],
+            ).result()
+
+        res["point"] = point
+        return res
+
+    def run(self, points, output=None):
+        """
+        Run the points of a grid, one after the other.
+
+        :param points: the list of grid points
+        :param output: the JSON file of the report, None to skip it
+        :return: the report
+        """
+        self.llm.start()
+        self.api.start()
+        try:
+            results = []
+            for point in points:
+                res = self.run_point(point)
+                results.append(res)
+                print(self.summary(res))
+                sys.stdout.flush()
+        finally:
+            self.llm.stop()
+            self.api.stop()
+
+        report = {
+            "version": 1,
+            "created": time.time(),
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+            "settings": self.settings,
+            "results": results,
+        }
+        if output is not None:
+            with open(output, "w") as f:
+                json.dump(report, f, indent=4)
+        self.check_workloads(results)
+        return report
+
+    @staticmethod
+    def check_workloads(results):
+        """
+        Check that the runs differing only by their concurrency ran the same turns.
+
+        :param results: the measures of the runs
+        """
+        workloads = {}
+        for res in results:
+            point = dict(res["point"], concurrency=None)
+            key = json.dumps(point, sort_keys=True)
+            expected = workloads.setdefault(key, res)
+            if expected["workload"] != res["workload"]:
+                raise RuntimeError(
+                    f"concurrency {expected['point']['concurrency']} and "
+                    f"{res['point']['concurrency']} ran different workloads "
+                    f"({expected['turns']} and {res['turns']} turns, "
+                    f"{expected['actions']} and {res['actions']} actions)"
+                )
+
+    @staticmethod
+    def summary(res):
+        """
+        Format the measures of a run on one line.
+
+        :param res: the measures of the run
+        :return: the summary
+        """
+        p = res["point"]
+        lat = res["latency"]
+        rss = f"{res['peak_rss_mb']:.0f}MB" if res["peak_rss_mb"] is not None else "n/a"
+        return (
+            f"agents={p['agents']} slots={p['slots']} days={p['days']} "
+            f"concurrency={p['concurrency']} crecsys={p['crecsys']} frecsys={p['frecsys']} "
+            f"actions={json.dumps(p['actions']) if p['actions'] is not None else 'config'} | "
+            f"{res['actions']} actions in {res['seconds']:.2f}s "
+            f"({res['actions_per_second'] or 0:.2f}/s) "
+            f"p50={lat['p50'] * 1000:.0f}ms p95={lat['p95'] * 1000:.0f}ms p99={lat['p99'] * 1000:.0f}ms "
+            f"http/action={res['http_per_action']:.1f} llm/action={res['llm_per_action']:.1f} "
+            f"rss={rss}"
+        )
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",")]
+
+
+def _actions(value):
+    """
+    Parse an action mix, e.g. "post=0.2,read=0.5,comment=0.3".
+    """
+    mix = {}
+    for item in value.split(","):
+        action, _, likelihood = item.partition("=")
+        mix[action.strip().lower()] = float(likelihood)
+    return mix
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Throughput benchmark of the simulation loop")
+    parser.add_argument(
+        "-c", "--config_file", default="config_files/config.json", help="Simulation configuration used as template"
+    )
+    parser.add_argument(
+        "-p", "--prompts", default="config_files/prompts.json", help="JSON file containing LLM prompts"
+    )
+    parser.add_argument("--agents", type=_ints, default=[10], help="Starting agents, e.g. 10,100")
+    parser.add_argument("--slots", type=_ints, default=[2], help="Slots per day, e.g. 2,4")
+    parser.add_argument("--days", type=_ints, default=[1], help="Days, e.g. 1,2")
+    parser.add_argument("--concurrency", type=_ints, default=[1], help="Concurrent agent turns, e.g. 1,8,32")
+    parser.add_argument(
+        "--crecsys", default="ReverseChronoFollowersPopularity", help="Content recsys, comma separated"
+    )
+    parser.add_argument(
+        "--frecsys", default="PreferentialAttachment", help="Follow recsys, comma separated"
+    )
+    parser.add_argument(
+        "--actions",
+        type=_actions,
+        action="append",
+        default=None,
+        help="Action mix, e.g. post=0.2,read=0.5,comment=0.3 (repeatable, default: the one of the configuration)",
+    )
+    parser.add_argument(
+        "--activity",
+        type=float,
+        action="append",
+        default=None,
+        help="Fraction of the agents active in each slot (repeatable, default: the hourly activity of the configuration)",
+    )
+    parser.add_argument("--llm-latency", default="fixed:0", help="LLM request latency distribution")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="LLM latency per generated word")
+    parser.add_argument(
+        "--llm-max-concurrency", type=int, default=None, help="LLM requests served at once"
+    )
+    parser.add_argument("--api-latency", default="fixed:0", help="YServer request latency distribution")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the servers and of the simulations")
+    parser.add_argument("-o", "--output", default=None, help="JSON report file")
+    args = parser.parse_args()
+
+    bench = SimulationBenchmark(
+        args.config_file,
+        args.prompts,
+        llm_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        llm_max_concurrency=args.llm_max_concurrency,
+        api_latency=args.api_latency,
+        seed=args.seed,
+    )
+    points = bench.grid(
+        agents=args.agents,
+        slots=args.slots,
+        days=args.days,
+        concurrency=args.concurrency,
+        crecsys=args.crecsys.split(","),
+        frecsys=args.frecsys.split(","),
+        actions=args.actions or [None],
+        activity=args.activity or [None],
+    )
+    bench.run(points, output=args.output)
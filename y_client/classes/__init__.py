@@ -1,3 +1,11 @@
+from .api_client import *
+from .llm_scheduler import *
+from .llm_router import *
+from .llm_backend import *
+from .prompt_templates import *
+from .action_policy import *
+from .decisions import *
+from .emotion_annotator import *
 from .base_agent import *
 from .page_agent import *
 from .time import *
@@ -0,0 +1,159 @@
+import numpy as np
+from abc import ABC, abstractmethod
+
+__all__ = [
+    "ActionPolicy",
+    "LLMActionPolicy",
+    "PersonaActionPolicy",
+    "HybridActionPolicy",
+    "get_action_policy",
+]
+
+
+# multiplicative weights of the candidate actions, per persona trait value
+DEFAULT_TRAIT_WEIGHTS = {
+    "oe": {
+        "inventive/curious": {"SEARCH": 1.5, "READ": 1.2, "FOLLOW": 1.2, "IMAGE": 1.3},
+        "consistent/cautious": {"READ": 1.2, "NONE": 1.3},
+    },
+    "co": {
+        "efficient/organized": {"POST": 1.2, "NONE": 0.8},
+        "extravagant/careless": {"SHARE": 1.3, "SHARE_LINK": 1.2, "IMAGE": 1.2},
+    },
+    "ex": {
+        "outgoing/energetic": {
+            "POST": 1.5,
+            "COMMENT": 1.5,
+            "SHARE": 1.3,
+            "SHARE_LINK": 1.3,
+            "FOLLOW": 1.3,
+            "NONE": 0.5,
+        },
+        "solitary/reserved": {"READ": 1.5, "POST": 0.7, "COMMENT": 0.7, "NONE": 1.5},
+    },
+    "ag": {
+        "friendly/compassionate": {"COMMENT": 1.2, "FOLLOW": 1.3, "READ": 1.1},
+        "critical/judgmental": {"COMMENT": 1.4, "SHARE": 1.1, "FOLLOW": 0.8},
+    },
+    "ne": {
+        "sensitive/nervous": {"READ": 1.3, "POST": 0.8, "NONE": 1.2},
+        "resilient/confident": {"POST": 1.2, "COMMENT": 1.1},
+    },
+    "toxicity": {
+        "low": {"COMMENT": 1.2},
+        "average": {"COMMENT": 1.4, "SHARE": 1.1},
+        "high": {"COMMENT": 1.8, "SHARE": 1.2},
+    },
+    "leaning": {
+        "Democrat": {"CAST": 1.5},
+        "Republican": {"CAST": 1.5},
+    },
+}
+
+
+class ActionPolicy(ABC):
+    @abstractmethod
+    def select(self, agent, actions):
+        """
+        Select the action to perform among the candidate ones.
+
+        :param agent: the agent
+        :param actions: the candidate actions (e.g., ["POST", "COMMENT", "NONE"])
+        :return: the selected action, None to let the agent ask its LLM
+        """
+
+
+class LLMActionPolicy(ActionPolicy):
+    def select(self, agent, actions):
+        """
+        Let the agent LLM select the action.
+
+        :param agent: the agent
+        :param actions: the candidate actions
+        :return: None
+        """
+        return None
+
+
+class PersonaActionPolicy(ActionPolicy):
+    def __init__(self, trait_weights=None):
+        """
+        Sample the action with probabilities conditioned on the agent persona
+        (big five traits, toxicity and political leaning).
+
+        :param trait_weights: the action weights per trait value, {trait: {value: {action: weight}}}
+        """
+        self.trait_weights = (
+            trait_weights if trait_weights is not None else DEFAULT_TRAIT_WEIGHTS
+        )
+
+    def weights(self, agent, actions):
+        """
+        Compute the selection probabilities of the candidate actions.
+
+        :param agent: the agent
+        :param actions: the candidate actions
+        :return: the numpy array of probabilities
+        """
+        w = np.ones(len(actions))
+        for trait, values in self.trait_weights.items():
+            modifiers = values.get(getattr(agent, trait, None), {})
+            w *= np.array([modifiers.get(a, 1.0) for a in actions])
+        return w / w.sum()
+
+    def select(self, agent, actions):
+        """
+        Sample the action according to the agent persona.
+
+        :param agent: the agent
+        :param actions: the candidate actions
+        :return: the selected action
+        """
+        return actions[np.random.choice(len(actions), p=self.weights(agent, actions))]
+
+
+class HybridActionPolicy(PersonaActionPolicy):
+    def __init__(self, llm_fraction=0.1, trait_weights=None):
+        """
+        Ask the LLM for a fraction of the decisions, sample the others from the persona.
+
+        :param llm_fraction: the fraction of decisions delegated to the LLM
+        :param trait_weights: the action weights per trait value
+        """
+        super().__init__(trait_weights=trait_weights)
+        self.llm_fraction = llm_fraction
+
+    def select(self, agent, actions):
+        """
+        Select the action with the LLM or the persona policy.
+
+        :param agent: the agent
+        :param actions: the candidate actions
+        :return: the selected action, None to let the agent ask its LLM
+        """
+        if np.random.random() < self.llm_fraction:
+            return None
+        return super().select(agent, actions)
+
+
+def get_action_policy(config):
+    """
+    Build the action selection policy of the configuration.
+
+    :param config: the configuration dictionary
+    :return: the ActionPolicy object
+    """
+    simulation = config["simulation"]
+    policy = simulation.get("action_policy", "llm")
+    weights = simulation.get("action_policy_weights")
+
+    if policy == "llm":
+        return LLMActionPolicy()
+    elif policy == "persona":
+        return PersonaActionPolicy(trait_weights=weights)
+    elif policy == "hybrid":
+        return HybridActionPolicy(
+            llm_fraction=float(simulation.get("action_policy_llm_fraction", 0.1)),
+            trait_weights=weights,
+        )
+    raise ValueError(f"Unknown action policy: {policy}")
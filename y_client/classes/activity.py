@@ -0,0 +1,81 @@
+import numpy as np
+from abc import ABC, abstractmethod
+
+__all__ = ["ActivityModel", "SlotSample", "Poisson", "get_activity_model"]
+
+
+class ActivityModel(ABC):
+    def __init__(self, hourly_activity):
+        """
+        Activity model of the agents: when they wake up to take their turn.
+
+        :param hourly_activity: the expected fraction of active agents at each hour of the day (simulation.hourly_activity)
+        """
+        self.hourly_activity = {
+            int(h): float(v) for h, v in hourly_activity.items()
+        }
+
+    def rate(self, hour):
+        """
+        Get the expected fraction of active agents at an hour.
+
+        :param hour: the hour of the day
+        :return: the fraction of active agents
+        """
+        return self.hourly_activity.get(hour % 24, 0.0)
+
+    @abstractmethod
+    def active(self, n, hour, rng):
+        """
+        Draw the agents active in a slot.
+
+        :param n: the number of agents
+        :param hour: the hour of the slot
+        :param rng: the NumPy random generator
+        :return: the array of the indexes of the active agents, in the order of their turns
+        """
+
+
+class SlotSample(ActivityModel):
+    def active(self, n, hour, rng):
+        """
+        Sample a fixed number of active agents: the fraction of the hour of the
+        population (at least 1), as uniform sample without replacement.
+
+        :param n: the number of agents
+        :param hour: the hour of the slot
+        :param rng: the NumPy random generator
+        :return: the array of the indexes of the active agents, in the order of their turns
+        """
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        return rng.choice(n, max(int(n * self.rate(hour)), 1), replace=False)
+
+
+class Poisson(ActivityModel):
+    def active(self, n, hour, rng):
+        """
+        Independent agents, each active in a slot with the probability of the
+        hour: the number of active agents of a slot is random, and the slots
+        without active agents are skipped.
+
+        :param n: the number of agents
+        :param hour: the hour of the slot
+        :param rng: the NumPy random generator
+        :return: the array of the indexes of the active agents, in the order of their turns
+        """
+        k = rng.binomial(n, min(max(self.rate(hour), 0.0), 1.0))
+        return rng.choice(n, k, replace=False)
+
+
+def get_activity_model(config):
+    """
+    Get the activity model of a simulation.
+
+    :param config: the configuration dictionary
+    :return: the activity model
+    """
+    name = config["simulation"].get("activity_model", "SlotSample")
+    if name not in __all__ or name in ("ActivityModel", "get_activity_model"):
+        raise ValueError(f"Unknown activity model: {name}")
+    return globals()[name](config["simulation"]["hourly_activity"])
@@ -0,0 +1,240 @@
+import json
+import zlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+__all__ = ["ShardPool", "AgentRunner"]
+
+
+class AgentRunner(object):
+    def __init__(self, config_filename, prompts_filename, content_recsys=None, follow_recsys=None):
+        """
+        Runner of agents' turns outside of the simulation client process (shard and
+        remote workers), with its own simulation client of the configuration.
+
+        The agents are loaded from the server the first time they are active, and
+        kept for their next turns.
+
+        :param config_filename: the configuration file of the simulation
+        :param prompts_filename: the LLM prompts file of the simulation
+        :param content_recsys: the content recommendation system
+        :param follow_recsys: the follower recommendation system
+        """
+        import y_client.clients
+
+        config = json.load(open(config_filename, "r"))
+        self.client = getattr(y_client.clients, config["simulation"]["client"])(
+            config_filename, prompts_filename
+        )
+        self.client.set_recsys(content_recsys, follow_recsys)
+        if self.client.concurrency > 1:
+            self.client.executor = ThreadPoolExecutor(
+                max_workers=self.client.concurrency
+            )
+        self.agents = {}
+        self.__lock = threading.Lock()
+
+    def agent(self, name, email, is_page):
+        """
+        Get an agent, loading it from the server on first use.
+
+        :param name: the agent name
+        :param email: the agent email
+        :param is_page: whether the agent is a page
+        :return: the agent, None if it cannot be loaded
+        """
+        with self.__lock:
+            if name not in self.agents:
+                self.agents[name] = self.__load(name, email, is_page)
+            return self.agents[name]
+
+    def __load(self, name, email, is_page):
+        """
+        Load an agent from the server.
+
+        :param name: the agent name
+        :param email: the agent email
+        :param is_page: whether the agent is a page
+        :return: the agent, None if it cannot be loaded
+        """
+        from y_client import Agent, PageAgent
+
+        client = self.client
+        try:
+            cls = PageAgent if is_page else Agent
+            agent = cls(
+                name=name,
+                email=email,
+                load=True,
+                config=client.config,
+                api=client.api,
+            )
+            agent.set_prompts(client.prompts)
+            agent.set_rec_sys(client.content_recsys, client.follow_recsys)
+        except Exception:
+            print(f"Error loading agent: {name}")
+            return None
+        return agent
+
+    def forget(self, names):
+        """
+        Drop the agents that left the simulation.
+
+        :param names: the agent names
+        """
+        with self.__lock:
+            for name in names:
+                self.agents.pop(name, None)
+
+    def run(self, tid, turns):
+        """
+        Run agents' turns and send their writes.
+
+        :param tid: the round id
+        :param turns: list of (name, email, is_page, rounds, reply) turns
+        :return: the number of turns run
+        """
+        client = self.client
+        turns = [
+            (self.agent(name, email, is_page), rounds, reply)
+            for name, email, is_page, rounds, reply in turns
+        ]
+        turns = [t for t in turns if t[0] is not None]
+
+        if client.executor is None:
+            for agent, rounds, reply in turns:
+                client.agent_turn(agent, tid, rounds, reply=reply)
+        else:
+            futures = [
+                client.executor.submit(client.agent_turn, agent, tid, rounds, reply)
+                for agent, rounds, reply in turns
+            ]
+            for future in futures:
+                future.result()
+
+        # the writes are sent before the slot barrier
+        for agent, _, _ in turns:
+            client.api.flush(agent.user_id)
+        return len(turns)
+
+
+# the AgentRunner of a shard worker process
+_shard = {}
+
+
+def _init_shard(config_filename, prompts_filename, content_recsys, follow_recsys):
+    """
+    Set up a shard worker process.
+
+    :param config_filename: the configuration file of the simulation
+    :param prompts_filename: the LLM prompts file of the simulation
+    :param content_recsys: the content recommendation system
+    :param follow_recsys: the follower recommendation system
+    """
+    _shard["runner"] = AgentRunner(
+        config_filename, prompts_filename, content_recsys, follow_recsys
+    )
+
+
+def _run_shard(tid, turns, removed):
+    """
+    Run the turns of the agents of a shard, in the shard worker process.
+
+    :param tid: the round id
+    :param turns: list of (name, email, is_page, rounds, reply) turns
+    :param removed: the names of the agents that left the simulation
+    :return: the number of turns run
+    """
+    _shard["runner"].forget(removed)
+    return _shard["runner"].run(tid, turns)
+
+
+class ShardPool(object):
+    def __init__(
+        self,
+        config_filename,
+        prompts_filename,
+        processes,
+        content_recsys=None,
+        follow_recsys=None,
+    ):
+        """
+        Worker processes running the turns of the agents, partitioned in shards.
+
+        Each agent belongs to one shard (by hash of its name) for the whole run, and
+        each shard is run by its own process, holding its own simulation client, API
+        client and LLM backend. A shard worker loads its agents from the server the
+        first time they are active. The simulation client keeps the clock, churn,
+        growth and the slot barrier: run waits for the turns of all the shards.
+
+        :param config_filename: the configuration file of the simulation
+        :param prompts_filename: the LLM prompts file of the simulation
+        :param processes: the number of shards (worker processes)
+        :param content_recsys: the content recommendation system
+        :param follow_recsys: the follower recommendation system
+        """
+        self.processes = max(1, int(processes))
+
+        # spawned workers: the client process runs threads (API pool, LLM clients, ...)
+        ctx = multiprocessing.get_context("spawn")
+        self.executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=ctx,
+                initializer=_init_shard,
+                initargs=(config_filename, prompts_filename, content_recsys, follow_recsys),
+            )
+            for _ in range(self.processes)
+        ]
+        self.__removed = [[] for _ in range(self.processes)]
+
+    def shard(self, name):
+        """
+        Get the shard of an agent.
+
+        :param name: the agent name
+        :return: the shard index
+        """
+        return zlib.crc32(name.encode("utf-8")) % self.processes
+
+    def remove(self, names):
+        """
+        Forget the agents that left the simulation, on their next shard run.
+
+        :param names: the agent names
+        """
+        for name in names:
+            self.__removed[self.shard(name)].append(name)
+
+    def submit(self, turns, tid):
+        """
+        Submit the turns of a slot to the shards.
+
+        :param turns: list of (agent, rounds, reply) turns
+        :param tid: the round id
+        :return: dict of the futures, one per shard with turns, to the indexes of their turns
+        """
+        units = [[] for _ in range(self.processes)]
+        indexes = [[] for _ in range(self.processes)]
+        for i, (agent, rounds, reply) in enumerate(turns):
+            shard = self.shard(agent.name)
+            units[shard].append(
+                (agent.name, agent.email, bool(agent.is_page), rounds, reply)
+            )
+            indexes[shard].append(i)
+
+        futures = {}
+        for i, unit in enumerate(units):
+            if len(unit) == 0:
+                continue
+            removed, self.__removed[i] = self.__removed[i], []
+            futures[self.executors[i].submit(_run_shard, tid, unit, removed)] = indexes[i]
+        return futures
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for executor in self.executors:
+            executor.shutdown(wait=True)
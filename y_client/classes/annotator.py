@@ -1,15 +1,41 @@
+import time
+import threading
 import autogen
+from contextlib import nullcontext
 from autogen.agentchat.contrib.multimodal_conversable_agent import (
     MultimodalConversableAgent,
 )
+from y_client.classes.llm_scheduler import LLMRequestShed, GENERATION
+from y_client.classes.image_descriptions import normalize_image_url
 
 
 class Annotator(object):
-    def __init__(self, config):
+    def __init__(self, config, scheduler=None, router=None, cache=None, fetcher=None):
+        """
+        Describe images with the vision model.
+
+        The annotator is long-lived: its autogen agents are created once per
+        thread and endpoint, and reused for every image.
+
+        :param config: the vision LLM configuration (url, api_key, model, temperature, max_tokens)
+        :param scheduler: the LLMScheduler limiting the in-flight requests, None for no limits
+        :param router: the LLMRouter balancing the requests over several servers
+        :param cache: the ImageDescriptionCache of the descriptions, None for no cache
+        :param fetcher: the ImageFetcher sending downscaled images, None to send the image urls
+        """
+        self.scheduler = scheduler
+        self.router = router
+        self.cache = cache
+        self.fetcher = fetcher
+        self.endpoints = (
+            [config["url"]] if isinstance(config["url"], str) else list(config["url"])
+        )
+        self.temperature = config['temperature']
+        self.max_tokens = config['max_tokens']
         self.config_list = [
             {
                 "model": config["model"],
-                "base_url": config["url"],
+                "base_url": self.endpoints[0],
                 "timeout": 10000,
                 "api_type": "open_ai",
                 "api_key": config["api_key"],
@@ -17,30 +43,153 @@ class Annotator(object):
             }
         ]
 
-        self.image_agent = MultimodalConversableAgent(
-            name="image-explainer",
-            max_consecutive_auto_reply=1,
-            llm_config={
-                "config_list": self.config_list,
-                "temperature": config['temperature'],
-                "max_tokens": config['max_tokens'],
-            },
-            human_input_mode="NEVER",
-        )
+        model = config["model"]
+        self.model = model[0] if isinstance(model, list) else model
+
+        # autogen agents keep the chat history: one pair per thread and endpoint
+        self.__local = threading.local()
+
+    def __agents(self, endpoint):
+        """
+        Get the autogen agents of the current thread for an endpoint.
+
+        :param endpoint: the endpoint url
+        :return: the (user proxy, image agent) pair
+        """
+        agents = getattr(self.__local, "agents", None)
+        if agents is None:
+            agents = self.__local.agents = {}
+
+        if endpoint not in agents:
+            image_agent = MultimodalConversableAgent(
+                name="image-explainer",
+                max_consecutive_auto_reply=1,
+                llm_config={
+                    "config_list": [dict(self.config_list[0], base_url=endpoint)],
+                    "temperature": self.temperature,
+                    "max_tokens": self.max_tokens,
+                },
+                human_input_mode="NEVER",
+            )
+            user_proxy = autogen.AssistantAgent(
+                name="User_proxy",
+                max_consecutive_auto_reply=0,
+            )
+            agents[endpoint] = (user_proxy, image_agent)
+        return agents[endpoint]
+
+    def describe(self, image, priority=GENERATION):
+        """
+        Get the description of an image, from the cache when already described.
+
+        :param image: the image url
+        :param priority: the request priority, GENERATION or BACKGROUND
+        :return: the description, None if the image cannot be fetched
+        """
+        if self.fetcher is not None:
+            # the same image reached through different urls is described once
+            digest = self.fetcher.fetch(image)
+            if digest is None:
+                return None
+            key = f"sha256:{digest}"
+        else:
+            digest = None
+            key = normalize_image_url(image)
 
-        self.user_proxy = autogen.AssistantAgent(
-            name="User_proxy",
-            max_consecutive_auto_reply=0,
+        if self.cache is None:
+            return self.annotate(image, priority=priority, digest=digest)
+        return self.cache.describe(
+            key,
+            self.model,
+            lambda: self.annotate(image, priority=priority, digest=digest),
         )
 
-    def annotate(self, image):
+    def annotate(self, image, priority=GENERATION, digest=None):
+        """
+        Describe an image with the vision model.
 
-        self.user_proxy.initiate_chat(
-            self.image_agent,
-            silent=True,
-            message=f"""Describe the image content and, if present, identify the main characters in it. 
-            Write in english. <img {image}>""",
+        :param image: the image url
+        :param priority: the request priority, GENERATION or BACKGROUND
+        :param digest: the digest of the image in the fetcher cache, None to send the image url
+        :return: the description
+        """
+        prompt = """Describe the image content and, if present, identify the main characters in it. 
+            Write in english. """
+        if digest is not None:
+            # the downscaled image from the local cache: autogen does not fetch it again
+            message = {
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": self.fetcher.load(digest)}},
+                ]
+            }
+        else:
+            message = f"{prompt}<img {image}>"
+
+        endpoint = (
+            self.router.select(self.model)
+            if self.router is not None
+            else self.endpoints[0]
         )
+        user_proxy, image_agent = self.__agents(endpoint)
+
+        if self.scheduler is not None:
+            slot = self.scheduler.slot(endpoint, self.model, priority=priority)
+        else:
+            slot = nullcontext()
 
-        res = self.image_agent.chat_messages[self.user_proxy][-1]["content"][-1]["text"]
+        try:
+            with slot:
+                start = time.monotonic()
+                user_proxy.initiate_chat(
+                    image_agent,
+                    silent=True,
+                    message=message,
+                )
+        except LLMRequestShed:
+            if self.router is not None:
+                self.router.release(endpoint)
+            raise
+        except Exception:
+            if self.router is not None:
+                self.router.release(endpoint, failed=True)
+            raise
+        if self.router is not None:
+            self.router.release(endpoint, latency=time.monotonic() - start)
+
+        res = image_agent.chat_messages[user_proxy][-1]["content"][-1]["text"]
         return res
+
+
+_annotators = {}
+_annotators_lock = threading.Lock()
+
+
+def get_annotator(config, scheduler=None, router=None, cache=None, fetcher=None):
+    """
+    Get the annotator shared by the agents using a vision LLM configuration.
+
+    :param config: the vision LLM configuration (url, api_key, model, temperature, max_tokens)
+    :param scheduler: the LLMScheduler limiting the in-flight requests, None for no limits
+    :param router: the LLMRouter balancing the requests over several servers
+    :param cache: the ImageDescriptionCache of the descriptions, None for no cache
+    :param fetcher: the ImageFetcher sending downscaled images, None to send the image urls
+    :return: the Annotator object
+    """
+    url = config["url"] if isinstance(config["url"], str) else tuple(config["url"])
+    model = config["model"] if isinstance(config["model"], str) else tuple(config["model"])
+    key = (
+        url,
+        model,
+        config["api_key"],
+        config["temperature"],
+        config["max_tokens"],
+        id(cache),
+        id(fetcher),
+    )
+    with _annotators_lock:
+        if key not in _annotators:
+            _annotators[key] = Annotator(
+                config, scheduler=scheduler, router=router, cache=cache, fetcher=fetcher
+            )
+        return _annotators[key]
@@ -0,0 +1,240 @@
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["APIClient", "get_api_client"]
+
+
+class APIClient(object):
+    def __init__(
+        self,
+        base_url,
+        pool_size=20,
+        connect_timeout=10,
+        read_timeout=300,
+        max_retries=0,
+        write_behind=False,
+    ):
+        """
+        Pooled, keep-alive HTTP client for the YServer API.
+
+        A single instance is meant to be shared by the simulation client, its agents,
+        the simulation clock and the recommender systems, so that every call reuses
+        the connections of the same pool instead of opening a new TCP connection.
+
+        :param base_url: the base url of the YServer API
+        :param pool_size: the maximum number of connections kept alive in the pool
+        :param connect_timeout: the connection timeout in seconds
+        :param read_timeout: the read timeout in seconds, None for no limit
+        :param max_retries: the number of retries on connection errors
+        :param write_behind: whether deferred writes are queued until flushed
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=max_retries,
+            pool_block=True,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        self.pool_size = pool_size
+
+        # write-behind queue: pending writes per owner (agent), in issue order
+        self.write_behind = write_behind
+        self.__pending = {}
+        self.__pending_lock = threading.Lock()
+        # the owner whose turn runs on each thread: its writes are sent before its reads
+        self.__owner = threading.local()
+
+    @staticmethod
+    def options(config):
+        """
+        Get the options of the client from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the keyword arguments of the client, but the base url
+        """
+        servers = config["servers"]
+        return dict(
+            pool_size=int(servers.get("api_pool_size", 20)),
+            connect_timeout=float(servers.get("api_connect_timeout", 10)),
+            read_timeout=(
+                float(servers["api_read_timeout"])
+                if servers.get("api_read_timeout") is not None
+                else None
+            ),
+            max_retries=int(servers.get("api_max_retries", 0)),
+            write_behind=config["simulation"].get("write_behind", "none") != "none",
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the client from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the APIClient object
+        """
+        return cls(config["servers"]["api"], **cls.options(config))
+
+    def url(self, endpoint):
+        """
+        Build the full url of an endpoint.
+
+        :param endpoint: the endpoint name, e.g. "post" or "/post"
+        :return: the full url
+        """
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    def get(self, endpoint, data=None):
+        """
+        Send a GET request to the service.
+
+        :param endpoint: the endpoint name
+        :param data: the (JSON encoded) request body
+        :return: the response from the service
+        """
+        self.__read_own_writes()
+        return self.session.get(self.url(endpoint), data=data, timeout=self.timeout)
+
+    def post(self, endpoint, data=None):
+        """
+        Send a POST request to the service.
+
+        :param endpoint: the endpoint name
+        :param data: the (JSON encoded) request body
+        :return: the response from the service
+        """
+        self.__read_own_writes()
+        return self.session.post(self.url(endpoint), data=data, timeout=self.timeout)
+
+    def post_deferred(self, endpoint, data=None, owner=None):
+        """
+        Send a fire-and-forget POST request to the service.
+        When the write-behind queue is enabled the request is queued until the
+        next flush, otherwise it is sent immediately.
+
+        :param endpoint: the endpoint name
+        :param data: the (JSON encoded) request body
+        :param owner: the issuer of the write (e.g., the agent id), writes of the same owner keep their order
+        """
+        if not self.write_behind:
+            self.post(endpoint, data=data)
+            return
+
+        with self.__pending_lock:
+            self.__pending.setdefault(owner, []).append((endpoint, data))
+
+    def bind(self, owner):
+        """
+        Bind the requests of the current thread to an owner (e.g., during the turn
+        of an agent): its queued writes are sent before any of its requests, so that
+        it reads its own writes.
+
+        :param owner: the owner, None to unbind the thread
+        """
+        self.__owner.value = owner
+
+    def __read_own_writes(self):
+        """
+        Send the queued writes of the owner bound to the current thread.
+        """
+        if not self.write_behind:
+            return
+        owner = getattr(self.__owner, "value", None)
+        if owner is not None and owner in self.__pending:
+            self.flush(owner)
+
+    def pending_writes(self):
+        """
+        Get the number of queued writes.
+
+        :return: the number of queued writes
+        """
+        with self.__pending_lock:
+            return sum(len(q) for q in self.__pending.values())
+
+    def flush(self, owner=None):
+        """
+        Send the queued writes.
+
+        :param owner: flush only the writes of this owner, None to flush all of them
+        """
+        with self.__pending_lock:
+            if owner is None:
+                queues = list(self.__pending.values())
+                self.__pending = {}
+            else:
+                queues = [self.__pending.pop(owner, [])]
+        queues = [q for q in queues if len(q) > 0]
+
+        if len(queues) == 0:
+            return
+
+        if len(queues) == 1:
+            self.__send_queue(queues[0])
+            return
+
+        # one owner per worker: the writes of an owner are sent in order
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(queues))) as ex:
+            list(ex.map(self.__send_queue, queues))
+
+    def __send_queue(self, queue):
+        """
+        Send a list of writes one after the other on the pooled connections.
+
+        :param queue: the list of (endpoint, data) writes
+        """
+        for endpoint, data in queue:
+            self.post(endpoint, data=data)
+
+    def close(self):
+        """
+        Send the queued writes and close the pooled connections.
+        """
+        self.flush()
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_api_client(base_url, config=None):
+    """
+    Get the shared APIClient for a YServer API.
+
+    Used by the objects that are created without an injected client (e.g., agents
+    generated outside of a simulation client), so that they still share one pool.
+
+    :param base_url: the base url of the YServer API
+    :param config: the configuration dictionary, setting up the client, None for any client of the API
+    :return: the APIClient object
+    """
+    url = base_url.rstrip("/")
+    with _clients_lock:
+        if config is None:
+            # without a configuration, any client of the API is shared
+            for (u, _), client in _clients.items():
+                if u == url:
+                    return client
+            key = (url, None)
+            if key not in _clients:
+                _clients[key] = APIClient(base_url)
+            return _clients[key]
+
+        # configurations with different timeouts, pool or write-behind get their own client
+        options = APIClient.options(config)
+        key = (url, tuple(sorted(options.items())))
+        if key not in _clients:
+            _clients[key] = APIClient(base_url, **options)
+        return _clients[key]
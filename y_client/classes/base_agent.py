@@ -1,14 +1,21 @@
 from y_client.recsys.ContentRecSys import ContentRecSys
 from y_client.recsys.FollowRecSys import FollowRecSys
 from y_client.news_feeds.client_modals import Websites, Images, Articles, session, Agent_Custom_Prompt
-from y_client.classes.annotator import Annotator
+from y_client.classes.annotator import get_annotator
+from y_client.classes.image_descriptions import get_image_description_cache
+from y_client.classes.image_fetcher import get_image_fetcher
 from sqlalchemy.sql.expression import func
 from y_client.news_feeds.feed_reader import NewsFeed
 from y_client.classes.time import SimulationSlot
+from y_client.classes.api_client import APIClient, get_api_client
+from y_client.classes.llm_backend import get_llm_backend, extract_json, normalize_answer
+from y_client.classes.llm_router import get_llm_router
+from y_client.classes.prompt_templates import compile_template
+from y_client.classes.action_policy import get_action_policy
+from y_client.classes.decisions import DecisionBatch
+from y_client.classes.emotion_annotator import get_emotion_annotator
 import random
-from requests import get, post
 import json
-from autogen import AssistantAgent
 import numpy as np
 import re
 
@@ -40,6 +47,7 @@ class Agent(object):
         toxicity: str = "no",
         api_key: str = "NULL",
         is_page: int = 0,
+        api: APIClient = None,
         *args,
         **kwargs,
     ):
@@ -67,6 +75,7 @@ class Agent(object):
         :param nationality: the agent nationality
         :param toxicity: the toxicity level of the agent, default is "no"
         :param api_key: the LLM server api key, default is NULL (self-hosted)
+        :param api: the (shared) YServer API client, default is the pooled client of config["servers"]["api"]
         """
 
         if "web" in kwargs:
@@ -75,11 +84,16 @@ class Agent(object):
                             ag_type=ag_type, load=load, recsys=recsys, age=age,
                             frecsys=frecsys, config=config, big_five=big_five, language=language, owner=owner, education_level=education_level,
                             joined_on=joined_on, round_actions=round_actions, gender=gender, nationality=nationality, toxicity=toxicity,
-                            api_key=api_key, is_page=is_page, *args, **kwargs)
+                            api_key=api_key, is_page=is_page, api=api, *args, **kwargs)
         else:
             self.emotions = config["posts"]["emotions"]
+            self.generation_mode = config["posts"].get("generation_mode", "two_turn")
+            self.emotion_annotator = get_emotion_annotator(config)
             self.actions_likelihood = config["simulation"]["actions_likelihood"]
+            self.action_policy = get_action_policy(config)
+            self.batch_decisions = bool(config["simulation"].get("batch_decisions", False))
             self.base_url = config["servers"]["api"]
+            self.api = api if api is not None else get_api_client(self.base_url, config)
             self.llm_base = config["servers"]["llm"]
             self.content_rec_sys_name = None
             self.follow_rec_sys_name = None
@@ -93,6 +107,9 @@ class Agent(object):
                 "temperature": config["servers"]["llm_v_temperature"],
                 "max_tokens": config["servers"]["llm_v_max_tokens"]
             }
+            self.llm_v_router = get_llm_router(config, config["servers"]["llm_v"])
+            self.image_cache = get_image_description_cache(config)
+            self.image_fetcher = get_image_fetcher(config)
             self.is_page = is_page
 
             if not load:
@@ -110,7 +127,7 @@ class Agent(object):
                 self.owner = owner
                 self.education_level = education_level
                 self.joined_on = joined_on
-                sc = SimulationSlot(config)
+                sc = SimulationSlot(config, api=self.api)
                 sc.get_current_slot()
                 self.joined_on = sc.id
                 self.round_actions = round_actions
@@ -125,17 +142,22 @@ class Agent(object):
                     self.user_id = uid
 
             else:
-                us = json.loads(self.__get_user())
+                # restored from a checkpoint (see state), or loaded from the server
+                us = kwargs.get("state")
+                if us is None:
+                    us = json.loads(self.__get_user())
                 self.user_id = us["id"]
                 self.type = us["user_type"]
                 self.age = us["age"]
 
-                if us["is_page"] == 0:
+                if us["is_page"] != 0:
+                    self.interests = []
+                elif "interests" in us:
+                    self.interests = us["interests"]
+                else:
                     self.interests = random.randint(config["agents"]["n_interests"]["min"],
                                                     config["agents"]["n_interests"]["max"])
                     self.interests = self.__get_interests(-1)[0]
-                else:
-                    self.interests = []
 
                 self.leaning = us["leaning"]
                 self.pwd = us["password"]
@@ -158,7 +180,7 @@ class Agent(object):
 
             config_list = {
                 "model": f"{self.type}",
-                "base_url": self.llm_base,
+                "base_url": self.llm_base if isinstance(self.llm_base, str) else self.llm_base[0],
                 "timeout": 10000,
                 "api_type": "open_ai",
                 "api_key": api_key if (api_key is not None and api_key != "") else "NULL",
@@ -173,6 +195,12 @@ class Agent(object):
                 "temperature": config['servers']['llm_temperature'],
             }
 
+            # per-prompt overrides of llm_config (max_tokens, temperature, stop, ...)
+            self.llm_profiles = config["servers"].get("llm_profiles", {})
+
+            # shared chat client of the agent LLM endpoint
+            self.llm = get_llm_backend(config, api_key=config_list["api_key"])
+
             # add and configure the content recsys
             self.content_rec_sys = recsys
             if self.content_rec_sys is not None:
@@ -207,12 +235,18 @@ class Agent(object):
         toxicity: str = "no",
         api_key: str = "NULL",
         is_page: int = 0,
+        api: APIClient = None,
         *args,
         **kwargs,):
 
         self.emotions = config["posts"]["emotions"]
+        self.generation_mode = config["posts"].get("generation_mode", "two_turn")
+        self.emotion_annotator = get_emotion_annotator(config)
         self.actions_likelihood = config["simulation"]["actions_likelihood"]
+        self.action_policy = get_action_policy(config)
+        self.batch_decisions = bool(config["simulation"].get("batch_decisions", False))
         self.base_url = config["servers"]["api"]
+        self.api = api if api is not None else get_api_client(self.base_url, config)
         self.llm_base = config["servers"]["llm"]
         self.content_rec_sys_name = None
         self.follow_rec_sys_name = None
@@ -241,6 +275,9 @@ class Agent(object):
             self.llm_v_config["model"] = config["servers"]["llm_v_agent"]
         except:
             self.llm_v_config["model"] = 'minicpm-v'
+        self.llm_v_router = get_llm_router(config, config["servers"]["llm_v"])
+        self.image_cache = get_image_description_cache(config)
+        self.image_fetcher = get_image_fetcher(config)
 
         self.is_page = is_page
 
@@ -269,7 +306,7 @@ class Agent(object):
             self.owner = owner
             self.education_level = education_level
             self.joined_on = joined_on
-            sc = SimulationSlot(config)
+            sc = SimulationSlot(config, api=self.api)
             sc.get_current_slot()
             self.joined_on = sc.id
             self.round_actions = round_actions
@@ -320,7 +357,7 @@ class Agent(object):
 
         config_list = {
             "model": f"{self.type}",
-            "base_url": self.llm_base,
+            "base_url": self.llm_base if isinstance(self.llm_base, str) else self.llm_base[0],
             "timeout": 10000,
             "api_type": "open_ai",
             "api_key": api_key if (api_key is not None and api_key != "") else "NULL",
@@ -335,6 +372,12 @@ class Agent(object):
             "temperature": float(config['servers']['llm_temperature']),
         }
 
+        # per-prompt overrides of llm_config (max_tokens, temperature, stop, ...)
+        self.llm_profiles = config["servers"].get("llm_profiles", {})
+
+        # shared chat client of the agent LLM endpoint
+        self.llm = get_llm_backend(config, api_key=config_list["api_key"])
+
         self.set_rec_sys(recsys, frecsys)
 
         # add and configure the content recsys
@@ -366,7 +409,31 @@ class Agent(object):
             kwargs["interests"] = []
 
         kwargs["self"] = self
-        return eval(f'f"""{non_f_str}"""', kwargs)
+        return compile_template(non_f_str).render(**kwargs)
+
+    def __system_prompt(self, key: str, interests: list = None):
+        """
+        Get a rendered system prompt (agent persona or Handler instructions).
+        Rendered prompts are cached per agent, keyed by the interests they depend on.
+
+        :param key: the prompt name
+        :param interests: the interests the prompt is rendered with
+        :return: the rendered prompt
+        """
+        template = self.prompts[key]
+        interests = list(interests) if interests is not None else []
+        ckey = (template, tuple(interests))
+
+        # Agent.__dict__ is overridden by the JSON representation: no vars()/__dict__ here
+        cache = getattr(self, "_system_prompts", None)
+        if cache is None:
+            cache = self._system_prompts = {}
+        if ckey not in cache:
+            # bounded: interests are sampled among the few topics of the agent
+            if len(cache) >= 256:
+                cache.clear()
+            cache[ckey] = self.__effify(template, interests=interests)
+        return cache[ckey]
 
     def set_prompts(self, prompts):
         """
@@ -375,6 +442,7 @@ class Agent(object):
         :param prompts: the prompts
         """
         self.prompts = prompts
+        self._system_prompts = {}
 
         try:
             # if the agent has custom prompts substitute the default ones
@@ -399,32 +467,26 @@ class Agent(object):
             self.content_rec_sys.add_user_id(self.user_id)
             self.content_rec_sys_name = content_recsys.name
 
-            api_url = f"{self.base_url}update_user"
-
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
             params = {
                 "username": self.name,
                 "email": self.email,
                 "recsys_type": content_recsys.name,
             }
             st = json.dumps(params)
-            post(f"{api_url}", headers=headers, data=st)
+            self.api.post("update_user", data=st)
 
         if self.follow_rec_sys is None:
             self.follow_rec_sys = follow_recsys
             self.follow_rec_sys.add_user_id(self.user_id)
             self.follow_rec_sys_name = follow_recsys.name
 
-            api_url = f"{self.base_url}update_user"
-
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
             params = {
                 "username": self.name,
                 "email": self.email,
                 "frecsys_type": follow_recsys.name,
             }
             st = json.dumps(params)
-            post(f"{api_url}", headers=headers, data=st)
+            self.api.post("update_user", data=st)
 
         return {"status": 200}
 
@@ -456,13 +518,11 @@ class Agent(object):
         res = json.loads(self._check_credentials())
         if res["status"] == 404:
             raise Exception("User not found")
-        api_url = f"{self.base_url}get_user"
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
         params = {"username": self.name, "email": self.email}
         st = json.dumps(params)
 
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("get_user", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
@@ -472,13 +532,10 @@ class Agent(object):
 
         :return: the response from the service
         """
-        api_url = f"{self.base_url}user_exists"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
         params = {"name": self.name, "email": self.email}
 
         st = json.dumps(params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("user_exists", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
@@ -514,10 +571,7 @@ class Agent(object):
             }
         )
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/register"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post("register", data=st)
 
         try:
             res = json.loads(self.__get_user())
@@ -525,33 +579,27 @@ class Agent(object):
         except:
             return None
 
-        api_url = f"{self.base_url}/set_user_interests"
         data = {"user_id": uid, "interests": self.interests, "round": self.joined_on}
 
-        post(f"{api_url}", headers=headers, data=json.dumps(data))
+        self.api.post("set_user_interests", data=json.dumps(data))
 
         return uid
 
     def __get_interests(self, tid):
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
         # current round
         if tid == -1:
             # get last round id
-            api_url = f"{self.base_url}/current_time"
-            response = get(f"{api_url}", headers=headers)
+            response = self.api.get("current_time")
             data = json.loads(response.__dict__["_content"].decode("utf-8"))
             tid = int(data["id"])
 
-        api_url = f"{self.base_url}/get_user_interests"
-
         data = {
             "user_id": self.user_id,
             "round_id": tid,
             "n_interests": self.interests if isinstance(self.interests, int) else len(self.interests),
             "time_window": self.attention_window,
         }
-        response = get(f"{api_url}", headers=headers, data=json.dumps(data))
+        response = self.api.get("get_user_interests", data=json.dumps(data))
         data = json.loads(response.__dict__["_content"].decode("utf-8"))
         try:
             # select a random interest without replacement
@@ -584,9 +632,8 @@ class Agent(object):
             print(f"Warning: No interests found for agent {self.name}. Using empty list.")
 
         # get recent sentiment on the selected interests
-        api_url = f"{self.base_url}/get_sentiment"
         data = {"user_id": self.user_id, "interests": interests}
-        response = post(f"{api_url}", headers={"Content-Type": "application/x-www-form-urlencoded"}, data=json.dumps(data))
+        response = self.api.post("get_sentiment", data=json.dumps(data))
         sentiment = json.loads(response.__dict__["_content"].decode("utf-8"))
 
         self.topics_opinions = "Your opinion on the topics you are interested in is: "
@@ -595,34 +642,13 @@ class Agent(object):
         if len(sentiment) == 0:
             self.topics_opinions = ""
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(
-                self.prompts["agent_roleplay"], interests=interests
-            ),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.prompts["handler_instructions"],
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+        post_text, emotion_eval = self.__generate(
+            system_message=self.__system_prompt("agent_roleplay", interests),
+            handler_message=self.__system_prompt("handler_instructions"),
             message=self.__effify(self.prompts["handler_post"]),
-            silent=True,
-            max_round=1,
+            profile="handler_post",
         )
 
-        emotion_eval = u2.chat_messages[u1][-1]["content"].lower()
-        emotion_eval = self.__clean_emotion(emotion_eval)
-
-        post_text = u2.chat_messages[u1][-2]["content"]
-
         post_text = self.__clean_text(post_text)
 
         # avoid posting empty messages
@@ -644,18 +670,13 @@ class Agent(object):
             }
         )
 
-        u1.reset()
-        u2.reset()
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/post"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post_deferred("post", data=st, owner=self.user_id)
 
         # update topic of interest with the ones used to generate the post
-        api_url = f"{self.base_url}/set_user_interests"
         data = {"user_id": self.user_id, "interests": interests, "round": tid}
-        post(f"{api_url}", headers=headers, data=json.dumps(data))
+        self.api.post_deferred(
+            "set_user_interests", data=json.dumps(data), owner=self.user_id
+        )
 
     def news(self, tid, article, website):
         """
@@ -666,34 +687,15 @@ class Agent(object):
         :param website: the website
         """
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["agent_roleplay_simple"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+        post_text, emotion_eval = self.__generate(
+            system_message=self.__system_prompt("agent_roleplay_simple"),
+            handler_message=self.__system_prompt("handler_instructions"),
             message=self.__effify(
                 self.prompts["handler_news"], website=website, article=article
             ),
-            silent=True,
-            max_round=1,
+            profile="handler_news",
         )
 
-        emotion_eval = u2.chat_messages[u1][-1]["content"].lower()
-        emotion_eval = self.__clean_emotion(emotion_eval)
-
-        post_text = u2.chat_messages[u1][-2]["content"]
-
         post_text = (
             post_text.split(":")[-1]
             .split("-")[-1]
@@ -731,13 +733,7 @@ class Agent(object):
             }
         )
 
-        u1.reset()
-        u2.reset()
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/news"
-        res = post(f"{api_url}", headers=headers, data=st)
+        res = self.api.post("news", data=st)
         return res
 
     def share_link(self, tid, article, website):
@@ -750,33 +746,15 @@ class Agent(object):
         :return: the response from the service
         """
         # Use the same handler_news prompt for link sharing
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["agent_roleplay_comments_share"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+        post_text, emotion_eval = self.__generate(
+            system_message=self.__system_prompt("agent_roleplay_comments_share"),
+            handler_message=self.__system_prompt("handler_instructions"),
             message=self.__effify(
                 self.prompts["handler_news"], website=website, article=article
             ),
-            silent=True,
-            max_round=1,
+            profile="handler_news",
         )
 
-        emotion_eval = u2.chat_messages[u1][-1]["content"].lower()
-        emotion_eval = self.__clean_emotion(emotion_eval)
-
-        post_text = u2.chat_messages[u1][-2]["content"]
         post_text = self.__clean_text(post_text)
 
         # Extract hashtags and mentions
@@ -805,14 +783,8 @@ class Agent(object):
             }
         )
 
-        u1.reset()
-        u2.reset()
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
         # Use the same /news endpoint for sharing links
-        api_url = f"{self.base_url}/news"
-        res = post(f"{api_url}", headers=headers, data=st)
+        res = self.api.post("news", data=st)
         return res
 
     def __get_thread(self, post_id: int, max_tweets=None):
@@ -822,12 +794,9 @@ class Agent(object):
         :param post_id: The post id to get the thread.
         :param max_tweets: The maximum number of tweets to read for context.
         """
-        api_url = f"{self.base_url}/post_thread"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
         params = {"post_id": post_id}
         st = json.dumps(params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("post_thread", data=st)
 
         res = json.loads(response.__dict__["_content"].decode("utf-8"))
 
@@ -843,12 +812,9 @@ class Agent(object):
         :param post_id: The post id to get the user.
         :return: the user
         """
-        api_url = f"{self.base_url}/get_user_from_post"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
         params = {"post_id": post_id}
         st = json.dumps(params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("get_user_from_post", data=st)
 
         res = json.loads(response.__dict__["_content"].decode("utf-8"))
         return res
@@ -860,12 +826,9 @@ class Agent(object):
         :param post_id: The article id to get the article.
         :return: the article
         """
-        api_url = f"{self.base_url}/get_article"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
         params = {"post_id": int(post_id)}
         st = json.dumps(params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("get_article", data=st)
         if response.status_code == 404:
             return None
         res = json.loads(response.__dict__["_content"].decode("utf-8"))
@@ -878,12 +841,9 @@ class Agent(object):
         :param post_id: The post id to get the thread.
         :return: the post
         """
-        api_url = f"{self.base_url}/get_post"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
         params = {"post_id": post_id}
         st = json.dumps(params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("get_post", data=st)
 
         res = json.loads(response.__dict__["_content"].decode("utf-8"))
         return res
@@ -904,19 +864,15 @@ class Agent(object):
         # interests, _ = self.__get_interests(tid)
 
         # get the post_id topics
-        api_url = f"{self.base_url}/get_post_topics_name"
-        response = get(f"{api_url}", headers={"Content-Type": "application/x-www-form-urlencoded"},
-                        data=json.dumps({"post_id": post_id}))
+        response = self.api.get("get_post_topics_name", data=json.dumps({"post_id": post_id}))
         interests = json.loads(response.__dict__["_content"].decode("utf-8"))
 
         # get the opinion on the topics (if present)
         self.topics_opinions = ""
         if len(interests) > 0:
             # get recent sentiment on the selected interests
-            api_url = f"{self.base_url}/get_sentiment"
             data = {"user_id": self.user_id, "interests": interests}
-            response = post(f"{api_url}", headers={"Content-Type": "application/x-www-form-urlencoded"},
-                            data=json.dumps(data))
+            response = self.api.post("get_sentiment", data=json.dumps(data))
             sentiment = json.loads(response.__dict__["_content"].decode("utf-8"))
 
             self.topics_opinions = "Your opinion on the topics of the post you are responding to are: "
@@ -925,34 +881,13 @@ class Agent(object):
             if len(sentiment) == 0:
                 self.topics_opinions = ""
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(
-                self.prompts["agent_roleplay_comments_share"], interests=interests
-            ),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+        post_text, emotion_eval = self.__generate(
+            system_message=self.__system_prompt("agent_roleplay_comments_share", interests),
+            handler_message=self.__system_prompt("handler_instructions"),
             message=self.__effify(self.prompts["handler_comment"], conv=conv),
-            silent=True,
-            max_round=1,
+            profile="handler_comment",
         )
 
-        emotion_eval = u2.chat_messages[u1][-1]["content"].lower()
-        emotion_eval = self.__clean_emotion(emotion_eval)
-
-        post_text = u2.chat_messages[u1][-2]["content"]
-
         # cleaning the post text of some unwanted characters
         post_text = self.__clean_text(post_text)
 
@@ -978,23 +913,35 @@ class Agent(object):
             }
         )
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        api_url = f"{self.base_url}/comment"
-        post(f"{api_url}", headers=headers, data=st)
-        res = self.__evaluate_follow(post_text, post_id, "follow", tid)
+        self.api.post_deferred("comment", data=st, owner=self.user_id)
+
+        follow, unfollow = None, None
+        batch = self.__decision_batch()
+        if batch is not None:
+            # ask the unfollow evaluation together with the follow one
+            follow, unfollow = [
+                batch.add(
+                    self.__effify(
+                        self.prompts["handler_follow"], post_text=post_text, action=a
+                    )
+                )
+                for a in ("follow", "unfollow")
+            ]
+            batch.resolve()
+
+        res = self.__evaluate_follow(post_text, post_id, "follow", tid, decision=follow)
 
         # update topic of interest with the ones from the post
         # get the root post id
-        api_url = f"{self.base_url}/get_thread_root"
-        response = get(
-            f"{api_url}", headers=headers, data=json.dumps({"post_id": post_id})
+        response = self.api.get(
+            "get_thread_root", data=json.dumps({"post_id": post_id})
         )
         data = json.loads(response.__dict__["_content"].decode("utf-8"))
         self.__update_user_interests(data, tid)
 
         # if not followed, test unfollow
         if res is None:
-            self.__evaluate_follow(post_text, post_id, "unfollow", tid)
+            self.__evaluate_follow(post_text, post_id, "unfollow", tid, decision=unfollow)
 
     def __update_user_interests(self, post_id, tid):
         """
@@ -1003,15 +950,14 @@ class Agent(object):
         :param post_id: id of the post
         :param tid: round id
         """
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        api_url = f"{self.base_url}/get_post_topics"
         data = {"post_id": post_id}
-        response = get(f"{api_url}", headers=headers, data=json.dumps(data))
+        response = self.api.get("get_post_topics", data=json.dumps(data))
         data = json.loads(response.__dict__["_content"].decode("utf-8"))
         if len(data) > 0:
-            api_url = f"{self.base_url}/set_user_interests"
             data = {"user_id": self.user_id, "interests": data, "round": tid}
-            post(f"{api_url}", headers=headers, data=json.dumps(data))
+            self.api.post_deferred(
+                "set_user_interests", data=json.dumps(data), owner=self.user_id
+            )
 
     def share(self, post_id: int, tid):
         """
@@ -1032,19 +978,15 @@ class Agent(object):
         # interests, _ = self.__get_interests(tid)
 
         # get the post_id topics
-        api_url = f"{self.base_url}/get_post_topics_name"
-        response = get(f"{api_url}", headers={"Content-Type": "application/x-www-form-urlencoded"},
-                       data=json.dumps({"post_id": post_id}))
+        response = self.api.get("get_post_topics_name", data=json.dumps({"post_id": post_id}))
         interests = json.loads(response.__dict__["_content"].decode("utf-8"))
 
         # get the opinion on the topics (if present)
         self.topics_opinions = ""
         if len(interests) > 0:
             # get recent sentiment on the selected interests
-            api_url = f"{self.base_url}/get_sentiment"
             data = {"user_id": self.user_id, "interests": interests}
-            response = post(f"{api_url}", headers={"Content-Type": "application/x-www-form-urlencoded"},
-                            data=json.dumps(data))
+            response = self.api.post("get_sentiment", data=json.dumps(data))
             sentiment = json.loads(response.__dict__["_content"].decode("utf-8"))
 
             self.topics_opinions = "Your opinion topics of the post you are responding to are: "
@@ -1055,36 +997,15 @@ class Agent(object):
         else:
             interests, _ = self.__get_interests(tid)
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(
-                self.prompts["agent_roleplay_comments_share"], interests=interests
-            ),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,  # self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+        post_text, emotion_eval = self.__generate(
+            system_message=self.__system_prompt("agent_roleplay_comments_share", interests),
+            handler_message=self.__system_prompt("handler_instructions"),
             message=self.__effify(
                 self.prompts["handler_share"], article=article, post_text=post_text
             ),
-            silent=True,
-            max_round=1,
+            profile="handler_share",
         )
 
-        emotion_eval = u2.chat_messages[u1][-1]["content"].lower()
-        emotion_eval = self.__clean_emotion(emotion_eval)
-
-        post_text = u2.chat_messages[u1][-2]["content"]
-
         post_text = (
             post_text.split(":")[-1]
             .split("-")[-1]
@@ -1113,10 +1034,7 @@ class Agent(object):
             }
         )
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/share"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post_deferred("share", data=st, owner=self.user_id)
 
     def reaction(self, post_id: int, tid: int, check_follow=True):
         """
@@ -1130,33 +1048,20 @@ class Agent(object):
 
         post_text = self.__get_post(post_id)
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["agent_roleplay_simple"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,  # self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions_simple"]),
-            max_consecutive_auto_reply=0,
-        )
-
-        u2.initiate_chat(
-            u1,
+        # the follow evaluations depend on the reaction: they are asked only when reached
+        text, _ = self.llm.converse(
+            self.name,
+            system_message=self.__system_prompt("agent_roleplay_simple"),
+            handler_message=self.__system_prompt("handler_instructions_simple"),
             message=self.__effify(
                 self.prompts["handler_reactions"], post_text=post_text
             ),
-            silent=True,
-            max_round=1,
+            llm_config=self.__llm_config("handler_reactions"),
+            annotate=False,
+            answers=["YES", "NO", "NEUTRAL"],
         )
 
-        text = u1.chat_messages[u2][-1]["content"].replace("!", "")
-
-        u1.reset()
-        u2.reset()
+        text = normalize_answer(text)
 
         if "YES" in text.split():
             st = json.dumps(
@@ -1184,10 +1089,7 @@ class Agent(object):
         else:
             return
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/reaction"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post_deferred("reaction", data=st, owner=self.user_id)
 
         # evaluate follow only upon explicit request
         if check_follow and flag == "follow":
@@ -1196,7 +1098,7 @@ class Agent(object):
         # update user interests after reaction
         self.__update_user_interests(post_id, tid)
 
-    def __evaluate_follow(self, post_text, post_id, action, tid):
+    def __evaluate_follow(self, post_text, post_id, action, tid, decision=None):
         """
         Evaluate a follow action.
 
@@ -1204,36 +1106,26 @@ class Agent(object):
         :param post_id: the post id
         :param action: the action, either follow or unfollow
         :param tid: the round id
+        :param decision: the already resolved Decision of a batch, None to ask the LLM
         :return: the response from the service
         """
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["agent_roleplay_simple"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions_simple"]),
-            max_consecutive_auto_reply=0,
-        )
-
-        u2.initiate_chat(
-            u1,
-            message=self.__effify(
-                self.prompts["handler_follow"], post_text=post_text, action=action
-            ),
-            silent=True,
-            max_round=1,
-        )
-
-        text = u1.chat_messages[u2][-1]["content"].replace("!", "")
+        if decision is not None:
+            text = decision.answer if decision.answer is not None else ""
+        else:
+            text, _ = self.llm.converse(
+                self.name,
+                system_message=self.__system_prompt("agent_roleplay_simple"),
+                handler_message=self.__system_prompt("handler_instructions_simple"),
+                message=self.__effify(
+                    self.prompts["handler_follow"], post_text=post_text, action=action
+                ),
+                llm_config=self.__llm_config("handler_follow"),
+                annotate=False,
+                answers=["YES", "NO"],
+            )
 
-        u1.reset()
-        u2.reset()
+            text = normalize_answer(text)
 
         if "YES" in text.split():
             if action == "follow":
@@ -1272,10 +1164,7 @@ class Agent(object):
             }
         )
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/follow"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post_deferred("follow", data=st, owner=self.user_id)
 
     def followers(self):
         """
@@ -1286,10 +1175,7 @@ class Agent(object):
 
         st = json.dumps({"user_id": self.user_id})
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/followers"
-        response = get(f"{api_url}", headers=headers, data=st)
+        response = self.api.get("followers", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
@@ -1302,10 +1188,7 @@ class Agent(object):
 
         st = json.dumps({"user_id": self.user_id})
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/timeline"
-        response = get(f"{api_url}", headers=headers, data=st)
+        response = self.api.get("timeline", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
@@ -1320,31 +1203,17 @@ class Agent(object):
 
         post_text = self.__get_post(post_id)
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["agent_roleplay_simple"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,  # self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions_simple"]),
-            max_consecutive_auto_reply=0,
-        )
-
-        u2.initiate_chat(
-            u1,
+        text, _ = self.llm.converse(
+            self.name,
+            system_message=self.__system_prompt("agent_roleplay_simple"),
+            handler_message=self.__system_prompt("handler_instructions_simple"),
             message=self.__effify(self.prompts["handler_cast"], post_text=post_text),
-            silent=True,
-            max_round=1,
+            llm_config=self.__llm_config("handler_cast"),
+            annotate=False,
+            answers=["LEFT", "RIGHT", "NONE"],
         )
 
-        text = u1.chat_messages[u2][-1]["content"].replace("!", "").upper()
-
-        u1.reset()
-        u2.reset()
+        text = normalize_answer(text)
 
         data = {
             "user_id": self.user_id,
@@ -1368,10 +1237,7 @@ class Agent(object):
         else:
             return
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/cast_preference"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post_deferred("cast_preference", data=st, owner=self.user_id)
 
     def churn_system(self, tid):
         """
@@ -1381,10 +1247,7 @@ class Agent(object):
         """
         st = json.dumps({"user_id": self.user_id, "left_on": tid})
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/churn"
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = self.api.post("churn", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
@@ -1397,33 +1260,36 @@ class Agent(object):
         :param max_length_thread_reading: The maximum length of the thread to read.
         """
         np.random.shuffle(actions)
-        acts = ",".join(actions)
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["agent_roleplay_base"]),
-            max_consecutive_auto_reply=1,
-        )
+        text = self.action_policy.select(self, actions)
+        if text is None:
+            acts = ",".join(actions)
+
+            text, _ = self.llm.converse(
+                self.name,
+                system_message=self.__system_prompt("agent_roleplay_base"),
+                handler_message=self.__system_prompt("handler_instructions_simple"),
+                message=self.__effify(self.prompts["handler_action"], actions=acts),
+                llm_config=self.__llm_config("handler_action"),
+                annotate=False,
+                answers=actions,
+            )
 
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions_simple"]),
-            max_consecutive_auto_reply=0,
-        )
+            text = normalize_answer(text)
 
-        u2.initiate_chat(
-            u1,
-            message=self.__effify(self.prompts["handler_action"], actions=acts),
-            silent=True,
-            max_round=1,
-        )
+        # the scheduler applies the deadline (and load shedding) of the selected action
+        action = next((a for a in actions if a in text.split()), None)
+        with self.llm.action(action):
+            self.__perform_action(text, tid, max_length_thread_reading)
 
-        text = u1.chat_messages[u2][-1]["content"].replace("!", "").upper()
-        u1.reset()
-        u2.reset()
+    def __perform_action(self, text, tid, max_length_thread_reading=5):
+        """
+        Perform the selected action.
 
+        :param text: the selected action (as answered by the LLM)
+        :param tid: The time id.
+        :param max_length_thread_reading: The maximum length of the thread to read.
+        """
         if "COMMENT" in text.split():
             candidates = json.loads(self.read())
             if len(candidates) > 0:
@@ -1523,11 +1389,12 @@ class Agent(object):
         """
         selected_post = json.loads(self.read_mentions())
         if "status" not in selected_post:
-            self.comment(
-                int(selected_post[0]),
-                max_length_threads=max_length_thread_reading,
-                tid=tid,
-            )
+            with self.llm.action("REPLY"):
+                self.comment(
+                    int(selected_post[0]),
+                    max_length_threads=max_length_thread_reading,
+                    tid=tid,
+                )
         return
 
     def read(self, article=False):
@@ -1537,7 +1404,9 @@ class Agent(object):
         :param article: whether to read an article or not
         :return: the response from the service
         """
-        return self.content_rec_sys.read(self.base_url, self.user_id, article)
+        return self.content_rec_sys.read(
+            self.base_url, self.user_id, article, api=self.api
+        )
 
     def read_mentions(self):
         """
@@ -1545,7 +1414,9 @@ class Agent(object):
 
         :return: the response from the service
         """
-        return self.content_rec_sys.read_mentions(self.base_url)
+        return self.content_rec_sys.read_mentions(
+            self.base_url, self.user_id, api=self.api
+        )
 
     def search(self):
         """
@@ -1553,7 +1424,7 @@ class Agent(object):
 
         :return: the response from the service
         """
-        return self.content_rec_sys.search(self.base_url)
+        return self.content_rec_sys.search(self.base_url, self.user_id, api=self.api)
 
     def search_follow(self):
         """
@@ -1561,7 +1432,9 @@ class Agent(object):
 
         :return: the response from the service
         """
-        return self.follow_rec_sys.follow_suggestions(self.base_url)
+        return self.follow_rec_sys.follow_suggestions(
+            self.base_url, self.user_id, api=self.api
+        )
 
     def select_news(self):
         """
@@ -1713,8 +1586,15 @@ class Agent(object):
 
         :return: the response from the service
         """
-        # randomly select an image from database
-        image = session.query(Images).order_by(func.random()).first()
+        # randomly select an image from database, preferring the already described ones
+        image = (
+            session.query(Images)
+            .filter(Images.description.isnot(None))
+            .order_by(func.random())
+            .first()
+        )
+        if image is None:
+            image = session.query(Images).order_by(func.random()).first()
 
         # @Todo: add the case of no news sharing enabled
         if (
@@ -1729,11 +1609,9 @@ class Agent(object):
                     return image, None
 
                 else:
-                    # annotate the image with a description
-                    an = Annotator(config=self.llm_v_config)
-                    description = an.annotate(image.url)
-                    image.description = description
-                    session.commit()
+                    # annotate the image with a description (images that cannot be fetched are skipped)
+                    if self.__annotate_image(image) is None:
+                        return None, None
 
                     return image, None
 
@@ -1764,11 +1642,9 @@ class Agent(object):
                     image.remote_article_id = article_id
                     session.commit()
 
-                    # annotate the image with a description
-                    an = Annotator(self.llm_v_config)
-                    description = an.annotate(image.url)
-                    image.description = description
-                    session.commit()
+                    # annotate the image with a description (images that cannot be fetched are skipped)
+                    if self.__annotate_image(image) is None:
+                        return None, None
 
                     return image, article_id
 
@@ -1811,10 +1687,7 @@ class Agent(object):
                         }
                     )
 
-                    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-                    api_url = f"{self.base_url}/news"
-                    res = post(f"{api_url}", headers=headers, data=st)
+                    res = self.api.post("news", data=st)
                     remote_article_id = int(
                         json.loads(res.__dict__["_content"].decode("utf-8"))[
                             "article_id"
@@ -1827,14 +1700,30 @@ class Agent(object):
                     return image, image.remote_article_id
 
                 else:
-                    # annotate the image with a description
-                    an = Annotator(config=self.llm_v_config)
-                    description = an.annotate(image.url)
-                    image.description = description
-                    session.commit()
+                    # annotate the image with a description (images that cannot be fetched are skipped)
+                    if self.__annotate_image(image) is None:
+                        return None, None
 
                     return image, image.remote_article_id
 
+    def __annotate_image(self, image):
+        """
+        Set the description of an image with the shared vision model annotator.
+
+        :param image: the Images row
+        :return: the description, None if the image cannot be fetched
+        """
+        an = get_annotator(
+            self.llm_v_config,
+            scheduler=self.llm.scheduler,
+            router=self.llm_v_router,
+            cache=self.image_cache,
+            fetcher=self.image_fetcher,
+        )
+        image.description = an.describe(image.url)
+        session.commit()
+        return image.description
+
     def comment_image(self, image: object, tid: int, article_id: int = None):
         """
         Comment on an image
@@ -1849,37 +1738,15 @@ class Agent(object):
 
         self.topics_opinions = ""
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
-            system_message=self.__effify(
-                self.prompts["agent_roleplay_comments_share"], interests=interests
-            ),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+        post_text, emotion_eval = self.__generate(
+            system_message=self.__system_prompt("agent_roleplay_comments_share", interests),
+            handler_message=self.__system_prompt("handler_instructions"),
             message=self.__effify(
                 self.prompts["handler_comment_image"], descr=image.description
             ),
-            silent=True,
-            max_round=1,
+            profile="handler_comment_image",
         )
 
-        emotion_eval = u2.chat_messages[u1][-1]["content"].lower()
-
-        emotion_eval = self.__clean_emotion(emotion_eval)
-
-        post_text = u2.chat_messages[u1][-2]["content"]
-
         # cleaning the post text of some unwanted characters
         # post_text = self.__clean_text(post_text)
 
@@ -1905,9 +1772,7 @@ class Agent(object):
             }
         )
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        api_url = f"{self.base_url}/comment_image"
-        post(f"{api_url}", headers=headers, data=st)
+        self.api.post_deferred("comment_image", data=st, owner=self.user_id)
 
     def __str__(self):
         """
@@ -1952,6 +1817,139 @@ class Agent(object):
             "is_page": self.is_page,
         }
 
+    def state(self):
+        """
+        Return the state of the Agent object, to restore it without calls to the
+        server (Agent(name, email, load=True, state=...)).
+
+        :return: the state, as the server user record with the interests
+        """
+        return {
+            "id": self.user_id,
+            "name": self.name,
+            "email": self.email,
+            "password": self.pwd,
+            "age": self.age,
+            "user_type": self.type,
+            "leaning": self.leaning,
+            "interests": list(self.interests) if self.interests is not None else None,
+            "oe": self.oe,
+            "co": self.co,
+            "ex": self.ex,
+            "ag": self.ag,
+            "ne": self.ne,
+            "rec_sys": self.content_rec_sys_name,
+            "frec_sys": self.follow_rec_sys_name,
+            "language": self.language,
+            "owner": self.owner,
+            "education_level": self.education_level,
+            "round_actions": self.round_actions,
+            "gender": self.gender,
+            "nationality": self.nationality,
+            "toxicity": self.toxicity,
+            "joined_on": self.joined_on,
+            "is_page": self.is_page,
+        }
+
+    def __decision_batch(self):
+        """
+        Get an empty batch for the agent short decisions.
+
+        :return: the DecisionBatch object, None if decisions are not batched
+        """
+        if not self.batch_decisions or "handler_decisions" not in self.prompts:
+            return None
+
+        return DecisionBatch(
+            self.llm,
+            self.name,
+            system_message=self.__system_prompt("agent_roleplay_simple"),
+            handler_message=self.__system_prompt("handler_instructions_simple"),
+            batch_message=self.prompts["handler_decisions"],
+            llm_config=self.__llm_config("handler_decisions"),
+        )
+
+    def __llm_config(self, key):
+        """
+        Get the LLM configuration of a prompt: llm_config with the overrides of
+        its generation profile (servers.llm_profiles), if any.
+
+        :param key: the prompt name (e.g., "handler_reactions")
+        :return: the LLM configuration
+        """
+        profile = self.llm_profiles.get(key)
+        if profile is None:
+            return self.llm_config
+
+        llm_config = dict(self.llm_config)
+        llm_config.update(profile)
+        return llm_config
+
+    def __generate(self, system_message, handler_message, message, profile=None):
+        """
+        Generate a text and annotate the emotions it elicits.
+
+        With a local emotion annotator only the text is generated by the LLM.
+        In "one_shot" generation mode a single completion returns both, as a JSON
+        object; if the answer cannot be parsed the two-turn Handler exchange is used.
+
+        :param system_message: the agent system prompt
+        :param handler_message: the Handler (emotion annotation) system prompt
+        :param message: the Handler request
+        :param profile: the name of the request prompt, selecting its generation profile
+        :return: the generated text and the list of emotions
+        """
+        llm_config = self.__llm_config(profile)
+
+        if self.emotion_annotator is not None:
+            post_text = self.llm.chat(
+                [
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": message},
+                ],
+                llm_config,
+            )
+            return post_text, self.emotion_annotator.annotate(post_text)
+
+        if self.generation_mode == "one_shot" and "handler_json_emotions" in self.prompts:
+            answer = self.llm.chat(
+                [
+                    {"role": "system", "content": system_message},
+                    {
+                        "role": "user",
+                        "content": f"{message}\n\n"
+                        + self.__effify(
+                            self.prompts["handler_json_emotions"],
+                            emotions=", ".join(self.emotions),
+                        ),
+                    },
+                ],
+                llm_config,
+            )
+            res = extract_json(answer)
+            if (
+                isinstance(res, dict)
+                and isinstance(res.get("text"), str)
+                and len(res["text"].strip()) > 0
+                and isinstance(res.get("emotions", []), list)
+            ):
+                emotion_eval = [
+                    e.strip().lower()
+                    for e in res.get("emotions", [])
+                    if isinstance(e, str) and e.strip().lower() in self.emotions
+                ]
+                return res["text"], emotion_eval
+
+        post_text, emotion_eval = self.llm.converse(
+            self.name,
+            system_message=system_message,
+            handler_message=handler_message,
+            message=message,
+            llm_config=llm_config,
+            handler_llm_config=self.__llm_config("handler_instructions"),
+        )
+        return post_text, self.__clean_emotion(emotion_eval.lower())
+
     def __clean_emotion(self, text):
         try:
             emotion_eval = [
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import zlib
+import base64
+import struct
+import random
+import threading
+import numpy as np
+
+__all__ = ["Checkpoint", "CheckpointError", "read_checkpoint", "read_journal"]
+
+# file header: magic, format version, flags (unused), payload length, payload crc32
+MAGIC = b"YCKP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQI")
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def encode_array(a):
+    """
+    Encode a NumPy array as a JSON-able object.
+
+    :param a: the array
+    :return: the dtype, shape and base64 data of the array
+    """
+    a = np.ascontiguousarray(a)
+    return {
+        "dtype": a.dtype.str,
+        "shape": list(a.shape),
+        "data": base64.b64encode(a.tobytes()).decode("ascii"),
+    }
+
+
+def decode_array(d):
+    """
+    Decode a NumPy array encoded by encode_array.
+
+    :param d: the encoded array
+    :return: the array
+    """
+    data = base64.b64decode(d["data"])
+    return np.frombuffer(data, dtype=np.dtype(d["dtype"])).reshape(d["shape"]).copy()
+
+
+def read_checkpoint(filename):
+    """
+    Read a checkpoint file.
+
+    :param filename: the checkpoint file
+    :return: the checkpoint state
+    """
+    with open(filename, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise CheckpointError(f"Truncated checkpoint: {filename}")
+        magic, version, _, length, crc = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise CheckpointError(f"Not a checkpoint: {filename}")
+        if version != VERSION:
+            raise CheckpointError(
+                f"Unsupported checkpoint version {version} (expected {VERSION}): {filename}"
+            )
+        payload = f.read(length)
+
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise CheckpointError(f"Corrupted checkpoint: {filename}")
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def read_journal(filename):
+    """
+    Read the journal of the events completed since a checkpoint.
+
+    :param filename: the checkpoint file
+    :return: the list of [slot, event kind, key] entries
+    """
+    entries = []
+    try:
+        with open(f"{filename}.journal", "r") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # the last entry was being written at the interruption
+                    break
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+class Checkpoint(object):
+    def __init__(self, filename, every=24):
+        """
+        Periodic checkpoint of a running simulation: the agents (with their pages),
+        the position and pending events of the scheduler, the day plan and the
+        states of the random generators.
+
+        The state is captured between two slots by the simulation thread, then
+        encoded (JSON, zlib-compressed, behind a versioned binary header, no
+        pickle) and written in the background. The file is replaced atomically, so
+        a crash leaves the previous checkpoint intact.
+
+        The parts of the events completed after the checkpoint (e.g., the turns of
+        a slot) are appended to a journal (filename.journal), so that a resumed
+        simulation does not run them again. Entries older than the checkpoint on
+        disk are dropped at the next checkpoint.
+
+        :param filename: the checkpoint file
+        :param every: the slots between two checkpoints
+        """
+        self.filename = filename
+        self.every = max(1, int(every))
+        self.last = 0
+        self.__thread = None
+        self.__error = None
+        self.__journal = None
+        self.__entries = []
+
+    def due(self, t):
+        """
+        Whether a checkpoint is due after a slot.
+
+        :param t: the slot completed, from the start of the simulation
+        :return: True if a checkpoint is due
+        """
+        return t + 1 - self.last >= self.every
+
+    def save(self, client, scheduler, t):
+        """
+        Capture the state of the simulation and write it in the background.
+
+        :param client: the simulation client
+        :param scheduler: the EventScheduler object
+        :param t: the slot completed, from the start of the simulation
+        """
+        last, self.last = self.last, t + 1
+        state = {
+            "version": VERSION,
+            "created": time.time(),
+            "simulation": client.config["simulation"].get("name"),
+            "agents": [
+                dict(agent.state(), feed_url=getattr(agent, "feed_url", None))
+                for agent in client.agents.agents
+            ],
+            "pages": [agent.name for agent in client.pages],
+            "scheduler": scheduler.state(),
+            "random": random.getstate(),
+            "numpy": np.random.get_state(legacy=False),
+        }
+        state["numpy"]["state"]["key"] = encode_array(state["numpy"]["state"]["key"])
+
+        # one write at a time: the previous one has completed
+        if self.wait():
+            # the journal entries before the checkpoint on disk are not needed anymore
+            self.__entries = [e for e in self.__entries if e[0] >= last]
+            self.__rewrite()
+        self.__thread = threading.Thread(target=self.__write, args=(state,), daemon=True)
+        self.__thread.start()
+
+    def __write(self, state):
+        """
+        Encode and atomically write a checkpoint.
+
+        :param state: the checkpoint state
+        """
+        try:
+            payload = zlib.compress(
+                json.dumps(state, separators=(",", ":")).encode("utf-8"), 6
+            )
+            header = HEADER.pack(MAGIC, VERSION, 0, len(payload), zlib.crc32(payload))
+
+            tmp = f"{self.filename}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(header)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.filename)
+        except Exception as e:
+            self.__error = e
+
+    def wait(self):
+        """
+        Wait for the checkpoint being written.
+
+        :return: True if a checkpoint was written, False if none was pending or its write failed
+        """
+        if self.__thread is None:
+            return False
+        self.__thread.join()
+        self.__thread = None
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            print(f"Error writing the checkpoint {self.filename}: {error}")
+            return False
+        return True
+
+    def record(self, entry):
+        """
+        Append an entry to the journal, written to disk before the simulation goes on.
+
+        :param entry: the [slot, event kind, key] entry
+        """
+        if self.__journal is None:
+            # the journal of a previous simulation is replaced on the first entry
+            self.__journal = open(f"{self.filename}.journal", "w")
+        self.__entries.append(entry)
+        self.__journal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.__journal.flush()
+        os.fsync(self.__journal.fileno())
+
+    def __rewrite(self):
+        """
+        Atomically replace the journal with the retained entries.
+        """
+        if self.__journal is not None:
+            self.__journal.close()
+        tmp = f"{self.filename}.journal.tmp"
+        with open(tmp, "w") as f:
+            for entry in self.__entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, f"{self.filename}.journal")
+        self.__journal = open(f"{self.filename}.journal", "a")
@@ -0,0 +1,114 @@
+from y_client.classes.llm_backend import extract_json, normalize_answer
+from y_client.classes.prompt_templates import compile_template
+
+__all__ = ["Decision", "DecisionBatch"]
+
+
+class Decision(object):
+    def __init__(self, message, answers):
+        """
+        A short decision requested to the agent LLM (e.g., YES/NO).
+
+        :param message: the Handler request
+        :param answers: the admissible answers, in order of precedence
+        """
+        self.message = message
+        self.answers = answers
+        self.answer = None
+
+    def parse(self, text):
+        """
+        Set the answer from a free text LLM answer.
+
+        :param text: the LLM answer
+        :return: the answer, None if the text holds no admissible answer
+        """
+        tokens = normalize_answer(text).split()
+        for a in self.answers:
+            if a in tokens:
+                self.answer = a
+                return a
+        return None
+
+
+class DecisionBatch(object):
+    def __init__(
+        self, llm, name, system_message, handler_message, batch_message, llm_config
+    ):
+        """
+        Resolve the pending decisions of an agent with a single LLM call.
+
+        The decisions are numbered and the LLM answers with a JSON object mapping
+        each number to its answer. Decisions whose answer is missing or not
+        admissible are resolved one by one, as separate requests.
+
+        :param llm: the LLMBackend object
+        :param name: the agent name
+        :param system_message: the agent system prompt
+        :param handler_message: the Handler system prompt
+        :param batch_message: the Handler request template, with a {requests} placeholder
+        :param llm_config: the agent LLM configuration
+        """
+        self.llm = llm
+        self.name = name
+        self.system_message = system_message
+        self.handler_message = handler_message
+        self.batch_message = batch_message
+        self.llm_config = llm_config
+        self.decisions = []
+
+    def add(self, message, answers=("YES", "NO")):
+        """
+        Add a decision to the batch.
+
+        :param message: the Handler request
+        :param answers: the admissible answers, in order of precedence
+        :return: the Decision object, whose answer is set by resolve()
+        """
+        decision = Decision(message, list(answers))
+        self.decisions.append(decision)
+        return decision
+
+    def resolve(self):
+        """
+        Resolve the pending decisions.
+
+        :return: the list of answers, None for the unresolved decisions
+        """
+        if len(self.decisions) > 1:
+            requests = "\n\n".join(
+                f"##REQUEST {i + 1}##\n{d.message}\n Answer with one among: {', '.join(d.answers)}."
+                for i, d in enumerate(self.decisions)
+            )
+            text, _ = self.llm.converse(
+                self.name,
+                system_message=self.system_message,
+                handler_message=self.handler_message,
+                message=compile_template(self.batch_message).render(requests=requests),
+                llm_config=self.llm_config,
+                annotate=False,
+            )
+
+            res = extract_json(text)
+            if isinstance(res, dict):
+                answers = {str(k).strip(): v for k, v in res.items()}
+                for i, d in enumerate(self.decisions):
+                    answer = answers.get(str(i + 1))
+                    if isinstance(answer, str):
+                        d.parse(answer)
+
+        # single requests: a lone decision, or a batch answer that could not be mapped
+        for d in self.decisions:
+            if d.answer is None:
+                text, _ = self.llm.converse(
+                    self.name,
+                    system_message=self.system_message,
+                    handler_message=self.handler_message,
+                    message=d.message,
+                    llm_config=self.llm_config,
+                    annotate=False,
+                    answers=d.answers,
+                )
+                d.parse(text)
+
+        return [d.answer for d in self.decisions]
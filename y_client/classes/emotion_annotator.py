@@ -0,0 +1,236 @@
+import re
+import json
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+
+__all__ = ["EmotionAnnotator", "LexiconEmotionAnnotator", "get_emotion_annotator"]
+
+
+# cue words of the GoEmotions labels ("amaz*" matches amazing, amazed, ...)
+DEFAULT_LEXICON = {
+    "admiration": ["admir*", "amaz*", "awesom*", "brilliant", "impress*", "incredibl*", "genius", "respect", "talent", "outstand*", "remarkabl*", "wonderful", "inspir*", "legend", "masterpiec*"],
+    "amusement": ["lol", "lmao", "rofl", "haha*", "funny", "hilarious", "joke", "laugh", "amus*", "lmfao", "comedy", "silly", "😂", "🤣"],
+    "anger": ["anger", "angry", "furious", "rage", "outrag*", "mad", "hate", "livid", "pissed", "infuriat*", "enrag*", "damn", "😡", "🤬"],
+    "annoyance": ["annoy*", "irritat*", "ugh", "frustrat*", "tired", "sick", "bother", "sigh", "meh", "whatever", "seriously", "smh", "🙄"],
+    "approval": ["agre*", "approv*", "right", "correct", "exactly", "support", "yes", "true", "indeed", "valid", "fair", "absolutely", "👍"],
+    "caring": ["care", "caring", "hug", "help", "support", "hope", "safe", "heal", "comfort", "kind", "gentle", "protect", "take care", "🤗"],
+    "confusion": ["confus*", "understand", "unclear", "puzzl*", "huh", "weird", "strange", "wonder", "baffl*", "lost", "makes no sense", "🤔"],
+    "curiosity": ["curious", "wonder", "interest*", "why", "how", "question", "learn*", "explor*", "discover*", "intrigu*", "fascinat*", "what if", "🧐"],
+    "desire": ["want", "wish", "desir*", "crav*", "need", "long", "dream", "hungry", "eager", "would love", "can't wait"],
+    "disappointment": ["disappoint*", "letdown", "let down", "fail", "unfortunat*", "shame", "pity", "sadly", "expected more", "underwhelm", "meh", "😞"],
+    "disapproval": ["disagre*", "disapprov*", "wrong", "bad", "terribl*", "awful", "unacceptabl*", "against", "reject", "nonsens*", "ridiculous", "stupid", "👎"],
+    "disgust": ["disgust*", "gross", "nasty", "vile", "sicken*", "revolt*", "repuls*", "yuck", "ew", "eww", "filthy", "horrid", "🤢", "🤮"],
+    "embarrassment": ["embarrass*", "awkward", "cring*", "ashamed", "humiliat*", "blush", "oops", "facepalm", "mortif*", "😳"],
+    "excitement": ["excit*", "thrill*", "can't wait", "hyped", "hype", "pumped", "wow", "omg", "yay", "woohoo", "stoked", "finally", "🎉", "🔥"],
+    "fear": ["fear", "afraid", "scar*", "terrif*", "horror", "frighten*", "panic", "dread", "threat", "danger", "creepy", "😱", "😨"],
+    "gratitude": ["thank*", "thanks", "grateful", "gratitud*", "appreciat*", "thx", "bless", "🙏"],
+    "grief": ["grief", "griev*", "mourn", "loss", "died", "death", "funeral", "passed away", "rip", "heartbroken", "miss him", "miss her"],
+    "joy": ["happy", "happi*", "joy", "glad", "delight*", "fun", "enjoy*", "great", "love it", "cheer*", "smile", "beautiful", "😊", "😀", "😄"],
+    "love": ["love", "lov*", "ador*", "darling", "sweetheart", "beloved", "romanc*", "heart", "crush", "❤", "😍", "🥰"],
+    "nervousness": ["nervous", "anxious", "anxiety", "worri*", "worry", "uneasy", "stress*", "tense", "jittery", "restless", "😬"],
+    "optimism": ["optimis*", "hope", "hopeful", "better", "future", "believe", "positive", "bright", "soon", "will be fine", "improve", "chance"],
+    "pride": ["proud", "pride", "accomplish*", "achiev*", "honor", "honour", "earned", "victory", "won", "champion", "🏆"],
+    "realization": ["realiz*", "realis*", "notic*", "turns out", "now i see", "i see", "aha", "learned", "figured", "understood", "apparently"],
+    "relief": ["relief", "reliev*", "phew", "finally", "thank god", "safe now", "calm", "rest", "over at last", "😌"],
+    "remorse": ["sorry", "apolog*", "regret*", "remors*", "guilt", "my bad", "forgive", "mistake", "my fault"],
+    "sadness": ["sad", "sadness", "unhappy", "depress*", "cry", "tear", "lonely", "miserabl*", "gloom", "hurt", "sorrow", "😢", "😭"],
+    "surprise": ["surpris*", "shock*", "unexpect*", "whoa", "wow", "omg", "unbeliev*", "astonish*", "no way", "wait what", "😮", "😲"],
+    "trust": ["trust", "reliabl*", "honest", "faith", "confiden*", "depend*", "loyal", "credibl*", "sure", "certain", "count on"],
+}
+
+
+class EmotionAnnotator(ABC):
+    def annotate(self, text):
+        """
+        Annotate a text with the emotions it elicits.
+
+        :param text: the text
+        :return: the list of emotions
+        """
+        return self.annotate_batch([text])[0]
+
+    @abstractmethod
+    def annotate_batch(self, texts):
+        """
+        Annotate a list of texts with the emotions they elicit.
+
+        :param texts: the list of texts
+        :return: the list of emotions of each text
+        """
+
+
+class LexiconEmotionAnnotator(EmotionAnnotator):
+    def __init__(self, labels, lexicon=None, min_score=1.0, max_labels=3):
+        """
+        Offline, lexicon-based emotion annotator.
+
+        Each lexicon cue is a word (also matching its -s/-ed/-ing forms), a stem
+        ending with "*" (matching the words it prefixes) or a multi-word phrase.
+        A text gets the labels with the highest number of matching cues, at least
+        min_score and at most max_labels of them.
+
+        :param labels: the admissible emotion labels (e.g., the keys of config["posts"]["emotions"])
+        :param lexicon: the cues of each label, {label: [cue, ...]}, None for the default one
+        :param min_score: the minimum score of an assigned label
+        :param max_labels: the maximum number of labels per text
+        """
+        self.labels = [l for l in labels]
+        self.min_score = min_score
+        self.max_labels = max_labels
+
+        lexicon = lexicon if lexicon is not None else DEFAULT_LEXICON
+        label_index = {l: i for i, l in enumerate(self.labels)}
+
+        # words, stems and phrases to the rows of the cue-label weight matrix (row 0: no cue)
+        self.__words = {}
+        self.__stems = {}
+        self.__phrases = {}
+        rows = [np.zeros(len(self.labels))]
+        for label, cues in lexicon.items():
+            if label not in label_index:
+                continue
+            for cue in cues:
+                cue = cue.lower()
+                if " " in cue:
+                    table = self.__phrases
+                elif cue.endswith("*"):
+                    table, cue = self.__stems, cue[:-1]
+                else:
+                    table = self.__words
+                if cue not in table:
+                    table[cue] = len(rows)
+                    rows.append(np.zeros(len(self.labels)))
+                rows[table[cue]][label_index[label]] = 1.0
+        self.__weights = np.vstack(rows)
+
+        self.__max_stem = max([len(s) for s in self.__stems] + [1])
+        self.__token_re = re.compile(r"[a-z']+|[☀-➿\U0001F300-\U0001FAFF]")
+        self.__cue_cache = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the annotator from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the LexiconEmotionAnnotator object
+        """
+        posts = config["posts"]
+        lexicon = None
+        if posts.get("emotion_lexicon") is not None:
+            with open(posts["emotion_lexicon"], "r") as f:
+                lexicon = json.load(f)
+
+        return cls(
+            list(posts["emotions"]),
+            lexicon=lexicon,
+            min_score=float(posts.get("emotion_min_score", 1.0)),
+            max_labels=int(posts.get("emotion_max_labels", 3)),
+        )
+
+    def __base_forms(self, token):
+        """
+        Get the candidate base forms of an inflected token (-s, -es, -ed, -ing).
+
+        :param token: the lowercase token
+        :return: the list of base forms
+        """
+        if token.endswith("ing"):
+            forms = [token[:-3], token[:-3] + "e"]
+        elif token.endswith("ed") or token.endswith("es"):
+            forms = [token[:-2], token[:-1]]
+        elif token.endswith("s"):
+            forms = [token[:-1]]
+        else:
+            forms = []
+        return [f for f in forms if len(f) >= 3]
+
+    def __cue(self, token):
+        """
+        Get the cue row matching a token: the token (or its base form) or its longest stem.
+
+        :param token: the lowercase token
+        :return: the row of the weight matrix, 0 if the token matches no cue
+        """
+        row = self.__cue_cache.get(token)
+        if row is None:
+            row = 0
+            for form in [token] + self.__base_forms(token):
+                row = self.__words.get(form, 0)
+                if row > 0:
+                    break
+            if row == 0:
+                for n in range(min(len(token), self.__max_stem), 1, -1):
+                    row = self.__stems.get(token[:n], 0)
+                    if row > 0:
+                        break
+            # bounded: the vocabulary of a long simulation keeps growing
+            if len(self.__cue_cache) >= 100000:
+                self.__cue_cache.clear()
+            self.__cue_cache[token] = row
+        return row
+
+    def annotate_batch(self, texts):
+        """
+        Annotate a list of texts with the emotions they elicit.
+
+        :param texts: the list of texts
+        :return: the list of emotions of each text
+        """
+        if len(texts) == 0:
+            return []
+
+        # (text index, cue row) pairs of all the texts
+        docs, cues = [], []
+        for i, text in enumerate(texts):
+            text = str(text).lower()
+            for token in self.__token_re.findall(text):
+                row = self.__cue(token)
+                if row > 0:
+                    docs.append(i)
+                    cues.append(row)
+            for phrase, row in self.__phrases.items():
+                n = text.count(phrase)
+                if n > 0:
+                    docs.extend([i] * n)
+                    cues.extend([row] * n)
+
+        scores = np.zeros((len(texts), len(self.labels)))
+        if len(cues) > 0:
+            np.add.at(scores, np.array(docs), self.__weights[np.array(cues)])
+
+        # top labels of each text, highest score first (ties: label order)
+        k = min(self.max_labels, len(self.labels))
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        selected = top_scores >= self.min_score
+
+        return [
+            [self.labels[j] for j, s in zip(top[i], selected[i]) if s]
+            for i in range(len(texts))
+        ]
+
+
+_annotators = {}
+_annotators_lock = threading.Lock()
+
+
+def get_emotion_annotator(config):
+    """
+    Get the emotion annotator of the configuration, shared by all the agents.
+
+    :param config: the configuration dictionary
+    :return: the EmotionAnnotator object, None when the emotions are annotated by the LLM Handler
+    """
+    kind = config["posts"].get("emotion_annotator", "llm")
+    if kind == "llm":
+        return None
+    if kind != "lexicon":
+        raise ValueError(f"Unknown emotion annotator: {kind}")
+
+    key = (kind, config["posts"].get("emotion_lexicon"))
+    with _annotators_lock:
+        if key not in _annotators:
+            _annotators[key] = LexiconEmotionAnnotator.from_config(config)
+        return _annotators[key]
@@ -0,0 +1,184 @@
+import sqlite3
+import hashlib
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+__all__ = [
+    "ImageDescriptionCache",
+    "normalize_image_url",
+    "get_image_description_cache",
+]
+
+
+# query parameters that do not change the image (tracking, cache busting)
+IGNORED_QUERY_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "cb", "_"}
+
+
+def normalize_image_url(url):
+    """
+    Normalize an image url, so that the urls of the same image share their cache entry:
+    lowercase scheme and host, no default port, no fragment, no tracking
+    parameters and sorted query parameters.
+
+    :param url: the image url
+    :return: the normalized url
+    """
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and (scheme, parts.port) not in (
+        ("http", 80),
+        ("https", 443),
+    ):
+        host = f"{host}:{parts.port}"
+
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in IGNORED_QUERY_PARAMS and not k.lower().startswith("utm_")
+    ]
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(sorted(query)), ""))
+
+
+class ImageDescriptionCache(object):
+    def __init__(self, path=None):
+        """
+        Persistent (SQLite) cache of the image descriptions of the vision model.
+
+        Descriptions are keyed by vision model and image key (the normalized image
+        url, see normalize_image_url), so that an image is described once, whatever
+        the article (and Images row) it comes from. With a file, the descriptions
+        are shared across experiments.
+
+        :param path: the SQLite file, None for an in-memory cache of the current run
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self.__lock = threading.Lock()
+        self.__pending = {}
+        self.__conn = sqlite3.connect(
+            path if path is not None else ":memory:", check_same_thread=False
+        )
+        if path is not None:
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            "key TEXT PRIMARY KEY, model TEXT, image TEXT, description TEXT, created REAL)"
+        )
+        self.__conn.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the cache from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the ImageDescriptionCache object
+        """
+        return cls(config["servers"].get("llm_v_cache"))
+
+    def key(self, image, model):
+        """
+        Compute the cache key of an image description.
+
+        :param image: the image key (normalized url)
+        :param model: the vision model
+        :return: the cache key
+        """
+        return hashlib.sha256(f"{model}|{image}".encode("utf-8")).hexdigest()
+
+    def get(self, image, model):
+        """
+        Get the description of an image.
+
+        :param image: the image key (normalized url)
+        :param model: the vision model
+        :return: the description, None if the image was never described
+        """
+        key = self.key(image, model)
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT description FROM descriptions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, image, model, description):
+        """
+        Record the description of an image.
+
+        :param image: the image key (normalized url)
+        :param model: the vision model
+        :param description: the description
+        """
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO descriptions (key, model, image, description, created) VALUES (?, ?, ?, ?, ?)",
+                (self.key(image, model), str(model), image, description, time.time()),
+            )
+            self.__conn.commit()
+
+    def describe(self, image, model, annotate):
+        """
+        Get the description of an image, computing it on a miss. Concurrent
+        requests for the same image wait for a single annotation.
+
+        :param image: the image key (normalized url)
+        :param model: the vision model
+        :param annotate: the function computing the description of the image
+        :return: the description
+        """
+        key = self.key(image, model)
+        while True:
+            description = self.get(image, model)
+            if description is not None:
+                return description
+
+            with self.__lock:
+                pending = self.__pending.get(key)
+                if pending is None:
+                    pending = self.__pending[key] = threading.Event()
+                    break
+            # another thread is describing the image: wait for it, then read the cache
+            pending.wait()
+
+        try:
+            description = annotate()
+            if description is not None:
+                self.put(image, model, description)
+            return description
+        finally:
+            with self.__lock:
+                del self.__pending[key]
+            pending.set()
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        with self.__lock:
+            self.__conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_description_cache(config):
+    """
+    Get the image description cache shared by all the agents of the simulation.
+
+    :param config: the configuration dictionary, used to open the cache on first use
+    :return: the ImageDescriptionCache object
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageDescriptionCache.from_config(config)
+        return _cache
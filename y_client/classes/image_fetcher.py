@@ -0,0 +1,190 @@
+import os
+import io
+import hashlib
+import threading
+import requests
+from PIL import Image
+from y_client.classes.image_descriptions import normalize_image_url
+
+__all__ = ["ImageFetcher", "get_image_fetcher"]
+
+
+class ImageFetcher(object):
+    def __init__(
+        self, cache_dir, max_size=768, quality=85, max_bytes=20000000, timeout=10
+    ):
+        """
+        Fetch the images for the vision model once, and keep them small.
+
+        Each image is downloaded once, validated, downscaled to at most max_size
+        pixels per side and stored as JPEG in a content-addressed cache
+        (cache_dir/objects/<sha256 of the original bytes>.jpg), so that the same
+        image reached through different urls is stored once. The urls already
+        fetched are indexed in cache_dir/urls. Images that cannot be fetched or
+        decoded are remembered for the run and never sent to the vision model.
+
+        :param cache_dir: the cache directory
+        :param max_size: the maximum width and height of the stored images
+        :param quality: the JPEG quality of the stored images
+        :param max_bytes: the maximum size of a downloaded image
+        :param timeout: the download timeout in seconds
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.fetched = 0
+        self.failed = 0
+
+        self.__lock = threading.Lock()
+        self.__failed = set()
+        self.__http = requests.Session()
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the fetcher from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the ImageFetcher object, None if the image cache is not configured
+        """
+        servers = config["servers"]
+        if servers.get("llm_v_image_cache") is None:
+            return None
+
+        return cls(
+            servers["llm_v_image_cache"],
+            max_size=int(servers.get("llm_v_image_max_size", 768)),
+            quality=int(servers.get("llm_v_image_quality", 85)),
+            max_bytes=int(servers.get("llm_v_image_max_bytes", 20000000)),
+        )
+
+    def path(self, digest):
+        """
+        Get the file of a cached image.
+
+        :param digest: the image digest
+        :return: the file path
+        """
+        return os.path.join(self.cache_dir, "objects", digest[:2], f"{digest}.jpg")
+
+    def __write(self, path, content):
+        """
+        Atomically write a cache file.
+
+        :param path: the file path
+        :param content: the file content (bytes)
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def __download(self, url):
+        """
+        Download an image, up to max_bytes.
+
+        :param url: the image url
+        :return: the image bytes
+        """
+        with self.__http.get(url, stream=True, timeout=self.timeout) as res:
+            res.raise_for_status()
+            chunks, size = [], 0
+            for chunk in res.iter_content(chunk_size=65536):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(f"Image larger than {self.max_bytes} bytes")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def __downscale(self, content):
+        """
+        Validate and downscale an image.
+
+        :param content: the original image bytes
+        :return: the JPEG bytes of the downscaled image
+        """
+        Image.open(io.BytesIO(content)).verify()
+
+        img = Image.open(io.BytesIO(content))
+        # JPEG images are decoded directly at a reduced scale
+        img.draft("RGB", (self.max_size, self.max_size))
+        img = img.convert("RGB")
+        img.thumbnail((self.max_size, self.max_size))
+
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=self.quality, optimize=True)
+        return out.getvalue()
+
+    def fetch(self, url):
+        """
+        Fetch an image into the cache.
+
+        :param url: the image url
+        :return: the image digest, None if the image cannot be fetched or decoded
+        """
+        norm = normalize_image_url(url)
+        with self.__lock:
+            if norm in self.__failed:
+                return None
+
+        index = os.path.join(
+            self.cache_dir, "urls", hashlib.sha256(norm.encode("utf-8")).hexdigest()
+        )
+        if os.path.exists(index):
+            with open(index, "r") as f:
+                digest = f.read().strip()
+            if os.path.exists(self.path(digest)):
+                return digest
+
+        try:
+            content = self.__download(url)
+            digest = hashlib.sha256(content).hexdigest()
+            if not os.path.exists(self.path(digest)):
+                self.__write(self.path(digest), self.__downscale(content))
+        except Exception:
+            with self.__lock:
+                self.__failed.add(norm)
+                self.failed += 1
+            return None
+
+        self.__write(index, digest.encode("utf-8"))
+        with self.__lock:
+            self.fetched += 1
+        return digest
+
+    def load(self, digest):
+        """
+        Load a cached image.
+
+        :param digest: the image digest
+        :return: the PIL image
+        """
+        img = Image.open(self.path(digest))
+        img.load()
+        return img
+
+
+_fetchers = {}
+_fetchers_lock = threading.Lock()
+
+
+def get_image_fetcher(config):
+    """
+    Get the image fetcher shared by all the agents of the simulation.
+
+    :param config: the configuration dictionary
+    :return: the ImageFetcher object, None if the image cache is not configured
+    """
+    key = config["servers"].get("llm_v_image_cache")
+    if key is None:
+        return None
+
+    with _fetchers_lock:
+        if key not in _fetchers:
+            _fetchers[key] = ImageFetcher.from_config(config)
+        return _fetchers[key]
@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from y_client.news_feeds.client_modals import Images, session
+from y_client.classes.llm_scheduler import BACKGROUND
+from y_client.classes.image_descriptions import normalize_image_url
+
+__all__ = ["ImagePreAnnotator"]
+
+
+class ImagePreAnnotator(object):
+    def __init__(self, annotator, workers=2, batch_size=20):
+        """
+        Background annotation of the images still without a description.
+
+        A driver thread walks the Images rows whose description is NULL, has the
+        images described by a pool of workers (one vision request per distinct
+        image, at BACKGROUND priority) and commits the descriptions in batches.
+        The agents then find the images already described.
+
+        :param annotator: the (shared) Annotator object
+        :param workers: the maximum number of concurrent vision requests
+        :param batch_size: the number of described images per commit
+        """
+        self.annotator = annotator
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.annotated = 0
+        self.failed = 0
+
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """
+        Start annotating the images in the background (no-op if already running).
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="image-preannotator", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stop annotating: the requests already sent complete and are committed.
+
+        :param wait: whether to wait for the driver thread to exit
+        """
+        self.__stop.set()
+        if wait and self.__thread is not None:
+            self.__thread.join()
+
+    def running(self):
+        """
+        Check whether the images are still being annotated.
+
+        :return: True if the driver thread is running
+        """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def __describe(self, url):
+        """
+        Describe an image, unless the annotation was stopped.
+
+        :param url: the image url
+        :return: the description, None if stopped or failed
+        """
+        if self.__stop.is_set():
+            return None
+        try:
+            return self.annotator.describe(url, priority=BACKGROUND)
+        except Exception:
+            # the agents annotate the image lazily when they select it
+            return None
+
+    def __run(self):
+        """
+        Annotate the images without a description, committing in batches.
+        """
+        try:
+            rows = (
+                session.query(Images.id, Images.url)
+                .filter(Images.description.is_(None))
+                .filter(Images.url.isnot(None))
+                .all()
+            )
+
+            # rows sharing an image are described once
+            images = {}
+            for rid, url in rows:
+                images.setdefault(normalize_image_url(url), (url, []))[1].append(rid)
+
+            pending = 0
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    executor.submit(self.__describe, url): ids
+                    for url, ids in images.values()
+                }
+                for future in as_completed(futures):
+                    description = future.result()
+                    if description is None:
+                        self.failed += 1
+                        continue
+
+                    # the agents may have described the image in the meantime
+                    session.query(Images).filter(
+                        Images.id.in_(futures[future]), Images.description.is_(None)
+                    ).update({"description": description}, synchronize_session=False)
+                    self.annotated += 1
+                    pending += 1
+                    if pending >= self.batch_size:
+                        session.commit()
+                        pending = 0
+            session.commit()
+        finally:
+            session.remove()
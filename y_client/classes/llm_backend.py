@@ -0,0 +1,497 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+from abc import ABC, abstractmethod
+from y_client.classes.llm_scheduler import (
+    get_llm_scheduler,
+    LLMRequestShed,
+    LLMRequestTimeout,
+    DECISION,
+    GENERATION,
+)
+from y_client.classes.llm_cache import get_llm_cache
+from y_client.classes.llm_router import get_llm_router
+
+__all__ = [
+    "LLMBackend",
+    "OpenAIBackend",
+    "AutogenBackend",
+    "get_llm_backend",
+    "extract_json",
+    "match_answer",
+    "normalize_answer",
+]
+
+# the punctuation around the answer words of a decision (e.g., "YES.", "LEFT:")
+ANSWER_PUNCTUATION = str.maketrans({c: " " for c in "!.,:;?\"'`*()[]{}"})
+
+
+class LLMBackend(ABC):
+    def __init__(
+        self,
+        base_url,
+        api_key="NULL",
+        timeout=10000,
+        scheduler=None,
+        cache=None,
+        router=None,
+    ):
+        """
+        Chat completion backend for an OpenAI-compatible LLM server.
+
+        :param base_url: the base url of the LLM server, or the list of the urls of several servers
+        :param api_key: the LLM server api key
+        :param timeout: the request timeout in seconds
+        :param scheduler: the LLMScheduler limiting the in-flight requests, None for no limits
+        :param cache: the LLMCache of the responses, None for no cache
+        :param router: the LLMRouter balancing the requests over several servers
+        """
+        self.endpoints = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.base_url = self.endpoints[0]
+        self.api_key = api_key
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.cache = cache
+        self.router = router
+
+    def action(self, name):
+        """
+        Set the action issuing the LLM requests of the current thread
+        (used by the scheduler for deadlines and load shedding).
+
+        :param name: the action name
+        :return: the context manager
+        """
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.action(name)
+
+    def route(self, llm_config):
+        """
+        Select the endpoint of a request.
+
+        :param llm_config: the agent LLM configuration
+        :return: the endpoint url
+        """
+        if self.router is None:
+            return self.base_url
+        return self.router.select(llm_config["config_list"][0]["model"])
+
+    def release(self, endpoint, latency=None, failed=False):
+        """
+        Record the outcome of a request on its endpoint.
+
+        :param endpoint: the endpoint url
+        :param latency: the request latency in seconds, None if the request was not sent
+        :param failed: whether the request failed
+        """
+        if self.router is not None:
+            self.router.release(endpoint, latency=latency, failed=failed)
+
+    def slot(self, endpoint, llm_config, priority=GENERATION):
+        """
+        Wait for a scheduler slot for a request.
+
+        :param endpoint: the endpoint url
+        :param llm_config: the agent LLM configuration
+        :param priority: the request priority, DECISION or GENERATION
+        :return: the context manager, yielding the time left before the request deadline
+        """
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(
+            endpoint, llm_config["config_list"][0]["model"], priority=priority
+        )
+
+    def chat(self, messages, llm_config, priority=GENERATION, answers=None):
+        """
+        Run a chat completion.
+
+        :param messages: the list of {"role", "content"} messages
+        :param llm_config: the agent LLM configuration (model, temperature, max_tokens, seed)
+        :param priority: the request priority, DECISION or GENERATION
+        :param answers: the admissible answers of a decision, the backend may stop at the first one
+        :return: the generated text (the first admissible answer when stopped early)
+        """
+        if self.cache is not None:
+            entry, text = self.cache.lookup(messages, llm_config)
+            if text is not None:
+                return text
+
+        endpoint = self.route(llm_config)
+        try:
+            with self.slot(endpoint, llm_config, priority=priority) as remaining:
+                start = time.monotonic()
+                text = self._complete(
+                    endpoint, messages, llm_config, timeout=remaining, answers=answers
+                )
+        except LLMRequestTimeout:
+            # a hung endpoint times out every request: counted for its ejection
+            self.release(endpoint, failed=True)
+            raise
+        except LLMRequestShed:
+            self.release(endpoint)
+            raise
+        except Exception:
+            self.release(endpoint, failed=True)
+            raise
+        self.release(endpoint, latency=time.monotonic() - start)
+
+        if self.cache is not None:
+            self.cache.store(entry, text)
+        return text
+
+    @abstractmethod
+    def _complete(self, endpoint, messages, llm_config, timeout=None, answers=None):
+        """
+        Send a chat completion request.
+
+        :param endpoint: the endpoint url
+        :param messages: the list of {"role", "content"} messages
+        :param llm_config: the agent LLM configuration
+        :param timeout: the request timeout in seconds, None for the backend one
+        :param answers: the admissible answers of a decision, None for a text generation
+        :return: the generated text
+        """
+
+    def converse(
+        self,
+        name,
+        system_message,
+        handler_message,
+        message,
+        llm_config,
+        annotate=True,
+        handler_llm_config=None,
+        answers=None,
+    ):
+        """
+        Run the Handler/agent exchange used by the agents' actions.
+        The agent answers the Handler message; if requested, the Handler then
+        annotates the agent answer (e.g., with the emotions it elicits).
+
+        :param name: the agent name
+        :param system_message: the agent system prompt
+        :param handler_message: the Handler system prompt
+        :param message: the Handler request
+        :param llm_config: the agent LLM configuration
+        :param annotate: whether the Handler annotates the agent answer
+        :param handler_llm_config: the LLM configuration of the Handler annotation, None to use llm_config
+        :param answers: the admissible answers of a decision (annotate=False), the backend may stop at the first one
+        :return: the agent answer and the Handler annotation (None if not requested)
+        """
+        text = self.chat(
+            [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": message},
+            ],
+            llm_config,
+            priority=GENERATION if annotate else DECISION,
+            answers=None if annotate else answers,
+        )
+        if not annotate:
+            return text, None
+
+        annotation = self.chat(
+            [
+                {"role": "system", "content": handler_message},
+                {"role": "assistant", "content": message},
+                {"role": "user", "content": text},
+            ],
+            handler_llm_config if handler_llm_config is not None else llm_config,
+        )
+        return text, annotation
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(
+        self,
+        base_url,
+        api_key="NULL",
+        timeout=10000,
+        scheduler=None,
+        cache=None,
+        router=None,
+        stream_decisions=False,
+        stream_max_chunks=None,
+    ):
+        """
+        Direct chat completion calls through a single, reusable OpenAI client per server.
+
+        With stream_decisions, the completions of the decisions are streamed and
+        closed as soon as an admissible answer appears (or after stream_max_chunks
+        chunks), instead of waiting for the whole completion.
+
+        :param base_url: the base url of the LLM server, or the list of the urls of several servers
+        :param api_key: the LLM server api key
+        :param timeout: the request timeout in seconds
+        :param scheduler: the LLMScheduler limiting the in-flight requests, None for no limits
+        :param cache: the LLMCache of the responses, None for no cache
+        :param router: the LLMRouter balancing the requests over several servers
+        :param stream_decisions: whether to stream the decisions and stop at the first admissible answer
+        :param stream_max_chunks: the maximum number of streamed chunks of a decision, None for no limit
+        """
+        super().__init__(
+            base_url,
+            api_key=api_key,
+            timeout=timeout,
+            scheduler=scheduler,
+            cache=cache,
+            router=router,
+        )
+        import openai
+
+        self.openai = openai
+        self.stream_decisions = stream_decisions
+        self.stream_max_chunks = stream_max_chunks
+        self.clients = {
+            e: openai.OpenAI(base_url=e, api_key=api_key, timeout=timeout)
+            for e in self.endpoints
+        }
+
+    def _complete(self, endpoint, messages, llm_config, timeout=None, answers=None):
+        """
+        Send a chat completion request.
+
+        :param endpoint: the endpoint url
+        :param messages: the list of {"role", "content"} messages
+        :param llm_config: the agent LLM configuration (model, temperature, max_tokens, seed)
+        :param timeout: the request timeout in seconds, None for the backend one
+        :param answers: the admissible answers of a decision, None for a text generation
+        :return: the generated text
+        """
+        params = {
+            "model": llm_config["config_list"][0]["model"],
+            "messages": messages,
+        }
+        if llm_config.get("temperature") is not None:
+            params["temperature"] = float(llm_config["temperature"])
+        # -1: no limits
+        if llm_config.get("max_tokens") is not None and int(llm_config["max_tokens"]) > 0:
+            params["max_tokens"] = int(llm_config["max_tokens"])
+        if llm_config.get("seed") is not None:
+            params["seed"] = int(llm_config["seed"])
+        # generation profiles: stop sequences and constrained output
+        if llm_config.get("stop") is not None:
+            params["stop"] = llm_config["stop"]
+        if llm_config.get("response_format") == "json":
+            params["response_format"] = {"type": "json_object"}
+        elif isinstance(llm_config.get("response_format"), dict):
+            params["response_format"] = llm_config["response_format"]
+        if llm_config.get("extra_body") is not None:
+            # server-specific options, e.g. {"guided_choice": ["YES", "NO"]} for vLLM
+            params["extra_body"] = llm_config["extra_body"]
+
+        if timeout is not None:
+            if timeout <= 0:
+                raise LLMRequestShed("LLM request missed its deadline")
+            params["timeout"] = timeout
+
+        try:
+            if answers is not None and self.stream_decisions:
+                return self.__stream(endpoint, params, answers)
+            response = self.clients[endpoint].chat.completions.create(**params)
+        except self.openai.APITimeoutError:
+            if timeout is None:
+                raise
+            raise LLMRequestTimeout("LLM request missed its deadline")
+        content = response.choices[0].message.content
+        return content if content is not None else ""
+
+    def __stream(self, endpoint, params, answers):
+        """
+        Stream a decision completion, and close it at the first admissible answer.
+
+        :param endpoint: the endpoint url
+        :param params: the chat completion parameters
+        :param answers: the admissible answers
+        :return: the first admissible answer, the streamed text if none appeared
+        """
+        stream = self.clients[endpoint].chat.completions.create(stream=True, **params)
+        text, chunks = "", 0
+        try:
+            for chunk in stream:
+                if len(chunk.choices) == 0 or not chunk.choices[0].delta.content:
+                    continue
+                text += chunk.choices[0].delta.content
+                chunks += 1
+
+                answer = match_answer(text, answers, complete=False)
+                if answer is not None:
+                    return answer
+                limit = self.stream_max_chunks
+                if limit is not None and chunks >= limit:
+                    break
+        finally:
+            # closing the connection cancels the generation on the server
+            stream.close()
+        return text
+
+
+class AutogenBackend(LLMBackend):
+    def __init__(
+        self,
+        base_url,
+        api_key="NULL",
+        timeout=10000,
+        scheduler=None,
+        cache=None,
+        router=None,
+    ):
+        """
+        Chat completions sent by the autogen OpenAI client (requires pyautogen).
+        The Handler/agent exchange keeps the layout of the autogen two-agent chat,
+        one completion per turn, through the same cache, scheduler and router as the
+        other backends. Requests are not interrupted at their deadline: it only
+        bounds their wait in the scheduler.
+
+        :param base_url: the base url of the LLM server, or the list of the urls of several servers
+        :param api_key: the LLM server api key
+        :param timeout: the request timeout in seconds
+        :param scheduler: the LLMScheduler limiting the in-flight requests, None for no limits
+        :param cache: the LLMCache of the responses, None for no cache
+        :param router: the LLMRouter balancing the requests over several servers
+        """
+        super().__init__(
+            base_url,
+            api_key=api_key,
+            timeout=timeout,
+            scheduler=scheduler,
+            cache=cache,
+            router=router,
+        )
+        import autogen
+
+        self.autogen = autogen
+
+    def __on_endpoint(self, llm_config, endpoint):
+        """
+        Get the LLM configuration of a request sent to an endpoint.
+
+        :param llm_config: the agent LLM configuration
+        :param endpoint: the endpoint url
+        :return: the LLM configuration
+        """
+        llm_config = dict(llm_config)
+        llm_config["config_list"] = [
+            dict(llm_config["config_list"][0], base_url=endpoint)
+        ]
+        return llm_config
+
+    def _complete(self, endpoint, messages, llm_config, timeout=None, answers=None):
+        """
+        Send a chat completion request.
+
+        :param endpoint: the endpoint url
+        :param messages: the list of {"role", "content"} messages
+        :param llm_config: the agent LLM configuration
+        :param timeout: unused
+        :param answers: unused, the completions are not streamed
+        :return: the generated text
+        """
+        client = self.autogen.OpenAIWrapper(**self.__on_endpoint(llm_config, endpoint))
+        response = client.create(messages=messages)
+        content = client.extract_text_or_completion_object(response)[0]
+        return content if content is not None else ""
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_llm_backend(config, api_key="NULL"):
+    """
+    Get the shared LLM backend for the LLM server(s) in the configuration.
+    A single backend (and client) is kept per backend type, endpoint(s) and api key.
+
+    :param config: the configuration dictionary
+    :param api_key: the LLM server api key
+    :return: the LLMBackend object
+    """
+    servers = config["servers"]
+    backend = servers.get("llm_backend", "openai")
+    endpoints = servers["llm"]
+    key = (
+        backend,
+        endpoints if isinstance(endpoints, str) else tuple(endpoints),
+        api_key,
+    )
+
+    backends = {"openai": OpenAIBackend, "autogen": AutogenBackend}
+    if backend not in backends:
+        raise ValueError(f"Unknown LLM backend: {backend}")
+
+    options = {}
+    if backend == "openai":
+        options["stream_decisions"] = bool(servers.get("llm_stream_decisions", False))
+        if servers.get("llm_stream_max_chunks") is not None:
+            options["stream_max_chunks"] = int(servers["llm_stream_max_chunks"])
+
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = backends[backend](
+                endpoints,
+                api_key=api_key,
+                timeout=float(servers.get("llm_timeout", 10000)),
+                scheduler=get_llm_scheduler(config),
+                cache=get_llm_cache(config),
+                router=get_llm_router(config, endpoints),
+                **options,
+            )
+        return _backends[key]
+
+
+def extract_json(text):
+    """
+    Extract the JSON value from an LLM answer.
+    The answer may wrap it in a markdown code block or in additional text.
+
+    :param text: the LLM answer
+    :return: the decoded JSON value, None if the answer does not contain valid JSON
+    """
+    if text is None:
+        return None
+
+    for start, end in (("{", "}"), ("[", "]")):
+        i, j = text.find(start), text.rfind(end)
+        if i == -1 or j <= i:
+            continue
+        try:
+            return json.loads(text[i : j + 1])
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_answer(text):
+    """
+    Normalize an LLM answer to a decision: upper case, and punctuation replaced
+    by whitespace so that the answer words are whitespace-separated.
+
+    :param text: the LLM answer
+    :return: the normalized answer
+    """
+    return str(text).translate(ANSWER_PUNCTUATION).upper()
+
+
+def match_answer(text, answers, complete=True):
+    """
+    Find the first admissible answer of a decision in an LLM answer, as a
+    word of the normalized answer (case and punctuation ignored).
+
+    :param text: the LLM answer
+    :param answers: the admissible answers
+    :param complete: whether the answer is complete, otherwise its last word may still be growing
+    :return: the admissible answer, None if the answer does not contain any
+    """
+    text = normalize_answer(text)
+    tokens = text.split()
+    if not complete and len(tokens) > 0 and not text[-1].isspace():
+        tokens = tokens[:-1]
+
+    answers = {str(a).upper(): a for a in answers}
+    for t in tokens:
+        if t in answers:
+            return answers[t]
+    return None
@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import Counter
+from y_client.classes.llm_scheduler import LLMRequestShed
+
+__all__ = ["LLMCache", "LLMCacheMiss", "get_llm_cache"]
+
+
+class LLMCacheMiss(LLMRequestShed):
+    """
+    Raised in replay mode when a request has no recorded response.
+    """
+
+    pass
+
+
+class LLMCache(object):
+    def __init__(self, path, mode="read_through", max_entries=1000000, seed=0):
+        """
+        Persistent (SQLite) cache of the LLM responses, for deterministic replays.
+
+        Responses are keyed by model, rendered messages, generation parameters
+        and a replay seed, plus the occurrence of the request in the run: a prompt
+        issued n times gets its n recorded responses back, in order.
+
+        :param path: the SQLite file
+        :param mode: "read_through" (serve hits, record misses), "record" (always call the LLM and record) or "replay" (only serve recorded responses)
+        :param max_entries: the maximum number of cached responses, the least recently used are evicted
+        :param seed: the replay seed, part of the key of every response
+        """
+        if mode not in ("read_through", "record", "replay"):
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.seed = seed
+        self.hits = 0
+        self.misses = 0
+
+        self.__lock = threading.Lock()
+        self.__occurrences = Counter()
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT, occurrence INTEGER, response TEXT, used REAL, "
+            "PRIMARY KEY (key, occurrence))"
+        )
+        self.__conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_used ON responses (used)"
+        )
+        self.__conn.commit()
+        self.__size = self.__conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the cache from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the LLMCache object, None if the cache is not configured
+        """
+        servers = config["servers"]
+        if servers.get("llm_cache") is None:
+            return None
+
+        return cls(
+            servers["llm_cache"],
+            mode=servers.get("llm_cache_mode", "read_through"),
+            max_entries=int(servers.get("llm_cache_max_entries", 1000000)),
+            seed=servers.get("llm_cache_seed", 0),
+        )
+
+    def key(self, messages, llm_config):
+        """
+        Compute the cache key of a request.
+
+        :param messages: the list of {"role", "content"} messages
+        :param llm_config: the agent LLM configuration
+        :return: the cache key
+        """
+        st = json.dumps(
+            {
+                "model": llm_config["config_list"][0]["model"],
+                "messages": messages,
+                "temperature": llm_config.get("temperature"),
+                "max_tokens": llm_config.get("max_tokens"),
+                "stop": llm_config.get("stop"),
+                "response_format": llm_config.get("response_format"),
+                "extra_body": llm_config.get("extra_body"),
+                "seed": self.seed,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(st.encode("utf-8")).hexdigest()
+
+    def lookup(self, messages, llm_config):
+        """
+        Look up the response of a request.
+
+        :param messages: the list of {"role", "content"} messages
+        :param llm_config: the agent LLM configuration
+        :return: the (key, occurrence) of the request and its cached response, None on a miss
+        """
+        key = self.key(messages, llm_config)
+        with self.__lock:
+            occurrence = self.__occurrences[key]
+            self.__occurrences[key] += 1
+
+            if self.mode == "record":
+                return (key, occurrence), None
+
+            row = self.__conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND occurrence = ?",
+                (key, occurrence),
+            ).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.__conn.execute(
+                    "UPDATE responses SET used = ? WHERE key = ? AND occurrence = ?",
+                    (time.time(), key, occurrence),
+                )
+                self.__conn.commit()
+                return (key, occurrence), row[0]
+
+            self.misses += 1
+
+        if self.mode == "replay":
+            raise LLMCacheMiss("LLM response not recorded")
+        return (key, occurrence), None
+
+    def store(self, entry, response):
+        """
+        Record the response of a request.
+
+        :param entry: the (key, occurrence) of the request, as returned by lookup
+        :param response: the LLM response
+        """
+        if self.mode == "replay":
+            return
+
+        key, occurrence = entry
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO responses (key, occurrence, response, used) VALUES (?, ?, ?, ?)",
+                (key, occurrence, response, time.time()),
+            )
+            # upper bound: replaced responses are counted again until the next recount
+            self.__size += 1
+
+            if self.__size > self.max_entries:
+                self.__size = self.__conn.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()[0]
+
+            if self.__size > self.max_entries:
+                # evict the least recently used responses (10% slack to amortize)
+                n = self.__size - int(self.max_entries * 0.9)
+                self.__conn.execute(
+                    "DELETE FROM responses WHERE rowid IN "
+                    "(SELECT rowid FROM responses ORDER BY used LIMIT ?)",
+                    (n,),
+                )
+                self.__size = self.__conn.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()[0]
+            self.__conn.commit()
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        with self.__lock:
+            self.__conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache(config):
+    """
+    Get the LLM response cache shared by all the LLM endpoints of the simulation.
+
+    :param config: the configuration dictionary, used to open the cache on first use
+    :return: the LLMCache object, None if the cache is not configured
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache.from_config(config)
+        return _cache
@@ -0,0 +1,197 @@
+import threading
+import hashlib
+import time
+
+__all__ = ["LLMRouter", "get_llm_router"]
+
+
+class LLMRouter(object):
+    def __init__(
+        self,
+        endpoints,
+        affinity=0,
+        max_failures=3,
+        eject_seconds=30,
+        slow_seconds=None,
+    ):
+        """
+        Route the LLM requests over several endpoints serving the same models.
+
+        Requests go to the healthy endpoint with the least outstanding requests.
+        With model affinity, the requests of a model only go to a fixed subset of
+        the endpoints (chosen by rendezvous hashing), so that each endpoint keeps
+        few models loaded. Endpoints are checked passively: an endpoint failing
+        max_failures consecutive requests, or whose average latency exceeds
+        slow_seconds, is ejected for eject_seconds.
+
+        :param endpoints: the list of endpoint urls
+        :param affinity: the number of endpoints serving each model, 0 to use all of them
+        :param max_failures: the consecutive failures ejecting an endpoint
+        :param eject_seconds: the ejection time in seconds
+        :param slow_seconds: the average latency in seconds ejecting an endpoint, None to never eject slow endpoints
+        """
+        if len(endpoints) == 0:
+            raise ValueError("No LLM endpoints")
+
+        self.endpoints = list(endpoints)
+        self.affinity = affinity
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.slow_seconds = slow_seconds
+
+        self.__lock = threading.Lock()
+        self.__outstanding = {e: 0 for e in self.endpoints}
+        self.__failures = {e: 0 for e in self.endpoints}
+        self.__latency = {e: None for e in self.endpoints}
+        self.__ejected_until = {e: 0.0 for e in self.endpoints}
+        self.__next = 0
+
+    @classmethod
+    def from_config(cls, config, endpoints):
+        """
+        Build the router from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :param endpoints: the list of endpoint urls
+        :return: the LLMRouter object
+        """
+        servers = config["servers"]
+        return cls(
+            endpoints,
+            affinity=int(servers.get("llm_affinity", 0)),
+            max_failures=int(servers.get("llm_max_failures", 3)),
+            eject_seconds=float(servers.get("llm_eject_seconds", 30)),
+            slow_seconds=(
+                float(servers["llm_slow_seconds"])
+                if servers.get("llm_slow_seconds") is not None
+                else None
+            ),
+        )
+
+    def __model_endpoints(self, model):
+        """
+        Get the endpoints serving a model.
+
+        :param model: the model name
+        :return: the list of endpoints
+        """
+        if self.affinity <= 0 or self.affinity >= len(self.endpoints):
+            return self.endpoints
+
+        # rendezvous hashing: stable assignment, minimal changes when endpoints are added
+        ranked = sorted(
+            self.endpoints,
+            key=lambda e: hashlib.md5(f"{model}|{e}".encode("utf-8")).hexdigest(),
+        )
+        return ranked[: self.affinity]
+
+    def select(self, model):
+        """
+        Select the endpoint of a request and count it as outstanding.
+
+        :param model: the model name
+        :return: the endpoint url
+        """
+        now = time.monotonic()
+        with self.__lock:
+            candidates = self.__model_endpoints(model)
+            healthy = [e for e in candidates if self.__ejected_until[e] <= now]
+            if len(healthy) == 0:
+                healthy = [e for e in self.endpoints if self.__ejected_until[e] <= now]
+            if len(healthy) == 0:
+                # everything is ejected: try the endpoint coming back first
+                healthy = [min(self.endpoints, key=lambda e: self.__ejected_until[e])]
+
+            # least outstanding requests, ties broken round robin
+            self.__next += 1
+            n = len(healthy)
+            endpoint = min(
+                (healthy[(self.__next + i) % n] for i in range(n)),
+                key=lambda e: self.__outstanding[e],
+            )
+            self.__outstanding[endpoint] += 1
+            return endpoint
+
+    def release(self, endpoint, latency=None, failed=False):
+        """
+        Record the outcome of a request.
+
+        :param endpoint: the endpoint url
+        :param latency: the request latency in seconds, None if the request was not sent
+        :param failed: whether the request failed
+        """
+        with self.__lock:
+            self.__outstanding[endpoint] -= 1
+
+            if failed:
+                self.__failures[endpoint] += 1
+                if self.__failures[endpoint] >= self.max_failures:
+                    self.__eject(endpoint)
+                return
+
+            # a request not sent (shed) tells nothing of the endpoint
+            if latency is None:
+                return
+
+            self.__failures[endpoint] = 0
+            # exponentially weighted moving average of the latency
+            prev = self.__latency[endpoint]
+            self.__latency[endpoint] = (
+                latency if prev is None else 0.8 * prev + 0.2 * latency
+            )
+            if (
+                self.slow_seconds is not None
+                and self.__latency[endpoint] > self.slow_seconds
+            ):
+                self.__eject(endpoint)
+
+    def __eject(self, endpoint):
+        """
+        Eject an endpoint and reset its statistics for when it comes back.
+
+        :param endpoint: the endpoint url
+        """
+        self.__ejected_until[endpoint] = time.monotonic() + self.eject_seconds
+        self.__failures[endpoint] = 0
+        self.__latency[endpoint] = None
+
+    def status(self):
+        """
+        Get the state of the endpoints.
+
+        :return: {endpoint: {"outstanding", "latency", "ejected"}}
+        """
+        now = time.monotonic()
+        with self.__lock:
+            return {
+                e: {
+                    "outstanding": self.__outstanding[e],
+                    "latency": self.__latency[e],
+                    "ejected": self.__ejected_until[e] > now,
+                }
+                for e in self.endpoints
+            }
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_llm_router(config, endpoints):
+    """
+    Get the router shared by the clients of a list of endpoints.
+
+    :param config: the configuration dictionary
+    :param endpoints: an endpoint url or a list of them
+    :return: the LLMRouter object, None for a single endpoint
+    """
+    if isinstance(endpoints, str):
+        return None
+    if len(endpoints) == 1:
+        return None
+
+    key = tuple(endpoints)
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = LLMRouter.from_config(config, endpoints)
+        return _routers[key]
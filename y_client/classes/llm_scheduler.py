@@ -0,0 +1,237 @@
+import threading
+import itertools
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+__all__ = [
+    "LLMScheduler",
+    "LLMRequestShed",
+    "LLMRequestTimeout",
+    "get_llm_scheduler",
+    "DECISION",
+    "GENERATION",
+    "BACKGROUND",
+]
+
+
+# request priorities: lower values are served first
+DECISION = 0
+GENERATION = 1
+BACKGROUND = 2
+
+
+class LLMRequestShed(Exception):
+    """
+    Raised when an LLM request is shed by the scheduler or misses its deadline.
+    """
+
+    pass
+
+
+class LLMRequestTimeout(LLMRequestShed):
+    """
+    Raised when a sent LLM request times out at its deadline: a failure of its endpoint.
+    """
+
+    pass
+
+
+class LLMScheduler(object):
+    def __init__(
+        self,
+        max_inflight=None,
+        max_inflight_per_model=None,
+        deadlines=None,
+        shed_actions=None,
+        shed_queue_length=0,
+    ):
+        """
+        Admission control for the LLM requests of the agents.
+
+        Limits the in-flight requests per endpoint and per model. Waiting requests
+        are admitted by priority (short decisions before long generations) and in
+        arrival order. Each request has the deadline of the action issuing it. The
+        requests of low-value actions are shed when the queue backs up.
+
+        :param max_inflight: the maximum number of in-flight requests per endpoint, None for no limit
+        :param max_inflight_per_model: the maximum number of in-flight requests per model, {model: limit}
+        :param deadlines: the deadline in seconds of the requests of each action, {action: seconds}, "default" for the others
+        :param shed_actions: the actions whose requests are shed when the queue backs up
+        :param shed_queue_length: the number of waiting requests above which the requests of shed_actions are shed
+        """
+        self.max_inflight = max_inflight
+        self.max_inflight_per_model = (
+            max_inflight_per_model if max_inflight_per_model is not None else {}
+        )
+        self.deadlines = deadlines if deadlines is not None else {}
+        self.shed_actions = set(shed_actions) if shed_actions is not None else set()
+        self.shed_queue_length = shed_queue_length
+
+        self.__cond = threading.Condition()
+        self.__inflight_endpoint = Counter()
+        self.__inflight_model = Counter()
+        self.__waiting = []
+        self.__seq = itertools.count()
+        self.__local = threading.local()
+        self.shed = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the scheduler from the simulation configuration.
+
+        :param config: the configuration dictionary
+        :return: the LLMScheduler object, None if no limit is configured
+        """
+        servers = config["servers"]
+        simulation = config["simulation"]
+        keys = ["llm_max_inflight", "llm_max_inflight_per_model"]
+        skeys = ["llm_deadlines", "llm_shed_actions"]
+        if all(servers.get(k) is None for k in keys) and all(
+            simulation.get(k) is None for k in skeys
+        ):
+            return None
+
+        return cls(
+            max_inflight=(
+                int(servers["llm_max_inflight"])
+                if servers.get("llm_max_inflight") is not None
+                else None
+            ),
+            max_inflight_per_model=servers.get("llm_max_inflight_per_model"),
+            deadlines=simulation.get("llm_deadlines"),
+            shed_actions=simulation.get("llm_shed_actions"),
+            shed_queue_length=int(simulation.get("llm_shed_queue_length", 0)),
+        )
+
+    @contextmanager
+    def action(self, name):
+        """
+        Set the action issuing the LLM requests of the current thread.
+
+        :param name: the action name (e.g., "READ", "COMMENT")
+        """
+        previous = getattr(self.__local, "action", None)
+        self.__local.action = name
+        try:
+            yield
+        finally:
+            self.__local.action = previous
+
+    def current_action(self):
+        """
+        Get the action issuing the LLM requests of the current thread.
+
+        :return: the action name, None if not set
+        """
+        return getattr(self.__local, "action", None)
+
+    def waiting(self):
+        """
+        Get the number of waiting requests.
+
+        :return: the number of waiting requests
+        """
+        with self.__cond:
+            return len(self.__waiting)
+
+    def __has_capacity(self, endpoint, model):
+        """
+        Check whether a request can be sent to an endpoint and model.
+
+        :param endpoint: the endpoint url
+        :param model: the model name
+        :return: True if both the endpoint and the model are below their limits
+        """
+        if (
+            self.max_inflight is not None
+            and self.__inflight_endpoint[endpoint] >= self.max_inflight
+        ):
+            return False
+        limit = self.max_inflight_per_model.get(model)
+        if limit is not None and self.__inflight_model[model] >= int(limit):
+            return False
+        return True
+
+    def __can_run(self, ticket):
+        """
+        Check whether a waiting request can be admitted: its endpoint and model have
+        capacity and no request that comes before it could use that capacity instead.
+
+        :param ticket: the (priority, seq, endpoint, model) ticket of the request
+        :return: True if the request can be admitted
+        """
+        if not self.__has_capacity(ticket[2], ticket[3]):
+            return False
+        for other in self.__waiting:
+            if other[:2] < ticket[:2] and self.__has_capacity(other[2], other[3]):
+                return False
+        return True
+
+    @contextmanager
+    def slot(self, endpoint, model, priority=GENERATION):
+        """
+        Wait for an in-flight slot for a request, and hold it.
+
+        :param endpoint: the endpoint url
+        :param model: the model name
+        :param priority: the request priority, DECISION, GENERATION or BACKGROUND
+        :return: the time left before the deadline in seconds, None if there is no deadline
+        """
+        action = self.current_action()
+        seconds = self.deadlines.get(action, self.deadlines.get("default"))
+        deadline = time.monotonic() + float(seconds) if seconds is not None else None
+
+        with self.__cond:
+            if (
+                action in self.shed_actions
+                and len(self.__waiting) > self.shed_queue_length
+            ):
+                self.shed += 1
+                raise LLMRequestShed(f"LLM request of {action} shed")
+
+            ticket = (priority, next(self.__seq), endpoint, model)
+            self.__waiting.append(ticket)
+            try:
+                while not self.__can_run(ticket):
+                    remaining = (
+                        deadline - time.monotonic() if deadline is not None else None
+                    )
+                    if remaining is not None and remaining <= 0:
+                        self.shed += 1
+                        raise LLMRequestShed(f"LLM request of {action} missed its deadline")
+                    self.__cond.wait(remaining)
+            finally:
+                self.__waiting.remove(ticket)
+                # the requests behind a leaving one may now be admitted
+                self.__cond.notify_all()
+
+            self.__inflight_endpoint[endpoint] += 1
+            self.__inflight_model[model] += 1
+
+        try:
+            yield deadline - time.monotonic() if deadline is not None else None
+        finally:
+            with self.__cond:
+                self.__inflight_endpoint[endpoint] -= 1
+                self.__inflight_model[model] -= 1
+                self.__cond.notify_all()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler(config):
+    """
+    Get the LLM scheduler shared by all the LLM endpoints of the simulation.
+
+    :param config: the configuration dictionary, used to set up the scheduler on first use
+    :return: the LLMScheduler object, None if no limit is configured
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler.from_config(config)
+        return _scheduler
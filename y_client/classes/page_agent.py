@@ -1,8 +1,7 @@
 from y_client.classes.base_agent import Agent
 from y_client.news_feeds.client_modals import Websites, session
 from y_client.news_feeds.feed_reader import NewsFeed
-from requests import post
-from autogen import AssistantAgent
+from y_client.classes.prompt_templates import compile_template
 import json
 import re
 
@@ -25,7 +24,8 @@ class PageAgent(Agent):
         # a page can only post news
         news, website = self.select_news()
         if not isinstance(news, str):
-            self.news(tid=tid, article=news, website=website)
+            with self.llm.action("NEWS"):
+                self.news(tid=tid, article=news, website=website)
 
         return
 
@@ -63,35 +63,20 @@ class PageAgent(Agent):
         :param website: the website
         """
 
-        u1 = AssistantAgent(
-            name=f"{self.name}",
-            llm_config=self.llm_config,
+        post_text, topic_eval = self.llm.converse(
+            self.name,
             system_message=self.__effify(self.prompts["page_roleplay"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2 = AssistantAgent(
-            name=f"Handler",
-            llm_config=self.llm_config,
-            system_message=self.__effify(self.prompts["handler_instructions_topics"]),
-            max_consecutive_auto_reply=1,
-        )
-
-        u2.initiate_chat(
-            u1,
+            handler_message=self.__effify(self.prompts["handler_instructions_topics"]),
             message=self.__effify(
                 self.prompts["handler_news"], website=website, article=article
             ),
-            silent=True,
-            max_round=1,
+            llm_config=self.__llm_config("handler_news"),
+            handler_llm_config=self.__llm_config("handler_instructions_topics"),
         )
 
-        topic_eval = u2.chat_messages[u1][-1]["content"]
-
         topics = re.findall(r"[#T]: \w+ \w+", topic_eval)
         topics = [x.split(": ")[1] for x in topics if "Topic" not in x]
 
-        post_text = u2.chat_messages[u1][-2]["content"]
         post_text = post_text.replace(f"@{self.name}", "")
 
         hashtags = self.__extract_components(post_text, c_type="hashtags")
@@ -119,13 +104,7 @@ class PageAgent(Agent):
             }
         )
 
-        u1.reset()
-        u2.reset()
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        api_url = f"{self.base_url}/news"
-        res = post(f"{api_url}", headers=headers, data=st)
+        res = self.api.post("news", data=st)
         return res
 
     def __effify(self, non_f_str: str, **kwargs):
@@ -137,7 +116,22 @@ class PageAgent(Agent):
         :return: the effified string
         """
         kwargs["self"] = self
-        return eval(f'f"""{non_f_str}"""', kwargs)
+        return compile_template(non_f_str).render(**kwargs)
+
+    def __llm_config(self, key):
+        """
+        Get the LLM configuration of a prompt, with its generation profile.
+
+        :param key: the prompt name
+        :return: the LLM configuration
+        """
+        profile = self.llm_profiles.get(key)
+        if profile is None:
+            return self.llm_config
+
+        llm_config = dict(self.llm_config)
+        llm_config.update(profile)
+        return llm_config
 
     def __extract_components(self, text, c_type="hashtags"):
         """
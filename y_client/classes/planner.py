@@ -0,0 +1,126 @@
+import random
+import numpy as np
+
+__all__ = ["DayPlanner", "DayPlan"]
+
+
+class DayPlan(object):
+    def __init__(self, agents, offsets, active, rounds, candidates, acts):
+        """
+        The activation schedule and the candidate actions of the agents for a day.
+
+        The activations of slot s are active[offsets[s]:offsets[s + 1]] (indexes of
+        agents, in the order of their turns); activation i has rounds[i] rounds,
+        whose candidate actions are candidates[i, r] (indexes of acts).
+
+        :param agents: the agents of the day
+        :param offsets: the offsets of the activations of each slot
+        :param active: the agent index of each activation
+        :param rounds: the number of rounds of each activation
+        :param candidates: the two candidate actions of each round of each activation
+        :param acts: the available actions
+        """
+        self.agents = agents
+        self.offsets = offsets
+        self.active = active
+        self.rounds = rounds
+        self.candidates = candidates
+        self.acts = acts
+
+        # the candidate actions of a round, by pair of actions
+        self.__pairs = (
+            candidates[:, :, 0].astype(np.int32) * len(acts) + candidates[:, :, 1]
+        )
+        self.__table = [(a, b, "NONE") for a in acts for b in acts]
+
+    def size(self, slot):
+        """
+        Get the number of activations of a slot.
+
+        :param slot: the slot of the day
+        :return: the number of activations
+        """
+        return int(self.offsets[slot + 1] - self.offsets[slot])
+
+    def turns(self, slot, start=0, n=None):
+        """
+        Get the turns of the activations of a slot.
+
+        :param slot: the slot of the day
+        :param start: the first activation of the slot
+        :param n: the maximum number of turns, None for all
+        :return: list of (agent, rounds) turns, rounds being the candidate actions of each round
+        """
+        first = int(self.offsets[slot])
+        last = int(self.offsets[slot + 1])
+        if n is not None:
+            last = min(last, first + start + n)
+
+        table = self.__table
+        agents = self.agents
+        turns = []
+        # the agents shuffle their candidate actions: each round gets its own list
+        for i, rounds, pairs in zip(
+            self.active[first + start : last].tolist(),
+            self.rounds[first + start : last].tolist(),
+            self.__pairs[first + start : last].tolist(),
+        ):
+            turns.append((agents[i], [list(table[c]) for c in pairs[:rounds]]))
+        return turns
+
+
+class DayPlanner(object):
+    def __init__(self, activity_model, actions_likelihood, seed=None):
+        """
+        Planner of the agents' activity: draws the activation schedule of a whole day
+        (by the activity model) and the candidate actions of every round of every
+        activation (two actions by their likelihood, plus NONE) at once.
+
+        :param activity_model: the activity model
+        :param actions_likelihood: the likelihood of each action
+        :param seed: the random seed, None to draw it from the random module
+        """
+        self.activity = activity_model
+        self.acts = [a for a, v in actions_likelihood.items() if v > 0]
+        weights = np.array([actions_likelihood[a] for a in self.acts], dtype=float)
+        self.weights = weights / weights.sum()
+
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.rng = np.random.default_rng(seed)
+
+    def plan(self, agents, hours, first=0):
+        """
+        Draw the plan of a day.
+
+        :param agents: the agents of the day
+        :param hours: the hour of each slot of the day
+        :param first: the first slot to plan, the previous ones have no activations (e.g., the rest of a day whose agents changed)
+        :return: the DayPlan object
+        """
+        n = len(agents)
+        active = [
+            self.activity.active(n, hour, self.rng)
+            if s >= first
+            else np.zeros(0, dtype=np.int32)
+            for s, hour in enumerate(hours)
+        ]
+
+        offsets = np.zeros(len(hours) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(a) for a in active])
+        active = (
+            np.concatenate(active).astype(np.int32)
+            if len(active) > 0
+            else np.zeros(0, dtype=np.int32)
+        )
+
+        round_actions = np.fromiter(
+            (agent.round_actions for agent in agents), dtype=np.int16, count=n
+        )
+        rounds = round_actions[active]
+        max_rounds = int(rounds.max()) if len(rounds) > 0 else 0
+        candidates = self.rng.choice(
+            len(self.acts), size=(len(active), max_rounds, 2), p=self.weights
+        ).astype(np.uint8)
+
+        return DayPlan(agents, offsets, active, rounds, candidates, self.acts)
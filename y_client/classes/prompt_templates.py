@@ -0,0 +1,242 @@
+import ast
+import json
+from functools import lru_cache
+
+__all__ = [
+    "PromptTemplate",
+    "compile_template",
+    "load_prompts",
+    "validate_prompts",
+    "require_prompts",
+]
+
+
+# string methods that can be called inside a template placeholder
+SAFE_METHODS = {
+    "join",
+    "lower",
+    "upper",
+    "title",
+    "capitalize",
+    "strip",
+    "lstrip",
+    "rstrip",
+    "replace",
+    "split",
+}
+
+# attributes of the agent (self) that a template can read: its public profile
+AGENT_ATTRIBUTES = {
+    "name",
+    "age",
+    "gender",
+    "nationality",
+    "language",
+    "education_level",
+    "leaning",
+    "toxicity",
+    "oe",
+    "co",
+    "ex",
+    "ag",
+    "ne",
+    "interests",
+    "emotions",
+    "type",
+    "user_type",
+    "round_actions",
+    "attention_window",
+    "is_page",
+    "joined_on",
+    "owner",
+    "feed_url",
+}
+
+# attributes and items never rendered into a prompt sent to an LLM endpoint
+CREDENTIALS = {
+    "pwd",
+    "password",
+    "email",
+    "api_key",
+    "authkey",
+    "token",
+    "secret",
+    "api",
+    "llm",
+    "llm_config",
+    "llm_v_config",
+    "config",
+}
+
+SAFE_NODES = (
+    ast.Expression,
+    ast.JoinedStr,
+    ast.FormattedValue,
+    ast.Constant,
+    ast.Name,
+    ast.Attribute,
+    ast.Subscript,
+    ast.Call,
+    ast.Load,
+    ast.Slice,
+    ast.Tuple,
+    ast.List,
+)
+
+
+class PromptTemplate(object):
+    def __init__(self, template, name=None):
+        """
+        A prompt template, parsed, validated and compiled once.
+
+        Templates follow the f-string syntax of prompts.json (e.g., "{self.name}",
+        "{','.join(interests)}", "{article['title']}"). Placeholders may only read
+        variables, public attributes, items and call a few string methods; of the
+        agent (self) only the profile attributes can be read, and credentials
+        (e.g., pwd, api_key) never: anything else is rejected when the template
+        is compiled.
+
+        :param template: the template string
+        :param name: the template name, used in error messages
+        """
+        self.template = template
+        self.name = name
+
+        try:
+            tree = ast.parse(f'f"""{template}"""', mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid prompt template {self.__label()}: {e.msg}")
+
+        self.__validate(tree)
+        self.variables = {
+            node.id for node in ast.walk(tree) if isinstance(node, ast.Name)
+        }
+        self.code = compile(tree, f"<prompt {self.__label()}>", "eval")
+
+    def __label(self):
+        """
+        Get the template label for error messages.
+
+        :return: the template label
+        """
+        return self.name if self.name is not None else repr(self.template[:40])
+
+    def __validate(self, tree):
+        """
+        Check that the template placeholders only use the allowed expressions.
+
+        :param tree: the parsed template
+        """
+        for node in ast.walk(tree):
+            if not isinstance(node, SAFE_NODES):
+                raise ValueError(
+                    f"Invalid prompt template {self.__label()}: {type(node).__name__} not allowed"
+                )
+            if isinstance(node, ast.Name) and node.id.startswith("_"):
+                raise ValueError(
+                    f"Invalid prompt template {self.__label()}: name {node.id} not allowed"
+                )
+            if isinstance(node, ast.Attribute) and (
+                node.attr.startswith("_")
+                or node.attr in CREDENTIALS
+                or (
+                    isinstance(node.value, ast.Name)
+                    and node.value.id == "self"
+                    and node.attr not in AGENT_ATTRIBUTES
+                )
+            ):
+                raise ValueError(
+                    f"Invalid prompt template {self.__label()}: attribute {node.attr} not allowed"
+                )
+            if (
+                isinstance(node, ast.Subscript)
+                and isinstance(node.slice, ast.Constant)
+                and node.slice.value in CREDENTIALS
+            ):
+                raise ValueError(
+                    f"Invalid prompt template {self.__label()}: item {node.slice.value} not allowed"
+                )
+            if isinstance(node, ast.Call):
+                if (
+                    not isinstance(node.func, ast.Attribute)
+                    or node.func.attr not in SAFE_METHODS
+                ):
+                    raise ValueError(
+                        f"Invalid prompt template {self.__label()}: only string methods can be called"
+                    )
+                if len(node.keywords) > 0:
+                    raise ValueError(
+                        f"Invalid prompt template {self.__label()}: keyword arguments not allowed"
+                    )
+
+    def render(self, /, **kwargs):
+        """
+        Render the template.
+
+        :param kwargs: the template variables (e.g., self=agent, interests=[...])
+        :return: the rendered string
+        """
+        return eval(self.code, {"__builtins__": {}}, kwargs)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template):
+    """
+    Get the compiled template of a string, compiling it on first use.
+
+    :param template: the template string
+    :return: the PromptTemplate object
+    """
+    return PromptTemplate(template)
+
+
+def validate_prompts(prompts):
+    """
+    Parse and compile all the templates of a prompts dictionary.
+
+    :param prompts: the prompts dictionary
+    :return: the prompts dictionary
+    """
+    for name, template in prompts.items():
+        try:
+            compile_template(template)
+        except ValueError as e:
+            raise ValueError(f"Prompt {name}: {e}")
+    return prompts
+
+
+def require_prompts(prompts, config):
+    """
+    Check that the prompts used by the options of a simulation are defined.
+
+    :param prompts: the prompts dictionary
+    :param config: the configuration dictionary
+    :return: the prompts dictionary
+    """
+    posts = config.get("posts", {})
+    if (
+        posts.get("generation_mode", "two_turn") == "one_shot"
+        and posts.get("emotion_annotator", "llm") == "llm"
+        and "handler_json_emotions" not in prompts
+    ):
+        raise ValueError(
+            'posts.generation_mode "one_shot" requires the handler_json_emotions prompt'
+        )
+    if (
+        config.get("simulation", {}).get("batch_decisions", False)
+        and "handler_decisions" not in prompts
+    ):
+        raise ValueError("simulation.batch_decisions requires the handler_decisions prompt")
+    return prompts
+
+
+def load_prompts(filename):
+    """
+    Load and validate the LLM prompts file.
+
+    :param filename: the prompts file in JSON format
+    :return: the prompts dictionary
+    """
+    with open(filename, "r") as f:
+        prompts = json.load(f)
+    return validate_prompts(prompts)
@@ -0,0 +1,510 @@
+import heapq
+import random
+import itertools
+from y_client.classes.activity import get_activity_model
+from y_client.classes.planner import DayPlanner, DayPlan
+from y_client.classes.checkpoint import encode_array, decode_array
+
+__all__ = ["EventScheduler"]
+
+# event kinds, in their order of execution within a slot
+DAY, REPLY, WAKEUP, FOLLOW, CHURN, GROWTH = range(6)
+
+
+class EventScheduler(object):
+    def __init__(self, client, activity_model=None, checkpoint=None):
+        """
+        Discrete-event scheduler of a simulation: a priority queue of events, ordered
+        by slot and kind, run by the simulation client.
+
+        Events are the planning of each day (the activation schedule and candidate
+        actions of the day, drawn by a DayPlanner), the agents' wake-ups of each slot
+        of the plan, the mention replies (when simulation.reply_delay is set,
+        otherwise agents reply during their turn), and the daily follow evaluation,
+        churn and growth at the last slot of each day. The wake-ups (and replies) of
+        a slot are run together by client.run_turns, then the clock moves to the
+        slot of the next event: slots without events are not processed.
+
+        :param client: the simulation client
+        :param activity_model: the activity model, None for simulation.activity_model
+        :param checkpoint: the Checkpoint object, None for no checkpoints
+        """
+        self.client = client
+        self.activity = (
+            activity_model
+            if activity_model is not None
+            else get_activity_model(client.config)
+        )
+        self.slots = int(client.slots)
+        self.days = int(client.days)
+        self.horizon = self.days * self.slots
+
+        # slots between the wake-up of an agent and its replies to mentions (None: during the turn)
+        self.reply_delay = client.config["simulation"].get("reply_delay")
+        if self.reply_delay is not None:
+            self.reply_delay = max(0, int(self.reply_delay))
+
+        # random seed of the day plans (None: drawn from the random module)
+        self.planner = DayPlanner(
+            self.activity,
+            client.actions_likelihood,
+            seed=client.config["simulation"].get("seed"),
+        )
+        self.plan = None
+        self.checkpoint = checkpoint
+        # the parts of the events completed before the interruption of a resumed simulation, by (slot, kind)
+        self.journal = {}
+
+        self.queue = []
+        self.__seq = itertools.count()
+
+        # slot of the clock, from the start of the simulation
+        self.now = 0
+        self.tid, _, self.start_hour = client.sim_clock.get_current_slot()
+        self.events = 0
+        self.daily_active = {}
+        self.removed = set()
+        self.total_users = len(client.agents.agents)
+
+        if self.days > 0:
+            self.push(0, DAY)
+
+    def hour(self, t):
+        """
+        Get the hour of a slot.
+
+        :param t: the slot, from the start of the simulation
+        :return: the hour of the day
+        """
+        return (self.start_hour + t) % 24
+
+    @property
+    def day(self):
+        """
+        The day of the next event, from the start of the simulation.
+        """
+        if len(self.queue) == 0:
+            return self.days
+        return self.queue[0][0] // self.slots
+
+    @property
+    def done(self):
+        """
+        Whether all the events of the simulation were run.
+        """
+        return len(self.queue) == 0
+
+    def push(self, t, kind, agent=None, data=None):
+        """
+        Schedule an event.
+
+        :param t: the slot of the event, from the start of the simulation
+        :param kind: the event kind
+        :param agent: the agent of the event
+        :param data: the event data
+        """
+        heapq.heappush(self.queue, (t, kind, next(self.__seq), agent, data))
+
+    def push_day_end(self, day):
+        """
+        Schedule the follow evaluation, churn and growth at the end of a day.
+
+        :param day: the day, from the start of the simulation
+        """
+        t = (day + 1) * self.slots - 1
+        for kind in (FOLLOW, CHURN, GROWTH):
+            self.push(t, kind)
+
+    def run(self, n=None, until=None):
+        """
+        Run the next events.
+
+        :param n: the maximum number of events, None for no limit
+        :param until: run the events before this slot, None for no limit
+        :return: the number of events run
+        """
+        count = 0
+        while len(self.queue) > 0 and (n is None or count < n):
+            t, kind = self.queue[0][0], self.queue[0][1]
+            if until is not None and t >= until:
+                break
+
+            batch = [heapq.heappop(self.queue)]
+            # the replies of a slot are run together
+            if kind == REPLY:
+                while (
+                    len(self.queue) > 0
+                    and self.queue[0][:2] == (t, kind)
+                    and (n is None or count + len(batch) < n)
+                ):
+                    batch.append(heapq.heappop(self.queue))
+
+            self.advance(t)
+            count += self.handle(t, kind, batch, None if n is None else n - count)
+
+            # checkpoints are taken between slots
+            if (
+                self.checkpoint is not None
+                and (len(self.queue) == 0 or self.queue[0][0] > t)
+                and self.checkpoint.due(t)
+            ):
+                self.checkpoint.save(self.client, self, t)
+
+        # the clock ends on the slot after the simulation
+        if len(self.queue) == 0:
+            self.advance(self.horizon)
+        self.events += count
+        return count
+
+    def run_slot(self):
+        """
+        Run the events of the next slot with events.
+
+        :return: the number of events run
+        """
+        if len(self.queue) == 0:
+            return 0
+        return self.run(until=self.queue[0][0] + 1)
+
+    def run_day(self):
+        """
+        Run the events of the day of the next event, up to its growth.
+
+        :return: the number of events run
+        """
+        if len(self.queue) == 0:
+            return 0
+        return self.run(until=(self.day + 1) * self.slots)
+
+    def state(self):
+        """
+        Get the state of the scheduler, for a checkpoint.
+
+        :return: the state
+        """
+        plan = None
+        if self.plan is not None:
+            plan = {
+                "agents": [agent.name for agent in self.plan.agents],
+                "offsets": encode_array(self.plan.offsets),
+                "active": encode_array(self.plan.active),
+                "rounds": encode_array(self.plan.rounds),
+                "candidates": encode_array(self.plan.candidates),
+                "acts": self.plan.acts,
+            }
+
+        return {
+            "now": self.now,
+            "tid": self.tid,
+            "start_hour": self.start_hour,
+            "events": self.events,
+            "daily_active": list(self.daily_active),
+            "removed": list(self.removed),
+            "total_users": self.total_users,
+            "queue": [
+                [t, kind, agent.name if agent is not None else None, data]
+                for t, kind, _, agent, data in sorted(self.queue)
+            ],
+            "plan": plan,
+            "rng": self.planner.rng.bit_generator.state,
+            "checkpoint": self.checkpoint.last if self.checkpoint is not None else 0,
+        }
+
+    def restore(self, state):
+        """
+        Restore the state of the scheduler from a checkpoint.
+
+        The events of the slots the server clock moved past the checkpoint were run
+        before the interruption: they are not run again, but the churn and growth
+        recorded in the journal are applied to the agents. Of the slot in progress
+        at the interruption, only the parts not recorded in the journal are run.
+
+        :param state: the state, from the state method (with the journal entries)
+        """
+        agents = {agent.name: agent for agent in self.client.agents.agents}
+
+        self.tid, _, _ = self.client.sim_clock.get_current_slot()
+        self.now = state["now"] + max(0, self.tid - state["tid"])
+        self.start_hour = state["start_hour"]
+        self.events = state["events"]
+        self.daily_active = dict.fromkeys(state["daily_active"])
+        self.removed = set(state["removed"])
+        self.total_users = state["total_users"]
+        self.planner.rng.bit_generator.state = state["rng"]
+        if self.checkpoint is not None:
+            self.checkpoint.last = state["checkpoint"]
+
+        self.queue = []
+        for t, kind, name, data in state["queue"]:
+            if name is not None and name not in agents:
+                continue
+            self.push(
+                t,
+                kind,
+                agents[name] if name is not None else None,
+                tuple(data) if data is not None else None,
+            )
+
+        self.journal = {}
+        for entry in state.get("journal", []):
+            t, kind, key = entry
+            if t <= state["now"]:
+                continue
+            self.journal.setdefault((t, kind), []).append(key)
+            # recorded again in the journal of the resumed simulation
+            self.record(t, kind, key)
+
+        self.plan = None
+        plan = state["plan"]
+        if plan is not None:
+            self.plan = DayPlan(
+                [agents[name] for name in plan["agents"]],
+                decode_array(plan["offsets"]),
+                decode_array(plan["active"]),
+                decode_array(plan["rounds"]),
+                decode_array(plan["candidates"]),
+                plan["acts"],
+            )
+
+    def record(self, t, kind, key):
+        """
+        Record a completed part of an event in the journal of the checkpoint.
+
+        :param t: the slot of the event
+        :param kind: the event kind
+        :param key: the completed part (e.g., the index of a wake-up in its slot)
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.record([t, kind, key])
+
+    def recorder(self, t, kind, keys):
+        """
+        Get the function recording the completed turns of an event, for run_turns.
+
+        :param t: the slot of the event
+        :param kind: the event kind
+        :param keys: the key of each turn
+        :return: the function, None without checkpoints
+        """
+        if self.checkpoint is None:
+            return None
+        return lambda i: self.record(t, kind, keys[i])
+
+    def __agents_changed(self):
+        """
+        Check whether agents were added or removed since the plan of the day.
+
+        :return: True if the agents of the client are not those of the plan
+        """
+        agents, planned = self.client.agents.agents, self.plan.agents
+        return len(agents) != len(planned) or set(map(id, agents)) != set(
+            map(id, planned)
+        )
+
+    def replan(self, t, s):
+        """
+        Plan the rest of the day again, on the current agents: the agents added
+        during the day (e.g., by the client between two run_slot calls) wake up
+        from this slot on, those removed take no more turns.
+
+        :param t: the first replanned slot, from the start of the simulation
+        :param s: the slot of the day of t
+        """
+        start = t - s
+        self.plan = self.planner.plan(
+            list(self.client.agents.agents),
+            [self.hour(start + x) for x in range(self.slots)],
+            first=s,
+        )
+
+        # the wake-ups of the next slots follow the new plan
+        self.queue = [
+            e
+            for e in self.queue
+            if e[1] != WAKEUP or not t < e[0] < start + self.slots
+        ]
+        heapq.heapify(self.queue)
+        for x in range(s + 1, self.slots):
+            if self.plan.size(x) > 0:
+                self.push(start + x, WAKEUP, data=(x, 0))
+
+    def advance(self, t):
+        """
+        Move the clock to a slot.
+
+        :param t: the slot, from the start of the simulation
+        """
+        clock = self.client.sim_clock
+        while self.now < t:
+            clock.increment_slot()
+            self.now += 1
+            self.tid = clock.id
+
+    def handle(self, t, kind, batch, n=None):
+        """
+        Run a batch of events of the same slot and kind.
+
+        :param t: the slot of the events
+        :param kind: the event kind
+        :param batch: the events
+        :param n: the maximum number of wake-ups to run, None for no limit
+        :return: the number of events run
+        """
+        client = self.client
+
+        if kind == DAY:
+            # plan the day on the agents at its start (churn and growth are at its end)
+            day = t // self.slots
+            self.plan = self.planner.plan(
+                list(client.agents.agents),
+                [self.hour(t + s) for s in range(self.slots)],
+            )
+            for s in range(self.slots):
+                if self.plan.size(s) > 0:
+                    self.push(t + s, WAKEUP, data=(s, 0))
+            self.push_day_end(day)
+
+        elif kind == WAKEUP:
+            s, start = batch[0][4]
+            if start == 0 and t >= self.now and self.__agents_changed():
+                self.replan(t, s)
+            turns = self.plan.turns(s, start, n)
+            # the rest of the slot is left for the next run
+            if start + len(turns) < self.plan.size(s):
+                self.push(t, WAKEUP, data=(s, start + len(turns)))
+
+            for agent, _ in turns:
+                self.daily_active[agent.name] = None
+
+            # the wake-ups run before the interruption of a resumed simulation are skipped
+            if t < self.now:
+                keys = []
+            else:
+                completed = set(self.journal.get((t, WAKEUP), []))
+                keys = [
+                    start + i for i in range(len(turns)) if start + i not in completed
+                ]
+            client.run_turns(
+                [turns[i - start] for i in keys],
+                self.tid,
+                reply=self.reply_delay is None,
+                done=self.recorder(t, WAKEUP, keys),
+            )
+
+            if self.reply_delay is not None:
+                for agent, _ in turns:
+                    if (
+                        agent not in client.pages
+                        and t + self.reply_delay < self.horizon
+                    ):
+                        self.push(t + self.reply_delay, REPLY, agent)
+            return len(turns)
+
+        elif kind == REPLY:
+            turns = {}
+            completed = set(self.journal.get((t, REPLY), []))
+            for _, _, _, agent, _ in batch:
+                if (
+                    agent.name not in self.removed
+                    and agent.name not in completed
+                    and t >= self.now
+                ):
+                    turns[agent.name] = (agent, [])
+            client.run_turns(
+                list(turns.values()),
+                self.tid,
+                done=self.recorder(t, REPLY, list(turns)),
+            )
+
+        elif kind == FOLLOW:
+            # evaluate following (once per day, only for a random sample of daily active agents)
+            completed = self.journal.get((t, FOLLOW))
+            if completed is not None:
+                # the sample drawn before the interruption, then its completed turns
+                sample, completed = set(completed[0]), set(completed[1:])
+                da = [
+                    agent
+                    for agent in client.agents.agents
+                    if agent.name in sample and agent.name not in completed
+                ]
+            elif t < self.now:
+                da = []
+            else:
+                da = [
+                    agent
+                    for agent in client.agents.agents
+                    if agent.name in self.daily_active
+                    and agent not in client.pages
+                    and random.random()
+                    < float(client.config["agents"]["probability_of_daily_follow"])
+                ]
+                self.record(t, FOLLOW, [agent.name for agent in da])
+
+            print("\n\nEvaluating new friendship ties")
+            client.run_turns(
+                [(agent, [["FOLLOW", "NONE"]]) for agent in da],
+                self.tid,
+                reply=False,
+                done=self.recorder(t, FOLLOW, [agent.name for agent in da]),
+            )
+
+        elif kind == CHURN:
+            self.total_users = len(client.agents.agents)
+            before = set(agent.name for agent in client.agents.agents)
+
+            # daily churn (of a resumed simulation: the agents that left before the interruption)
+            completed = self.journal.get((t, CHURN))
+            if completed is not None:
+                client.remove_agents(completed[0])
+            elif t >= self.now:
+                client.churn(self.tid)
+            removed = before - set(agent.name for agent in client.agents.agents)
+            self.removed |= removed
+            self.record(t, CHURN, sorted(removed))
+
+        elif kind == GROWTH:
+            before = set(agent.name for agent in client.agents.agents)
+
+            # daily new agents (of a resumed simulation: those added before the interruption)
+            completed = self.journal.get((t, GROWTH))
+            if completed is not None:
+                for name, email in completed[0]:
+                    client.load_agent(name, email)
+            elif t >= self.now and client.percentage_new_agents_iteration > 0:
+                for _ in range(
+                    max(
+                        1,
+                        int(
+                            len(self.daily_active)
+                            * client.percentage_new_agents_iteration
+                        ),
+                    )
+                ):
+                    client.add_agent()
+            self.record(
+                t,
+                GROWTH,
+                [
+                    [agent.name, agent.email]
+                    for agent in client.agents.agents
+                    if agent.name not in before
+                ],
+            )
+
+            # saving "living" agents at the end of the day
+            if (
+                client.percentage_removed_agents_iteration != 0
+                or client.percentage_removed_agents_iteration != 0
+            ):
+                client.save_agents()
+
+            print(
+                f"\n\nTotal Users: {self.total_users}\nActive users: {len(self.daily_active)}\nUsers at the end of the day: {len(client.agents.agents)}\n"
+            )
+
+            self.daily_active = {}
+            self.plan = None
+            if t + 1 < self.horizon:
+                self.push(t + 1, DAY)
+
+        return len(batch)
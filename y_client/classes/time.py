@@ -1,23 +1,21 @@
 import json
-from requests import get, post
+from y_client.classes.api_client import get_api_client
 
 __all__ = ["SimulationSlot"]
 
 
 class SimulationSlot(object):
-    def __init__(self, config):
+    def __init__(self, config, api=None):
         """
         Initialize the SimulationSlot object.
 
         :param config: the configuration dictionary
+        :param api: the (shared) YServer API client
         """
         self.base_url = config["servers"]["api"]
+        self.api = api if api is not None else get_api_client(self.base_url, config)
 
-        api_url = f"{self.base_url}current_time"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        response = get(f"{api_url}", headers=headers)
+        response = self.api.get("current_time")
         data = json.loads(response.__dict__["_content"].decode("utf-8"))
 
         self.day = data["day"]
@@ -31,11 +29,7 @@ class SimulationSlot(object):
         :return: the current slot, day and id
         """
 
-        api_url = f"{self.base_url}current_time"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        response = get(f"{api_url}", headers=headers)
+        response = self.api.get("current_time")
         data = json.loads(response.__dict__["_content"].decode("utf-8"))
 
         self.day = data["day"]
@@ -48,10 +42,6 @@ class SimulationSlot(object):
         """
         Update the current slot.
         """
-        api_url = f"{self.base_url}update_time"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
         if self.slot < 23:
             slot = self.slot + 1
             day = self.day
@@ -64,7 +54,7 @@ class SimulationSlot(object):
         if day >= day_c or slot > slot_c:
             params = {"day": day, "round": slot}
             st = json.dumps(params)
-            response = post(f"{api_url}", headers=headers, data=st)
+            response = self.api.post("update_time", data=st)
             data = json.loads(response.__dict__["_content"].decode("utf-8"))
 
             self.day = int(data["day"])
@@ -0,0 +1,324 @@
+import os
+import time
+import socket
+import queue
+import tempfile
+import itertools
+import threading
+import traceback
+from multiprocessing.managers import BaseManager, DictProxy
+from y_client.classes.agent_shards import AgentRunner
+
+__all__ = ["WorkQueue", "QueueWorker"]
+
+
+class _QueueClient(BaseManager):
+    pass
+
+
+_QueueClient.register("units")
+_QueueClient.register("results")
+_QueueClient.register("workers")
+_QueueClient.register("pending", proxytype=DictProxy)
+_QueueClient.register("setup", proxytype=DictProxy)
+
+
+def parse_address(address):
+    """
+    Parse a "host:port" address.
+
+    :param address: the address
+    :return: the (host, port) pair
+    """
+    host, _, port = str(address).rpartition(":")
+    return host, int(port)
+
+
+class WorkQueue(object):
+    def __init__(
+        self,
+        host,
+        port,
+        authkey,
+        config_filename,
+        prompts_filename,
+        content_recsys=None,
+        follow_recsys=None,
+        unit_timeout=None,
+    ):
+        """
+        Coordinator side of the distributed simulation: the agents' turns of a slot
+        are published as work units on a TCP queue, pulled by QueueWorker processes
+        (y_worker.py) running on any host, which report their completion.
+
+        The workers get the configuration, the prompts and the recommender systems
+        from the queue, so they only need the address and the authentication key.
+        The simulation client keeps the clock, churn, new agents and the slot
+        barrier: run returns when every unit of the slot is completed. Units not
+        completed within unit_timeout seconds without progress (e.g., their worker
+        was lost) are published again. The workers skip the units completed
+        meanwhile, but a unit still running on a slow (not lost) worker may run
+        twice: its turn is then run twice, its completion counted once.
+
+        The queue accepts any worker with the authentication key: bind it to a
+        public interface only on a trusted network.
+
+        :param host: the listening host
+        :param port: the listening port
+        :param authkey: the authentication key of the workers
+        :param config_filename: the configuration file of the simulation
+        :param prompts_filename: the LLM prompts file of the simulation
+        :param content_recsys: the content recommendation system
+        :param follow_recsys: the follower recommendation system
+        :param unit_timeout: the seconds without completed units before publishing the pending ones again, None to wait forever
+        """
+        self.unit_timeout = float(unit_timeout) if unit_timeout is not None else None
+        self.units = queue.Queue()
+        self.results = queue.Queue()
+        # ("start" | "stop", worker id) notices of the workers
+        self.workers = queue.Queue()
+        # the published units not completed yet, by id
+        self.pending = {}
+        self.setup = {
+            "config": open(config_filename, "r").read(),
+            "prompts": open(prompts_filename, "r").read(),
+            "content_recsys": content_recsys,
+            "follow_recsys": follow_recsys,
+        }
+        self.__ids = itertools.count()
+
+        class _QueueServer(BaseManager):
+            pass
+
+        _QueueServer.register("units", callable=lambda: self.units)
+        _QueueServer.register("results", callable=lambda: self.results)
+        _QueueServer.register("workers", callable=lambda: self.workers)
+        _QueueServer.register("pending", callable=lambda: self.pending, proxytype=DictProxy)
+        _QueueServer.register("setup", callable=lambda: self.setup, proxytype=DictProxy)
+
+        if isinstance(authkey, str):
+            authkey = authkey.encode("utf-8")
+        self.server = _QueueServer(address=(host, int(port)), authkey=authkey).get_server()
+        self.__thread = None
+
+    @property
+    def address(self):
+        """
+        The (host, port) address of the queue.
+        """
+        return self.server.address
+
+    def start(self):
+        """
+        Serve the queue to the workers in a background thread.
+
+        :return: the WorkQueue object
+        """
+        self.__thread = threading.Thread(target=self.__serve, daemon=True)
+        self.__thread.start()
+        return self
+
+    def __serve(self):
+        """
+        Serve the queue until close.
+        """
+        try:
+            self.server.serve_forever()
+        except SystemExit:
+            # the manager server exits once stopped
+            pass
+
+    def run(self, turns, tid):
+        """
+        Publish the turns of a slot and wait for their completion.
+
+        :param turns: list of (agent, rounds, reply) turns
+        :param tid: the round id
+        :return: generator of the index of the turn of each completed unit
+        """
+        pending = self.pending
+        index = {}
+        for i, (agent, rounds, reply) in enumerate(turns):
+            uid = next(self.__ids)
+            index[uid] = i
+            pending[uid] = (
+                uid,
+                tid,
+                [(agent.name, agent.email, bool(agent.is_page), rounds, reply)],
+            )
+            self.units.put(pending[uid])
+
+        progress = time.monotonic()
+        while len(pending) > 0:
+            try:
+                uid, n, error = self.results.get(timeout=1)
+            except queue.Empty:
+                if (
+                    self.unit_timeout is not None
+                    and time.monotonic() - progress > self.unit_timeout
+                ):
+                    for unit in list(pending.values()):
+                        self.units.put(unit)
+                    progress = time.monotonic()
+                continue
+
+            # completions of units published twice are counted once
+            if uid not in pending:
+                continue
+            if error is not None:
+                raise Exception(f"Agent turn failed on a worker:\n{error}")
+            del pending[uid]
+            progress = time.monotonic()
+            yield index[uid]
+
+    def close(self, timeout=30):
+        """
+        Stop the workers and the queue, once every started worker acknowledged the
+        stop marker (or after timeout seconds, e.g. for workers lost meanwhile).
+
+        :param timeout: the maximum seconds waiting for the workers
+        """
+        # the workers pass the stop marker on to each other
+        self.units.put(None)
+
+        running = set()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                notice, worker = self.workers.get(timeout=0.1)
+            except queue.Empty:
+                if len(running) == 0 or time.monotonic() > deadline:
+                    break
+                continue
+            if notice == "start":
+                running.add(worker)
+            else:
+                running.discard(worker)
+
+        self.server.stop_event.set()
+        self.server.listener.close()
+
+
+class QueueWorker(object):
+    def __init__(self, host, port, authkey, threads=None, retry=60):
+        """
+        Worker side of the distributed simulation: pulls the work units of a
+        WorkQueue and runs the agents' turns.
+
+        The worker holds no simulation state but a cache of the agents it already
+        loaded from the server. Run it from a client directory (the news database
+        is read from experiments/, as with y_client.py).
+
+        :param host: the host of the queue
+        :param port: the port of the queue
+        :param authkey: the authentication key of the queue
+        :param threads: the number of units run concurrently, None for simulation.concurrency
+        :param retry: the seconds spent trying to connect to the queue
+        """
+        if isinstance(authkey, str):
+            authkey = authkey.encode("utf-8")
+        self.address = (host, int(port))
+        self.authkey = authkey
+        self.threads = threads
+        self.retry = retry
+        self.completed = 0
+        self.__stop = threading.Event()
+
+    def __connect(self):
+        """
+        Connect to the queue, waiting for the coordinator to start.
+
+        :return: the connected manager
+        """
+        deadline = time.monotonic() + self.retry
+        while True:
+            manager = _QueueClient(address=self.address, authkey=self.authkey)
+            try:
+                manager.connect()
+                return manager
+            except (ConnectionError, OSError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(1)
+
+    def __pull(self, runner):
+        """
+        Pull and run units until the stop marker or the loss of the queue.
+
+        :param runner: the AgentRunner object
+        """
+        manager = self.__connect()
+        units, results = manager.units(), manager.results()
+        pending = manager.pending()
+        try:
+            while not self.__stop.is_set():
+                try:
+                    unit = units.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if unit is None:
+                    units.put(None)
+                    break
+
+                uid, tid, turns = unit
+                # a unit published again may have been completed meanwhile
+                if uid not in pending:
+                    continue
+                try:
+                    n = runner.run(tid, turns)
+                    results.put((uid, n, None))
+                    self.completed += n
+                except Exception:
+                    results.put((uid, 0, traceback.format_exc()))
+        except (EOFError, ConnectionError, OSError):
+            # the coordinator is gone
+            pass
+        finally:
+            self.__stop.set()
+
+    def run(self):
+        """
+        Run units until the coordinator stops.
+        """
+        manager = self.__connect()
+        setup = manager.setup().copy()
+        workers = manager.workers()
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        workers.put(("start", worker))
+
+        workdir = tempfile.mkdtemp(prefix="yworker-")
+        config_filename = os.path.join(workdir, "config.json")
+        prompts_filename = os.path.join(workdir, "prompts.json")
+        with open(config_filename, "w") as f:
+            f.write(setup["config"])
+        with open(prompts_filename, "w") as f:
+            f.write(setup["prompts"])
+
+        runner = AgentRunner(
+            config_filename,
+            prompts_filename,
+            content_recsys=setup["content_recsys"],
+            follow_recsys=setup["follow_recsys"],
+        )
+        threads = (
+            self.threads if self.threads is not None else runner.client.concurrency
+        )
+
+        pullers = [
+            threading.Thread(target=self.__pull, args=(runner,), daemon=True)
+            for _ in range(max(1, int(threads)))
+        ]
+        for t in pullers:
+            t.start()
+        for t in pullers:
+            t.join()
+
+        # the coordinator waits for the acknowledgement of the stop marker
+        try:
+            workers.put(("stop", worker))
+        except (EOFError, ConnectionError, OSError):
+            pass
+
+        if runner.client.executor is not None:
+            runner.client.executor.shutdown(wait=True)
+        runner.client.api.close()
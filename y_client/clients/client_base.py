@@ -3,11 +3,31 @@ import tqdm
 import sys
 import os
 import networkx as nx
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 
-from y_client import Agent, Agents, SimulationSlot
+from y_client import Agent, PageAgent, Agents, SimulationSlot
+from y_client.classes.api_client import get_api_client
+from y_client.classes.prompt_templates import load_prompts, require_prompts
+from y_client.classes.llm_scheduler import LLMRequestShed, get_llm_scheduler
+from y_client.classes.llm_router import get_llm_router
+from y_client.classes.annotator import get_annotator
+from y_client.classes.image_descriptions import get_image_description_cache
+from y_client.classes.image_fetcher import get_image_fetcher
+from y_client.classes.image_preannotator import ImagePreAnnotator
+from y_client.classes.agent_shards import ShardPool
+from y_client.classes.work_queue import WorkQueue, parse_address
+from y_client.classes.activity import get_activity_model
+from y_client.classes.scheduler import EventScheduler
+from y_client.classes.checkpoint import (
+    Checkpoint,
+    read_checkpoint,
+    read_journal,
+    decode_array,
+)
 from y_client.recsys import *
 from y_client.utils import generate_user
 from y_client.news_feeds import Feeds, session, Websites, Articles, Images
@@ -36,8 +56,11 @@ class YClientBase(object):
         if prompts_filename is None:
             raise Exception("Prompts file not found")
 
-        self.prompts = json.load(open(prompts_filename, "r"))
+        self.prompts = load_prompts(prompts_filename)
         self.config = json.load(open(config_filename, "r"))
+        require_prompts(self.prompts, self.config)
+        self.config_filename = config_filename
+        self.prompts_filename = prompts_filename
         self.agents_owner = owner
         self.agents_filename = agents_filename
         self.agents_output = agents_output
@@ -70,13 +93,49 @@ class YClientBase(object):
         # posts' parameters
         self.visibility_rd = self.config["posts"]["visibility_rounds"]
 
+        # number of agents of a slot run concurrently (1: sequential execution)
+        self.concurrency = max(1, int(self.config["simulation"].get("concurrency", 1)))
+        self.executor = None
+
+        # number of worker processes running the agents' turns, partitioned in shards (1: in process)
+        self.processes = max(1, int(self.config["simulation"].get("processes", 1)))
+        self.shards = None
+
+        # coordinator queue of the remote workers running the agents' turns (None: local execution)
+        self.coordinator = self.config["simulation"].get("coordinator")
+        if self.coordinator is not None and not self.coordinator.get("authkey"):
+            raise ValueError("simulation.coordinator requires an authkey")
+        self.work_queue = None
+
+        # when the agents' fire-and-forget writes are flushed: "none" (sent immediately), "turn" or "slot"
+        self.write_behind = self.config["simulation"].get("write_behind", "none")
+
+        # background annotation of the news images (0 workers: images are annotated when selected)
+        self.image_preannotation_workers = int(
+            self.config["simulation"].get("image_preannotation_workers", 0)
+        )
+        self.image_preannotator = None
+
+        # pooled YServer API client shared by the clock, the agents and the recsys
+        self.api = get_api_client(self.config["servers"]["api"], self.config)
+
         # initialize simulation clock
-        self.sim_clock = SimulationSlot(self.config)
+        self.sim_clock = SimulationSlot(self.config, api=self.api)
 
         self.agents = Agents()
         self.feed = Feeds()
         self.content_recsys = None
         self.follow_recsys = None
+        self.activity_model = get_activity_model(self.config)
+        self.scheduler = None
+
+        # periodic checkpoint of the simulation (None: no checkpoints), every checkpoint_slots slots
+        self.checkpoint_file = self.config["simulation"].get("checkpoint")
+        self.checkpoint_slots = int(
+            self.config["simulation"].get("checkpoint_slots", self.slots)
+        )
+        # scheduler state of the checkpoint to resume from
+        self.checkpoint_state = None
 
         if graph_file is not None:
             self.g = nx.read_edgelist(graph_file, delimiter=",", nodetype=int)
@@ -102,11 +161,7 @@ class YClientBase(object):
         Reset the experiment
         Delete all agents and reset the server database
         """
-        api_url = f"{self.config['servers']['api']}reset"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        post(f"{api_url}", headers=headers)
+        self.api.post("reset")
 
     def load_rrs_endpoints(self, filename):
         """
@@ -152,6 +207,8 @@ class YClientBase(object):
                     total_stats["total_articles"] += articles_found
                     total_stats["successful_feeds"] += 1
 
+            self.start_image_annotation()
+
             print("\n====== RSS Feed Processing Summary ======")
             print(f"Total feeds processed: {total_stats['total_feeds']}")
             print(f"Successful feeds: {total_stats['successful_feeds']}")
@@ -196,6 +253,7 @@ class YClientBase(object):
             from y_client.news_feeds.url_reader import URLReader
             url_reader = URLReader(urls)
             stats = url_reader.process_urls()
+            self.start_image_annotation()
             # Ask user if they want to continue
             if stats['processed'] == 0:
                 print("\nWARNING: No articles were successfully processed from URLs!")
@@ -211,17 +269,47 @@ class YClientBase(object):
             response = input("\nError loading URLs. Continue anyway? (y/n): ")
             return response.lower() == 'y'
 
-    def set_interests(self):
+    def start_image_annotation(self):
         """
-        Set the interests of the agents
+        Start describing the news images still without a description in the background,
+        if simulation.image_preannotation_workers is greater than 0
         """
-        api_url = f"{self.config['servers']['api']}set_interests"
+        if self.image_preannotation_workers <= 0:
+            return
+
+        if self.image_preannotator is None:
+            servers = self.config["servers"]
+            llm_v_config = {
+                "url": servers["llm_v"],
+                "api_key": servers["llm_v_api_key"] if (servers["llm_v_api_key"] is not None and servers["llm_v_api_key"] != "") else "NULL",
+                "model": self.config["agents"]["llm_v_agent"],
+                "temperature": servers["llm_v_temperature"],
+                "max_tokens": servers["llm_v_max_tokens"]
+            }
+            annotator = get_annotator(
+                llm_v_config,
+                scheduler=get_llm_scheduler(self.config),
+                router=get_llm_router(self.config, servers["llm_v"]),
+                cache=get_image_description_cache(self.config),
+                fetcher=get_image_fetcher(self.config),
+            )
+            self.image_preannotator = ImagePreAnnotator(
+                annotator,
+                workers=self.image_preannotation_workers,
+                batch_size=int(
+                    self.config["simulation"].get("image_preannotation_batch", 20)
+                ),
+            )
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        self.image_preannotator.start()
 
+    def set_interests(self):
+        """
+        Set the interests of the agents
+        """
         data = self.config["agents"]["interests"]
 
-        post(f"{api_url}", headers=headers, data=json.dumps(data))
+        self.api.post("set_interests", data=json.dumps(data))
 
     def set_recsys(self, c_recsys, f_recsys):
         """
@@ -241,7 +329,9 @@ class YClientBase(object):
         """
         if agent is None:
             try:
-                agent = generate_user(self.config, owner=self.agents_owner)
+                agent = generate_user(
+                    self.config, owner=self.agents_owner, api=self.api
+                )
 
                 if agent is None:
                     return
@@ -277,6 +367,8 @@ class YClientBase(object):
                     except Exception:
                         pass
 
+                self.api.flush()
+
         else:
             ags = json.load(open(self.agents_filename))
             for data in ags:
@@ -285,6 +377,7 @@ class YClientBase(object):
                     email=data["email"],
                     config=self.config,
                     load=True,
+                    api=self.api,
                 )
 
                 agent.set_prompts(self.prompts)
@@ -306,15 +399,28 @@ class YClientBase(object):
 
         for a in agents["agents"]:
             try:
-                ag = Agent(
-                    name=a["name"], email=a["email"], load=True, config=self.config
-                )
-                ag.set_prompts(self.prompts)
-                ag.set_rec_sys(self.content_recsys, self.follow_recsys)
-                self.agents.add_agent(ag)
+                self.load_agent(a["name"], a["email"])
             except Exception:
                 print(f"Error loading agent: {a['name']}")
 
+    def load_agent(self, name, email):
+        """
+        Load an agent registered on the server and add it to the simulation
+
+        :param name: the name of the agent
+        :param email: the email of the agent
+        """
+        ag = Agent(
+            name=name,
+            email=email,
+            load=True,
+            config=self.config,
+            api=self.api,
+        )
+        ag.set_prompts(self.prompts)
+        ag.set_rec_sys(self.content_recsys, self.follow_recsys)
+        self.agents.add_agent(ag)
+
     def churn(self, tid):
         """
         Evaluate churn
@@ -330,105 +436,257 @@ class YClientBase(object):
             )
             st = json.dumps({"n_users": n_users, "left_on": tid})
 
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-            api_url = f"{self.config['servers']['api']}/churn"
-            response = post(f"{api_url}", headers=headers, data=st)
+            response = self.api.post("churn", data=st)
 
             data = json.loads(response.__dict__["_content"].decode("utf-8"))["removed"]
 
+            if self.shards is not None:
+                self.shards.remove(
+                    [a.name for a in self.agents.agents if a.user_id in data]
+                )
             self.agents.remove_agent_by_ids(data)
 
-    def run_simulation(self):
+    def remove_agents(self, names):
         """
-        Run the simulation
+        Remove agents that left the server from the simulation
+
+        :param names: the names of the agents
         """
+        names = set(names)
+        if self.shards is not None:
+            self.shards.remove(list(names))
+        self.agents.agents[:] = [a for a in self.agents.agents if a.name not in names]
 
-        for day in tqdm.tqdm(range(self.days)):
-            print(f"\n\nDay {day} of simulation\n")
-            daily_active = {}
-            tid, _, _ = self.sim_clock.get_current_slot()
+    def agent_turn(self, agent, tid, rounds, reply=True):
+        """
+        Run the turn of an agent in the current slot
+
+        :param agent: the agent
+        :param tid: the round id
+        :param rounds: the candidate actions of each round (no rounds: reply only)
+        :param reply: whether to reply to received mentions before each action
+        """
+        # the agent reads its own deferred writes
+        self.api.bind(agent.user_id)
+        try:
+            self.__turn(agent, tid, rounds, reply)
+        finally:
+            self.api.bind(None)
+
+        if self.write_behind == "turn":
+            self.api.flush(agent.user_id)
 
-            for _ in tqdm.tqdm(range(self.slots)):
-                tid, _, h = self.sim_clock.get_current_slot()
+    def __turn(self, agent, tid, rounds, reply):
+        """
+        Run the actions of the turn of an agent.
+
+        :param agent: the agent
+        :param tid: the round id
+        :param rounds: the candidate actions of each round (no rounds: reply only)
+        :param reply: whether to reply to received mentions before each action
+        """
+        if len(rounds) == 0 and reply and agent not in self.pages:
+            try:
+                agent.reply(tid=tid)
+            except LLMRequestShed:
+                pass
 
-                # get expected active users for this time slot (at least 1)
-                expected_active_users = max(
-                    int(len(self.agents.agents) * self.hourly_activity[str(h)]), 1
+        for candidates in rounds:
+            try:
+                # reply to received mentions
+                if reply and agent not in self.pages:
+                    agent.reply(tid=tid)
+
+                # select action to be performed
+                agent.select_action(
+                    tid=tid,
+                    actions=candidates,
+                    max_length_thread_reading=self.max_length_thread_reading,
                 )
+            except LLMRequestShed:
+                # the LLM scheduler dropped the action (queue backed up or deadline missed)
+                continue
+
+    def run_turns(self, turns, tid, reply=True, done=None):
+        """
+        Run the turns of a set of agents and wait for all of them to complete.
+        Turns are run concurrently when simulation.concurrency is greater than 1,
+        and by the shard worker processes when simulation.processes is greater than 1.
+        With a simulation.coordinator, turns are run by the remote workers.
+
+        :param turns: list of (agent, rounds) pairs
+        :param tid: the round id
+        :param reply: whether to reply to received mentions before each action
+        :param done: function called with the index of each completed turn (with processes, once the turns of its shard completed)
+        """
+        if done is None:
+            done = lambda i: None
+
+        if self.work_queue is not None:
+            units = self.work_queue.run(
+                [
+                    (agent, rounds, reply and agent not in self.pages)
+                    for agent, rounds in turns
+                ],
+                tid,
+            )
+            for i in tqdm.tqdm(units, total=len(turns)):
+                done(i)
+        elif self.shards is not None:
+            futures = self.shards.submit(
+                [
+                    (agent, rounds, reply and agent not in self.pages)
+                    for agent, rounds in turns
+                ],
+                tid,
+            )
+            for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                future.result()
+                for i in futures[future]:
+                    done(i)
+        elif self.executor is None:
+            for i, (agent, rounds) in enumerate(tqdm.tqdm(turns)):
+                self.agent_turn(agent, tid, rounds, reply=reply)
+                done(i)
+        else:
+            futures = {
+                self.executor.submit(self.agent_turn, agent, tid, rounds, reply): i
+                for i, (agent, rounds) in enumerate(turns)
+            }
+            for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                # propagate the agents' errors as in the sequential execution
+                future.result()
+                done(futures[future])
+
+        # send the writes still queued before moving past the barrier
+        self.api.flush()
 
-                sagents = random.sample(self.agents.agents, expected_active_users)
-
-                # available actions
-                acts = [a for a, v in self.actions_likelihood.items() if v > 0]
-
-                # shuffle agents
-                random.shuffle(sagents)
-                for g in tqdm.tqdm(sagents):
-                    daily_active[g.name] = None
-
-                    for _ in range(g.round_actions):
-                        # sample two elements from a list with replacement
-                        candidates = random.choices(
-                            acts,
-                            k=2,
-                            weights=[self.actions_likelihood[a] for a in acts],
-                        )
-                        candidates.append("NONE")
-
-                        # reply to received mentions
-                        if g not in self.pages:
-                            g.reply(tid=tid)
-
-                        # select action to be performed
-                        g.select_action(
-                            tid=tid,
-                            actions=candidates,
-                            max_length_thread_reading=self.max_length_thread_reading,
-                        )
-                # increment slot
-                self.sim_clock.increment_slot()
-
-            # evaluate following (once per day, only for a random sample of daily active agents)
-            da = [
-                agent
-                for agent in self.agents.agents
-                if agent.name in daily_active
-                and agent not in self.pages
-                and random.random()
-                < float(self.config["agents"]["probability_of_daily_follow"])
-            ]
-
-            print("\n\nEvaluating new friendship ties")
-            for agent in tqdm.tqdm(da):
-                if agent not in self.pages:
-                    agent.select_action(tid=tid, actions=["FOLLOW", "NONE"])
-
-            total_users = len(self.agents.agents)
-
-            # daily churn
-            self.churn(tid)
-
-            # daily new agents
-            if self.percentage_new_agents_iteration > 0:
-                for _ in range(
-                    max(
-                        1,
-                        int(
-                            len(daily_active)
-                            * self.percentage_new_agents_iteration
-                        ),
-                    )
-                ):
-                    self.add_agent()
-
-            # saving "living" agents at the end of the day
-            if (
-                self.percentage_removed_agents_iteration != 0
-                or self.percentage_removed_agents_iteration != 0
-            ):
-                self.save_agents()
-
-            print(
-                f"\n\nTotal Users: {total_users}\nActive users: {len(daily_active)}\nUsers at the end of the day: {len(self.agents.agents)}\n"
+    def resume(self, filename):
+        """
+        Restore the agents and the state of a simulation from a checkpoint, without
+        registering or fetching the agents from the server
+
+        :param filename: the checkpoint file
+        """
+        state = read_checkpoint(filename)
+        pages = set(state["pages"])
+
+        for data in state["agents"]:
+            cls = PageAgent if data["name"] in pages else Agent
+            # the server is updated only for the recommender systems that changed
+            agent = cls(
+                name=data["name"],
+                email=data["email"],
+                load=True,
+                config=self.config,
+                api=self.api,
+                state=data,
+                feed_url=data["feed_url"],
+                recsys=(
+                    self.content_recsys
+                    if getattr(self.content_recsys, "name", None) == data["rec_sys"]
+                    else None
+                ),
+                frecsys=(
+                    self.follow_recsys
+                    if getattr(self.follow_recsys, "name", None) == data["frec_sys"]
+                    else None
+                ),
             )
+            agent.set_prompts(self.prompts)
+            agent.set_rec_sys(self.content_recsys, self.follow_recsys)
+            self.agents.add_agent(agent)
+            if data["name"] in pages:
+                self.pages.append(agent)
+
+        # the random generators are restored last (creating agents draws numbers)
+        version, internal, gauss = state["random"]
+        random.setstate((version, tuple(internal), gauss))
+        numpy_state = state["numpy"]
+        numpy_state["state"]["key"] = decode_array(numpy_state["state"]["key"])
+        np.random.set_state(numpy_state)
+
+        # with the parts of the events completed after the checkpoint
+        self.checkpoint_state = dict(state["scheduler"], journal=read_journal(filename))
+
+    def set_activity_model(self, activity_model):
+        """
+        Set the activity model of the agents
+
+        :param activity_model: the activity model
+        """
+        self.activity_model = activity_model
+
+    def start_simulation(self):
+        """
+        Start the simulation: set up the execution of the agents' turns and the event scheduler.
+
+        :return: the EventScheduler object, whose run, run_slot and run_day methods run the simulation
+        """
+        if self.coordinator is not None:
+            host, port = parse_address(self.coordinator.get("address", "127.0.0.1:5050"))
+            self.work_queue = WorkQueue(
+                host,
+                port,
+                self.coordinator["authkey"],
+                self.config_filename,
+                self.prompts_filename,
+                content_recsys=self.content_recsys,
+                follow_recsys=self.follow_recsys,
+                unit_timeout=self.coordinator.get("unit_timeout"),
+            ).start()
+        elif self.processes > 1:
+            self.shards = ShardPool(
+                self.config_filename,
+                self.prompts_filename,
+                self.processes,
+                content_recsys=self.content_recsys,
+                follow_recsys=self.follow_recsys,
+            )
+        elif self.concurrency > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        checkpoint = None
+        if self.checkpoint_file is not None:
+            checkpoint = Checkpoint(self.checkpoint_file, every=self.checkpoint_slots)
+
+        self.scheduler = EventScheduler(self, self.activity_model, checkpoint=checkpoint)
+        if self.checkpoint_state is not None:
+            self.scheduler.restore(self.checkpoint_state)
+            self.checkpoint_state = None
+        return self.scheduler
+
+    def stop_simulation(self):
+        """
+        Stop the simulation: release the executors and workers of the agents' turns.
+        """
+        if self.scheduler is not None and self.scheduler.checkpoint is not None:
+            self.scheduler.checkpoint.wait()
+        self.scheduler = None
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
+
+        if self.work_queue is not None:
+            self.work_queue.close()
+            self.work_queue = None
+
+        if self.image_preannotator is not None:
+            self.image_preannotator.stop()
+
+    def run_simulation(self):
+        """
+        Run the simulation
+        """
+        scheduler = self.start_simulation()
+
+        for day in tqdm.tqdm(range(scheduler.day, self.days)):
+            print(f"\n\nDay {day} of simulation\n")
+            scheduler.run_day()
+
+        self.stop_simulation()
@@ -4,7 +4,6 @@ import os
 import shutil
 from sqlalchemy.ext.declarative import declarative_base
 import sqlalchemy as db
-from requests import post
 from sqlalchemy import orm
 
 
@@ -42,7 +41,11 @@ class YClientWeb(object):
         self.base_path = data_base_path
         self.config = config_file
 
-        self.prompts = json.load(open(f"{data_base_path}prompts.json", "r"))
+        from y_client.classes.prompt_templates import load_prompts, require_prompts
+
+        self.prompts = require_prompts(
+            load_prompts(f"{data_base_path}prompts.json"), self.config
+        )
 
         self.agents_owner = owner
         self.agents_filename = agents_filename
@@ -89,7 +92,8 @@ class YClientWeb(object):
 
         engine = db.create_engine(f"sqlite:////{BASE_DIR}experiments/{self.config['simulation']['name']}.db")
         base.metadata.bind = engine
-        session = orm.scoped_session(orm.sessionmaker())(bind=engine)
+        # thread-local sessions: the agents of a slot may run concurrently
+        session = orm.scoped_session(orm.sessionmaker(bind=engine))
 
         globals()["session"] = session
         globals()["engine"] = engine
@@ -100,10 +104,14 @@ class YClientWeb(object):
         sys.path.append(f'{yclient_path}{os.sep}external{os.sep}YClient/')
 
         from y_client.classes import Agent, Agents, SimulationSlot
+        from y_client.classes.api_client import get_api_client
         from y_client.news_feeds import Feeds
 
+        # pooled YServer API client shared by the clock, the agents and the recsys
+        self.api = get_api_client(self.config["servers"]["api"], self.config)
+
         # initialize simulation clock
-        self.sim_clock = SimulationSlot(self.config)
+        self.sim_clock = SimulationSlot(self.config, api=self.api)
 
         self.agents = Agents()
         self.feed = Feeds()
@@ -157,6 +165,7 @@ class YClientWeb(object):
                     config=self.config,
                     load=not self.first_run,
                     web=True,
+                    api=self.api,
                     prompt=ag["prompts"],
                 )
 
@@ -198,7 +207,8 @@ class YClientWeb(object):
                     recsys=content_recsys,
                     frecsys=follow_recsys,
                     is_page=1,
-                    web=True
+                    web=True,
+                    api=self.api,
                 )
 
                 page.set_prompts(self.prompts)
@@ -214,13 +224,9 @@ class YClientWeb(object):
         """
         Set the interests of the agents
         """
-        api_url = f"{self.config['servers']['api']}set_interests"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
         data = self.config["agents"]["interests"]
 
-        post(f"{api_url}", headers=headers, data=json.dumps(data))
+        self.api.post("set_interests", data=json.dumps(data))
 
     def set_recsys(self, c_recsys, f_recsys):
         """
@@ -252,14 +258,14 @@ class YClientWeb(object):
             try:
                 if a["is_page"] == 0:
                     ag = Agent(
-                        name=a["name"], email=a["email"], load=True, config=self.config, web=True
+                        name=a["name"], email=a["email"], load=True, config=self.config, web=True, api=self.api
                     )
                     ag.set_prompts(self.prompts)
                     ag.set_rec_sys(self.content_recsys, self.follow_recsys)
                     self.agents.add_agent(ag)
                 else:
                     ag = PageAgent(
-                        a["name"], email=a["email"], load=True, config=self.config, web=True
+                        a["name"], email=a["email"], load=True, config=self.config, web=True, api=self.api
                     )
                     ag.set_prompts(self.prompts)
                     ag.set_rec_sys(self.content_recsys, self.follow_recsys)
@@ -283,10 +289,7 @@ class YClientWeb(object):
             )
             st = json.dumps({"n_users": n_users, "left_on": tid})
 
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-            api_url = f"{self.config['servers']['api']}/churn"
-            response = post(f"{api_url}", headers=headers, data=st)
+            response = self.api.post("churn", data=st)
 
             data = json.loads(response.__dict__["_content"].decode("utf-8"))["removed"]
 
@@ -302,7 +305,9 @@ class YClientWeb(object):
 
         if agent is None:
             try:
-                agent = generate_user(self.config, owner=self.agents_owner)
+                agent = generate_user(
+                    self.config, owner=self.agents_owner, api=self.api
+                )
 
                 if agent is None:
                     return
@@ -327,31 +332,25 @@ class YClientWeb(object):
 
         if self.first_run and self.network is not None:  # self.run
             with open(f"{self.base_path}{self.network}", "r") as f:
-                headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
                 for l in f:
                     l = l.strip().split(",")
 
                     # from username to id on the server
                     if l[0] not in users_id_map:
-                        api_url = f"{self.config['servers']['api']}get_user_id"
                         data = {
                             "username": l[0],
                         }
-                        uid = post(f"{api_url}", headers=headers, data=json.dumps(data))
+                        uid = self.api.post("get_user_id", data=json.dumps(data))
 
                         users_id_map[l[0]] = json.loads(uid.__dict__["_content"].decode("utf-8"))["id"]
 
                     if l[1] not in users_id_map:
-                        api_url = f"{self.config['servers']['api']}get_user_id"
                         data = {
                             "username": l[1],
                         }
-                        uid = post(f"{api_url}", headers=headers, data=json.dumps(data))
+                        uid = self.api.post("get_user_id", data=json.dumps(data))
                         users_id_map[l[1]] = json.loads(uid.__dict__["_content"].decode("utf-8"))["id"]
 
-                    api_url = f"{self.config['servers']['api']}follow"
-
                     data = {
                         "user_id": users_id_map[l[0]],
                         "target": users_id_map[l[1]],
@@ -359,4 +358,4 @@ class YClientWeb(object):
                         "tid": 0,  # first round
                     }
 
-                    post(f"{api_url}", headers=headers, data=json.dumps(data))
\ No newline at end of file
+                    self.api.post("follow", data=json.dumps(data))
\ No newline at end of file
@@ -22,14 +22,22 @@ class YClientWithPages(YClientBase):
             try:
                 if a["is_page"] == 0:
                     ag = Agent(
-                        name=a["name"], email=a["email"], load=True, config=self.config
+                        name=a["name"],
+                        email=a["email"],
+                        load=True,
+                        config=self.config,
+                        api=self.api,
                     )
                     ag.set_prompts(self.prompts)
                     ag.set_rec_sys(self.content_recsys, self.follow_recsys)
                     self.agents.add_agent(ag)
                 else:
                     ag = PageAgent(
-                        a["name"], email=a["email"], load=True, config=self.config
+                        a["name"],
+                        email=a["email"],
+                        load=True,
+                        config=self.config,
+                        api=self.api,
                     )
                     ag.set_prompts(self.prompts)
                     ag.set_rec_sys(self.content_recsys, self.follow_recsys)
@@ -46,7 +54,11 @@ class YClientWithPages(YClientBase):
         """
         if agent is None:
             agent = generate_page(
-                self.config, name=name, feed_url=feed_url, owner=self.agents_owner
+                self.config,
+                name=name,
+                feed_url=feed_url,
+                owner=self.agents_owner,
+                api=self.api,
             )
             if agent is None:
                 return
@@ -57,13 +69,16 @@ class YClientWithPages(YClientBase):
 
         self.pages.append(agent)
 
-    def run_simulation(self):
+    def start_simulation(self):
         """
-        Run the simulation
+        Start the simulation, with the page agents
+
+        :return: the EventScheduler object
         """
-        # add the page agents
-        print("\nAdding page agents\n")
-        for feed in tqdm.tqdm(self.feed.get_feeds()):
-            self.add_page_agent(name=feed.name, feed_url=feed.feed_url)
+        # add the page agents (restored with the checkpoint when resuming)
+        if self.checkpoint_state is None:
+            print("\nAdding page agents\n")
+            for feed in tqdm.tqdm(self.feed.get_feeds()):
+                self.add_page_agent(name=feed.name, feed_url=feed.feed_url)
 
-        super().run_simulation()
+        return super().start_simulation()
@@ -22,7 +22,8 @@ try:
     base = declarative_base()
     engine = db.create_engine(f"sqlite:///experiments/{config['simulation']['name']}.db")
     base.metadata.bind = engine
-    session = orm.scoped_session(orm.sessionmaker())(bind=engine)
+    # thread-local sessions: the agents of a slot may run concurrently
+    session = orm.scoped_session(orm.sessionmaker(bind=engine))
 except:
     from y_client.clients.client_web import base, session
     pass
@@ -1,5 +1,5 @@
 import json
-from requests import post
+from y_client.classes.api_client import get_api_client
 
 
 class ContentRecSys(object):
@@ -25,58 +25,70 @@ class ContentRecSys(object):
         """
         self.params["uid"] = uid
 
-    def read(self, base_url, user_id, articles=False):
+    def read(self, base_url, user_id, articles=False, api=None):
         """
         Read n_posts from the service.
 
         :param base_url: the base url of the service
+        :param user_id: the id of the reading user
         :param articles: whether to return articles or not
+        :param api: the (shared) YServer API client
         :return: the response from the service
         """
-        api_url = f"{base_url}/read"
-
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        if api is None:
+            api = get_api_client(base_url)
 
+        # the recsys is shared by all the agents (possibly running concurrently):
+        # build the request on a copy of the parameters
+        params = dict(self.params)
         if articles:
-            self.params["articles"] = True
+            params["articles"] = True
 
-        self.params["uid"] = user_id
+        params["uid"] = user_id
 
-        st = json.dumps(self.params)
+        st = json.dumps(params)
 
-        response = post(f"{api_url}", headers=headers, data=st)
+        response = api.post("read", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
-    def read_mentions(self, base_url):
+    def read_mentions(self, base_url, user_id, api=None):
         """
         Read n_posts from the service.
 
         :param base_url: the base url of the service
+        :param user_id: the id of the reading user
+        :param api: the (shared) YServer API client
         :return: the response from the service
         """
-        api_url = f"{base_url}/read_mentions"
+        if api is None:
+            api = get_api_client(base_url)
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        params = dict(self.params)
+        params["uid"] = user_id
 
-        st = json.dumps(self.params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        st = json.dumps(params)
+        response = api.post("read_mentions", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
-    def search(self, base_url):
+    def search(self, base_url, user_id, api=None):
         """
         Search for a query.
 
         :param base_url: the base url of the service
+        :param user_id: the id of the searching user
+        :param api: the (shared) YServer API client
         :return: the response from the service
         """
-        api_url = f"{base_url}/search"
+        if api is None:
+            api = get_api_client(base_url)
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        params = dict(self.params)
+        params["uid"] = user_id
 
-        st = json.dumps(self.params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        st = json.dumps(params)
+        response = api.post("search", data=st)
 
         return response.__dict__["_content"].decode("utf-8")
 
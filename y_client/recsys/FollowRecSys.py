@@ -1,5 +1,5 @@
 import json
-from requests import post
+from y_client.classes.api_client import get_api_client
 
 
 class FollowRecSys(object):
@@ -26,17 +26,25 @@ class FollowRecSys(object):
         """
         self.params["user_id"] = uid
 
-    def follow_suggestions(self, base_url):
+    def follow_suggestions(self, base_url, user_id, api=None):
         """
         Follow suggestions for a user.
 
         :param base_url: the base url of the service
+        :param user_id: the id of the user
+        :param api: the (shared) YServer API client
         :return: the response from the service
         """
-        api_url = f"{base_url}/follow_suggestions"
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        st = json.dumps(self.params)
-        response = post(f"{api_url}", headers=headers, data=st)
+        if api is None:
+            api = get_api_client(base_url)
+
+        # the recsys is shared by all the agents (possibly running concurrently):
+        # build the request on a copy of the parameters
+        params = dict(self.params)
+        params["user_id"] = user_id
+
+        st = json.dumps(params)
+        response = api.post("follow_suggestions", data=st)
 
         try:
             return response.json()
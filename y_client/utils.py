@@ -8,11 +8,12 @@ except:
     from y_client.classes.page_agent import PageAgent
 
 
-def generate_user(config, owner=None):
+def generate_user(config, owner=None, api=None):
     """
     Generate a fake user
     :param config: configuration dictionary
     :param owner: owner of the user
+    :param api: the (shared) YServer API client
     :return: Agent object
     """
 
@@ -94,6 +95,7 @@ def generate_user(config, owner=None):
         toxicity=toxicity,
         api_key=api_key,
         is_page=0,
+        api=api,
     )
 
     if not hasattr(agent, "user_id"):
@@ -103,12 +105,13 @@ def generate_user(config, owner=None):
     return agent
 
 
-def generate_page(config, owner=None, name=None, feed_url=None):
+def generate_page(config, owner=None, name=None, feed_url=None, api=None):
     """
     Generate a fake page
     :param config: configuration dictionary
     :param name: name of the page
     :param feed_url: feed url of the page
+    :param api: the (shared) YServer API client
     :return: Agent object
     """
 
@@ -154,6 +157,7 @@ def generate_page(config, owner=None, name=None, feed_url=None):
         api_key=api_key,
         feed_url=feed_url,
         is_page=1,
+        api=api,
     )
 
     return page
@@ -0,0 +1,46 @@
+import os, sys
+
+if __name__ == "__main__":
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        "-a",
+        "--address",
+        default="localhost:5050",
+        help="Address (host:port) of the simulation coordinator queue",
+    )
+    parser.add_argument(
+        "-k",
+        "--authkey",
+        required=True,
+        help="Authentication key of the coordinator queue (simulation.coordinator.authkey)",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=None,
+        help="Number of agents' turns run concurrently. Default: simulation.concurrency",
+    )
+    parser.add_argument(
+        "--retry",
+        type=int,
+        default=60,
+        help="Seconds spent waiting for the coordinator to start. Default: 60",
+    )
+
+    args = parser.parse_args()
+
+    from y_client.classes.work_queue import QueueWorker, parse_address
+
+    host, port = parse_address(args.address)
+    worker = QueueWorker(
+        host, port, args.authkey, threads=args.threads, retry=args.retry
+    )
+    worker.run()
+    print(f"Coordinator stopped, {worker.completed} agents' turns run")